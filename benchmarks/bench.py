@@ -0,0 +1,643 @@
+"""
+Copyright 2018 Jason Litzinger
+See LICENSE for details.
+
+Benchmarks for the parse and build hot paths.
+
+Each benchmark reports packets per second, from the fastest of several
+timing runs, bytes per second and the number of memory blocks allocated
+per packet.  Blocks are counted with ``sys.getallocatedblocks()`` around
+single iterations whose results are kept alive, so blocks freed before
+an iteration returns are not counted.
+
+Run all benchmarks::
+
+    python benchmarks/bench.py
+
+Save the results as a baseline, or compare against one::
+
+    python benchmarks/bench.py --backend c --min-time 1 --repeat 10 \
+        --save benchmarks/baseline_c.json
+    python benchmarks/bench.py --backend c --compare benchmarks/baseline_c.json
+
+Baselines for both backends are kept in this directory.  Regenerate
+them when a change intentionally alters performance, so the difference
+shows up in review.  Save them with a longer ``--min-time`` and more
+``--repeat`` runs than the defaults, so the baseline is not itself a
+noisy measurement.
+
+When comparing, the exit status is nonzero if any benchmark is slower
+than the baseline by more than the threshold.
+"""
+from __future__ import absolute_import, division, print_function
+
+import argparse
+import gc
+import json
+import platform
+import random
+import sys
+import timeit
+
+import mqttpacket.v311 as mqttpacket
+from mqttpacket.v311 import _backend
+
+_SEGMENT_SIZE = 1460
+
+BENCHMARKS = []
+
+
+def benchmark(name, packets, nbytes=None):
+    """Register a benchmark.
+
+    The decorated function takes no arguments and returns a callable
+    that performs one iteration and returns its results.
+
+    :param name: The name of the benchmark.
+
+    :param packets: Number of packets handled by one iteration.
+
+    :param nbytes: Number of bytes handled by one iteration, or None
+        to use the size of the packets returned by one iteration.
+    """
+    def _register(func):
+        BENCHMARKS.append((name, packets, nbytes, func))
+        return func
+    return _register
+
+
+def _publish(size, qos=0, topic=u'sensors/building-1/floor-2/room-3'):
+    packet_id = 1 if qos else None
+    return mqttpacket.publish(topic, False, qos, False, b'x' * size, packet_id)
+
+
+def _puback(packet_id):
+    return b'\x40\x02' + bytes(bytearray([packet_id >> 8, packet_id & 0xFF]))
+
+
+def _suback(return_codes):
+    body = b'\x00\x01' + bytes(bytearray(return_codes))
+    return (
+        b'\x90'
+        + mqttpacket.encode_remainining_length(len(body))
+        + body
+    )
+
+
+_SMALL_PUBLISHES = b''.join(_publish(32, qos) for qos in (0, 1) * 500)
+_LARGE_PUBLISHES = b''.join(_publish(65536, 1) for _ in range(16))
+_PUBACKS = b''.join(_puback(i) for i in range(1, 1001))
+_SUBACKS = b''.join(_suback([0, 1, 2, 0x80] * 25) for _ in range(100))
+_MIXED_PACKETS = (
+    [_publish(64, 1)] * 400
+    + [_publish(4096, 0)] * 50
+    + [_publish(65536, 1)] * 2
+    + [_puback(i) for i in range(1, 500)]
+    + [_suback([0, 1])] * 40
+    + [b'\xd0\x00'] * 9
+)
+_MIXED = b''.join(_MIXED_PACKETS)
+
+
+def _parse_all(stream):
+    data = bytearray(stream)
+
+    def _run():
+        output = []
+        mqttpacket.parse(data, output)
+        return output
+    return _run
+
+
+def _decode_segments(stream, **kwargs):
+    segments = [
+        stream[i:i + _SEGMENT_SIZE]
+        for i in range(0, len(stream), _SEGMENT_SIZE)
+    ]
+
+    def _run():
+        decoder = mqttpacket.Decoder(**kwargs)
+        output = []
+        for segment in segments:
+            decoder.feed(segment)
+            output.extend(decoder)
+        return output
+    return _run
+
+
+@benchmark('parse_small_publish_coalesced', 1000, len(_SMALL_PUBLISHES))
+def parse_small_publish_coalesced():
+    return _parse_all(_SMALL_PUBLISHES)
+
+
+def _parse_batch(stream):
+    data = bytearray(stream)
+    batch = mqttpacket.PacketBatch()
+
+    def _run():
+        batch.clear()
+        mqttpacket.parse_batch(data, batch)
+        return data
+    return _run
+
+
+@benchmark('parse_batch_small_publish_coalesced', 1000, len(_SMALL_PUBLISHES))
+def parse_batch_small_publish_coalesced():
+    return _parse_batch(_SMALL_PUBLISHES)
+
+
+@benchmark('parse_large_publish_coalesced', 16, len(_LARGE_PUBLISHES))
+def parse_large_publish_coalesced():
+    return _parse_all(_LARGE_PUBLISHES)
+
+
+@benchmark('parse_puback_storm', 1000, len(_PUBACKS))
+def parse_puback_storm():
+    return _parse_all(_PUBACKS)
+
+
+@benchmark('parse_suback_100_codes', 100, len(_SUBACKS))
+def parse_suback_100_codes():
+    return _parse_all(_SUBACKS)
+
+
+@benchmark('parse_mixed_coalesced', len(_MIXED_PACKETS), len(_MIXED))
+def parse_mixed_coalesced():
+    return _parse_all(_MIXED)
+
+
+@benchmark('callback_parse_mixed_coalesced', len(_MIXED_PACKETS), len(_MIXED))
+def callback_parse_mixed_coalesced():
+    data = bytearray(_MIXED)
+    parser = mqttpacket.CallbackParser()
+    for pkt_type in (
+            mqttpacket.MQTT_PACKET_PUBLISH,
+            mqttpacket.MQTT_PACKET_PUBACK,
+            mqttpacket.MQTT_PACKET_SUBACK,
+            mqttpacket.MQTT_PACKET_DISCONNECT,
+    ):
+        parser.register(pkt_type, lambda *fields: None)
+
+    def _run():
+        parser.parse(data)
+        return data
+    return _run
+
+
+@benchmark('scan_mixed_coalesced', len(_MIXED_PACKETS), len(_MIXED))
+def scan_mixed_coalesced():
+    data = bytearray(_MIXED)
+    return lambda: list(mqttpacket.scan_frames(data))
+
+
+@benchmark('decode_mixed_fragmented', len(_MIXED_PACKETS), len(_MIXED))
+def decode_mixed_fragmented():
+    return _decode_segments(_MIXED)
+
+
+@benchmark('decode_large_publish_fragmented', 16, len(_LARGE_PUBLISHES))
+def decode_large_publish_fragmented():
+    return _decode_segments(_LARGE_PUBLISHES)
+
+
+@benchmark('decode_large_publish_streamed', 16, len(_LARGE_PUBLISHES))
+def decode_large_publish_streamed():
+    return _decode_segments(_LARGE_PUBLISHES, stream_over=4096)
+
+
+_FILTER_COUNT = 100000
+_MATCH_COUNT = 1000
+
+
+def _topic_filters(count):
+    """Generate a mix of exact and wildcard topic filters."""
+    rand = random.Random(0)
+    patterns = (
+        u'site/{}/device/{}/temperature',
+        u'site/{}/device/+/status',
+        u'site/{}/device/{}/#',
+        u'site/+/device/{}/alarm',
+    )
+    filters = []
+    for i in range(count):
+        site = rand.randrange(100)
+        device = rand.randrange(count // 100)
+        pattern = patterns[i % len(patterns)]
+        if pattern.count(u'{}') == 2:
+            filters.append(pattern.format(site, device))
+        elif u'+/device' in pattern:
+            filters.append(pattern.format(device))
+        else:
+            filters.append(pattern.format(site))
+    return filters
+
+
+def _topics(count):
+    rand = random.Random(1)
+    leaves = (u'temperature', u'status', u'alarm', u'humidity')
+    return [
+        u'site/{}/device/{}/{}'.format(
+            rand.randrange(100),
+            rand.randrange(_FILTER_COUNT // 100),
+            leaves[i % len(leaves)],
+        ).encode('utf-8')
+        for i in range(count)
+    ]
+
+
+_MATCH_TOPICS = _topics(_MATCH_COUNT)
+
+
+@benchmark(
+    'match_100k_filters',
+    _MATCH_COUNT,
+    sum(len(topic) for topic in _MATCH_TOPICS),
+)
+def match_100k_filters():
+    return _match_all(mqttpacket.TopicMatcher())
+
+
+@benchmark(
+    'match_100k_filters_cached',
+    _MATCH_COUNT,
+    sum(len(topic) for topic in _MATCH_TOPICS),
+)
+def match_100k_filters_cached():
+    return _match_all(mqttpacket.CachingTopicMatcher())
+
+
+def _match_all(matcher):
+    for subscriber, topicfilter in enumerate(_topic_filters(_FILTER_COUNT)):
+        matcher.add(topicfilter, subscriber)
+    match = matcher.match
+
+    def _run():
+        return [match(topic) for topic in _MATCH_TOPICS]
+    return _run
+
+
+_PAYLOAD = b'x' * 64
+_TOPIC = u'sensors/building-1/floor-2/room-3'
+_INFLIGHT_COUNT = 60000
+_SESSION_COUNT = 1000
+
+
+@benchmark('session_publish_ack_60k_inflight', _SESSION_COUNT)
+def session_publish_ack_60k_inflight():
+    session = mqttpacket.Session()
+    for _ in range(_INFLIGHT_COUNT):
+        session.publish(_TOPIC, _PAYLOAD, qos=1)
+    session.data_to_send()
+    publish = session.publish
+    receive = session.receive
+
+    def _run():
+        packet_ids = [
+            publish(_TOPIC, _PAYLOAD, qos=1) for _ in range(_SESSION_COUNT)
+        ]
+        for packet_id in packet_ids:
+            receive(mqttpacket.PubackPacket(packet_id))
+        return session.data_to_send()
+    return _run
+
+
+_BUILD_COUNT = 1000
+
+
+def _build(func):
+    """Register a benchmark building _BUILD_COUNT packets."""
+    return benchmark('build_' + func.__name__, _BUILD_COUNT)(func)
+
+
+def _build_loop(build):
+    def _run():
+        return [build() for _ in range(_BUILD_COUNT)]
+    return _run
+
+
+@_build
+def connect():
+    spec = mqttpacket.ConnectSpec(
+        username=u'user',
+        password=u'password',
+        will_topic=u'will',
+        will_message=u'gone',
+    )
+    return _build_loop(
+        lambda: mqttpacket.connect(u'client-1', 60, spec)
+    )
+
+
+@_build
+def connect_into():
+    spec = mqttpacket.ConnectSpec(
+        username=u'user',
+        password=u'password',
+        will_topic=u'will',
+        will_message=u'gone',
+    )
+    size = len(mqttpacket.connect(u'client-1', 60, spec))
+    build = mqttpacket.connect_into
+
+    def _run():
+        buf = bytearray(size * _BUILD_COUNT)
+        offset = 0
+        for _ in range(_BUILD_COUNT):
+            offset = build(buf, offset, u'client-1', 60, spec)
+        return buf
+    return _run
+
+
+@_build
+def subscribe():
+    specs = [
+        mqttpacket.SubscriptionSpec(u'sensors/+/temperature', 1),
+        mqttpacket.SubscriptionSpec(u'alerts/#', 2),
+    ]
+    return _build_loop(lambda: mqttpacket.subscribe(10, specs))
+
+
+@_build
+def subscribe_into():
+    specs = [
+        mqttpacket.SubscriptionSpec(u'sensors/+/temperature', 1),
+        mqttpacket.SubscriptionSpec(u'alerts/#', 2),
+    ]
+    size = len(mqttpacket.subscribe(10, specs))
+    build = mqttpacket.subscribe_into
+
+    def _run():
+        buf = bytearray(size * _BUILD_COUNT)
+        offset = 0
+        for _ in range(_BUILD_COUNT):
+            offset = build(buf, offset, 10, specs)
+        return buf
+    return _run
+
+
+@_build
+def unsubscribe():
+    topics = [u'sensors/+/temperature', u'alerts/#']
+    return _build_loop(lambda: mqttpacket.unsubscribe(10, topics))
+
+
+@_build
+def unsubscribe_into():
+    topics = [u'sensors/+/temperature', u'alerts/#']
+    size = len(mqttpacket.unsubscribe(10, topics))
+    build = mqttpacket.unsubscribe_into
+
+    def _run():
+        buf = bytearray(size * _BUILD_COUNT)
+        offset = 0
+        for _ in range(_BUILD_COUNT):
+            offset = build(buf, offset, 10, topics)
+        return buf
+    return _run
+
+
+@_build
+def pingreq():
+    return _build_loop(mqttpacket.pingreq)
+
+
+@_build
+def disconnect():
+    return _build_loop(mqttpacket.disconnect)
+
+
+@_build
+def publish_qos0():
+    return _build_loop(
+        lambda: mqttpacket.publish(_TOPIC, False, 0, False, _PAYLOAD)
+    )
+
+
+@_build
+def publish_qos1():
+    return _build_loop(
+        lambda: mqttpacket.publish(_TOPIC, False, 1, False, _PAYLOAD, 10)
+    )
+
+
+@_build
+def publish_header():
+    return _build_loop(
+        lambda: mqttpacket.publish_header(_TOPIC, False, 1, False, 65536, 10)
+    )
+
+
+@_build
+def publish_into():
+    size = len(mqttpacket.publish(_TOPIC, False, 1, False, _PAYLOAD, 10))
+    publish = mqttpacket.publish_into
+
+    def _run():
+        buf = bytearray(size * _BUILD_COUNT)
+        offset = 0
+        for _ in range(_BUILD_COUNT):
+            offset = publish(buf, offset, _TOPIC, False, 1, False, _PAYLOAD, 10)
+        return buf
+    return _run
+
+
+@_build
+def publish_template():
+    template = mqttpacket.PublishTemplate(_TOPIC, qos=1)
+    return _build_loop(lambda: template.build(_PAYLOAD, 10))
+
+
+@_build
+def publish_many():
+    payloads = [_PAYLOAD] * _BUILD_COUNT
+    packet_ids = list(range(1, _BUILD_COUNT + 1))
+    return lambda: mqttpacket.publish_many(_TOPIC, 1, payloads, packet_ids)
+
+
+@_build
+def puback():
+    return _build_loop(lambda: mqttpacket.puback(10))
+
+
+@_build
+def pubrel():
+    return _build_loop(lambda: mqttpacket.pubrel(10))
+
+
+@_build
+def unsuback():
+    return _build_loop(lambda: mqttpacket.unsuback(10))
+
+
+@_build
+def acks_into():
+    packet_ids = list(range(1, _BUILD_COUNT + 1))
+    pkt_type = mqttpacket.MQTT_PACKET_PUBACK
+
+    def _run():
+        buf = bytearray(4 * _BUILD_COUNT)
+        mqttpacket.acks_into(buf, 0, pkt_type, packet_ids)
+        return buf
+    return _run
+
+
+@_build
+def connack():
+    return _build_loop(lambda: mqttpacket.connack(session_present=True))
+
+
+@_build
+def suback():
+    return_codes = [0, 1, mqttpacket.SUBACK_FAILURE]
+    return _build_loop(lambda: mqttpacket.suback(10, return_codes))
+
+
+@_build
+def pingresp():
+    return _build_loop(mqttpacket.pingresp)
+
+
+_ALLOCATION_CALLS = 5
+
+
+def _blocks_per_packet(run, packets):
+    """Count the memory blocks allocated per packet by one iteration.
+
+    The count is the change in allocated blocks across a call, with the
+    result kept alive until it has been counted.  The garbage collector
+    is disabled so that it cannot free unrelated blocks during a call,
+    and the fewest blocks of several calls is used, so that caches
+    filled by the first call are not counted.
+    """
+    counts = []
+    gc.collect()
+    gc.disable()
+    try:
+        for _ in range(_ALLOCATION_CALLS):
+            before = sys.getallocatedblocks()
+            result = run()
+            counts.append(sys.getallocatedblocks() - before)
+            del result
+    finally:
+        gc.enable()
+    return max(min(counts), 0) / packets
+
+
+def run_benchmark(make_run, packets, nbytes, min_time, repeat):
+    """Time a benchmark.
+
+    Each of repeat runs times at least min_time seconds of iterations,
+    and the fastest run is used.
+
+    :returns: packets per second, bytes per second and blocks per packet.
+    """
+    run = make_run()
+    if nbytes is None:
+        result = run()
+        if isinstance(result, list):
+            nbytes = sum(len(r) for r in result)
+        else:
+            nbytes = len(result)
+    timer = timeit.Timer(run)
+    number, elapsed = timer.autorange()
+    while elapsed < min_time:
+        number *= 2
+        elapsed = timer.timeit(number)
+    best = min([elapsed] + timer.repeat(repeat - 1, number)) / number
+    return {
+        'packets_per_sec': packets / best,
+        'bytes_per_sec': nbytes / best,
+        'blocks_per_packet': _blocks_per_packet(run, packets),
+    }
+
+
+def _format_rate(rate):
+    for unit in ('', 'K', 'M', 'G'):
+        if rate < 1000:
+            return '{:7.2f}{}'.format(rate, unit)
+        rate /= 1000
+    return '{:7.2f}T'.format(rate)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--backend', choices=_backend.available())
+    parser.add_argument('--filter', default='',
+                        help='Only run benchmarks containing this text.')
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help='Minimum seconds of each timing run.')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='Number of timing runs, of which the fastest '
+                        'is used.')
+    parser.add_argument('--save', help='Save results to this file.')
+    parser.add_argument('--compare', help='Compare with a saved baseline.')
+    parser.add_argument('--threshold', type=float, default=0.15,
+                        help='Allowed slowdown relative to the baseline.')
+    args = parser.parse_args(argv)
+
+    if args.backend:
+        _backend.set_backend(args.backend)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+
+    print('backend: {}  python: {}'.format(
+        _backend.get_backend(),
+        platform.python_version(),
+    ))
+    print('{:<36} {:>10} {:>10} {:>8} {:>9}'.format(
+        'benchmark', 'pkts/s', 'bytes/s', 'blk/pkt', 'vs base',
+    ))
+
+    results = {}
+    regressions = []
+    for name, packets, nbytes, make_run in BENCHMARKS:
+        if args.filter not in name:
+            continue
+        result = run_benchmark(
+            make_run, packets, nbytes, args.min_time, args.repeat,
+        )
+        results[name] = result
+
+        change = ''
+        if name in baseline:
+            ratio = (
+                result['packets_per_sec']
+                / baseline[name]['packets_per_sec']
+            )
+            change = '{:+.1%}'.format(ratio - 1)
+            if ratio < 1 - args.threshold:
+                regressions.append(name)
+
+        print('{:<36} {:>10} {:>10} {:>8.2f} {:>9}'.format(
+            name,
+            _format_rate(result['packets_per_sec']),
+            _format_rate(result['bytes_per_sec']),
+            result['blocks_per_packet'],
+            change,
+        ))
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(
+                {
+                    'backend': _backend.get_backend(),
+                    'python': platform.python_version(),
+                    'results': results,
+                },
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+            f.write('\n')
+
+    if regressions:
+        print('Slower than baseline: {}'.format(', '.join(regressions)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
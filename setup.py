@@ -3,7 +3,10 @@
 Copyright 2018 Jason Litzinger.
 See LICENSE for details
 """
-from setuptools import setup, find_packages
+import platform
+import sys
+
+from setuptools import setup, find_packages, Extension
 
 EXTRAS = {
     "tests": [
@@ -12,6 +15,18 @@ EXTRAS = {
     ]
 }
 
+EXT_MODULES = []
+# The accelerator uses the Python 3 module API.
+if (platform.python_implementation() == 'CPython'
+        and sys.version_info >= (3,)):
+    EXT_MODULES.append(
+        Extension(
+            'mqttpacket.v311._speedups',
+            sources=['src/mqttpacket/v311/_speedups.c'],
+            optional=True,
+        )
+    )
+
 setup(
     name='mqttpacket',
     version='0.0.0',
@@ -36,6 +51,7 @@ setup(
     ],
     package_dir={"": "src"},
     packages=find_packages("src"),
+    ext_modules=EXT_MODULES,
     license='MIT',
     extras_require=EXTRAS,
 )
@@ -2,28 +2,68 @@
 Copyright 2018 Jason Litzinger
 See LICENSE for details
 """
+import sys
+
 from ._builders import (
     connect,
+    connect_into,
     ConnectSpec,
     pingreq,
     SubscriptionSpec,
     subscribe,
+    subscribe_into,
     encode_remainining_length,
     disconnect,
     publish,
+    publish_header,
+    publish_into,
+    publish_many,
+    publish_parts,
+    PublishTemplate,
     unsubscribe,
+    unsubscribe_into,
+    puback,
+    pubrec,
+    pubrel,
+    pubcomp,
+    unsuback,
+    acks_into,
+    connack,
+    suback,
+    pingresp,
 )
 
 from ._parsing import (
     parse,
     parse_connack,
+    scan_frames,
+    CallbackParser,
 )
 
+from ._batch import PacketBatch, parse_batch
+
+from ._decoder import Decoder
+
+from ._matching import TopicMatcher, CachingTopicMatcher
+
+from ._session import Session
+
 from ._packet import (
     ConnackPacket,
     SubackPacket,
     PublishPacket,
+    PublishHeader,
+    PayloadChunk,
     PubackPacket,
+    PubrecPacket,
+    PubrelPacket,
+    PubcompPacket,
+    UnsubackPacket,
+    ConnectPacket,
+    Subscription,
+    SubscribePacket,
+    UnsubscribePacket,
+    PingreqPacket,
 )
 
 from ._constants import (
@@ -41,34 +81,83 @@ from ._constants import (
     MQTT_PACKET_PINGREQ,
     MQTT_PACKET_PINGRESP,
     MQTT_PACKET_DISCONNECT,
+    CONNACK_ACCEPTED,
+    CONNACK_UNACCEPTABLE_PROTOCOL_VERSION,
+    CONNACK_IDENTIFIER_REJECTED,
+    CONNACK_SERVER_UNAVAILABLE,
+    CONNACK_BAD_USERNAME_OR_PASSWORD,
+    CONNACK_NOT_AUTHORIZED,
+    SUBACK_FAILURE,
 )
 
 from ._errors import (
     MQTTParseError,
     MQTTMoreDataNeededError,
     MQTTInvalidPacketError,
+    MQTTConnectionRefusedError,
+    MQTTPacketTooLargeError,
 )
 
+from . import _backend
+
 
 __all__ = [
     'connect',
+    'connect_into',
     'ConnectSpec',
     'pingreq',
     'SubscriptionSpec',
     'subscribe',
+    'subscribe_into',
     'encode_remainining_length',
     'disconnect',
     'publish',
+    'publish_header',
+    'publish_into',
+    'publish_many',
+    'publish_parts',
+    'PublishTemplate',
     'unsubscribe',
+    'unsubscribe_into',
+    'puback',
+    'pubrec',
+    'pubrel',
+    'pubcomp',
+    'unsuback',
+    'acks_into',
+    'connack',
+    'suback',
+    'pingresp',
     'ConnackPacket',
     'SubackPacket',
     'PublishPacket',
+    'PublishHeader',
+    'PayloadChunk',
     'PubackPacket',
+    'PubrecPacket',
+    'PubrelPacket',
+    'PubcompPacket',
+    'UnsubackPacket',
+    'ConnectPacket',
+    'Subscription',
+    'SubscribePacket',
+    'UnsubscribePacket',
+    'PingreqPacket',
     'parse',
     'parse_connack',
+    'scan_frames',
+    'CallbackParser',
+    'PacketBatch',
+    'parse_batch',
+    'Decoder',
+    'TopicMatcher',
+    'CachingTopicMatcher',
+    'Session',
     'MQTTParseError',
     'MQTTMoreDataNeededError',
     'MQTTInvalidPacketError',
+    'MQTTConnectionRefusedError',
+    'MQTTPacketTooLargeError',
     'MQTT_PACKET_CONNECT',
     'MQTT_PACKET_CONNACK',
     'MQTT_PACKET_PUBLISH',
@@ -83,4 +172,15 @@ __all__ = [
     'MQTT_PACKET_PINGREQ',
     'MQTT_PACKET_PINGRESP',
     'MQTT_PACKET_DISCONNECT',
+    'CONNACK_ACCEPTED',
+    'CONNACK_UNACCEPTABLE_PROTOCOL_VERSION',
+    'CONNACK_IDENTIFIER_REJECTED',
+    'CONNACK_SERVER_UNAVAILABLE',
+    'CONNACK_BAD_USERNAME_OR_PASSWORD',
+    'CONNACK_NOT_AUTHORIZED',
+    'SUBACK_FAILURE',
 ]
+
+if sys.version_info >= (3, 7):
+    from ._aio import MQTTClientProtocol, open_connection
+    __all__ += ['MQTTClientProtocol', 'open_connection']
@@ -0,0 +1,394 @@
+"""
+Copyright 2018 Jason Litzinger
+See LICENSE for details.
+
+An asyncio client protocol.  Requires Python 3.7 or later.
+"""
+import asyncio
+import collections
+from typing import (  # pylint: disable=unused-import
+    Any,
+    Dict,
+    List,
+    Optional,
+    Union,
+)
+
+from . import _builders, _constants, _errors
+from ._decoder import Decoder
+from ._session import Session
+
+_DEFAULT_MAX_QUEUED = 64
+
+# Packets handled by the session.
+_SESSION_PACKETS = frozenset([
+    _constants.MQTT_PACKET_PUBLISH,
+    _constants.MQTT_PACKET_PUBACK,
+    _constants.MQTT_PACKET_PUBREC,
+    _constants.MQTT_PACKET_PUBREL,
+    _constants.MQTT_PACKET_PUBCOMP,
+    _constants.MQTT_PACKET_SUBACK,
+    _constants.MQTT_PACKET_UNSUBACK,
+])
+
+
+class MQTTClientProtocol(asyncio.BufferedProtocol):
+    """
+    An MQTT client built on :class:`Decoder` and the packet builders.
+
+    Received data is decoded in place in the decoder's buffer, and QoS 1
+    and 2 message flows are handled by a :class:`Session`.  Packets
+    written during one iteration of the event loop are sent together
+    with a single ``writelines`` call.  Received PUBLISH packets are
+    acknowledged as required by their QoS and are obtained by iterating
+    over the protocol::
+
+        client = await open_connection('localhost', 1883, u'client-1')
+        await client.subscribe([SubscriptionSpec(u'sensors/#', 1)])
+        async for packet in client:
+            handle(packet)
+
+    When ``max_queued`` received messages are waiting to be consumed,
+    decoding and reading from the transport are paused until half of
+    them have been consumed.  While reading is paused acknowledgements of outgoing
+    messages are not received either.
+
+    :param max_queued: The maximum number of received messages to queue
+        before pausing reading.
+    """
+
+    def __init__(self, max_queued=_DEFAULT_MAX_QUEUED):
+        # type: (int) -> None
+        if max_queued < 1:
+            raise ValueError('max_queued must be positive')
+        self._max_queued = max_queued
+        self._decoder = Decoder()
+        self._loop = None  # type: Optional[asyncio.AbstractEventLoop]
+        self._transport = None  # type: Any
+        self._closed = None  # type: Optional[asyncio.Future]
+        self._exc = None  # type: Optional[BaseException]
+
+        self._writes = []  # type: List[Union[bytes, memoryview]]
+        self._flush_handle = None  # type: Any
+        self._write_paused = False
+        self._drain_waiters = []  # type: List[asyncio.Future]
+
+        self._connack = None  # type: Optional[asyncio.Future]
+        self._session = Session()
+        self._inflight = {}  # type: Dict[int, asyncio.Future]
+
+        self._messages = collections.deque()  # type: collections.deque
+        self._message_waiter = None  # type: Optional[asyncio.Future]
+        self._read_paused = False
+
+        self._keepalive = 0
+        self._keepalive_handle = None  # type: Any
+        self._last_write = 0.0
+        self._ping_outstanding = False
+
+    # asyncio.BufferedProtocol
+
+    def connection_made(self, transport):
+        self._transport = transport
+        self._loop = asyncio.get_running_loop()
+        self._closed = self._loop.create_future()
+
+    def get_buffer(self, sizehint):
+        return self._decoder.get_buffer(sizehint)
+
+    def buffer_updated(self, nbytes):
+        self._decoder.buffer_updated(nbytes)
+        self._decode()
+
+    def eof_received(self):
+        return False
+
+    def pause_writing(self):
+        self._write_paused = True
+
+    def resume_writing(self):
+        self._write_paused = False
+        waiters, self._drain_waiters = self._drain_waiters, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def connection_lost(self, exc):
+        if self._exc is None:
+            self._exc = exc
+        error = self._exc or ConnectionError('Connection closed')
+
+        if self._keepalive_handle is not None:
+            self._keepalive_handle.cancel()
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+        self._writes = []
+
+        futures = list(self._inflight.values()) + self._drain_waiters
+        if self._connack is not None:
+            futures.append(self._connack)
+        for future in futures:
+            if not future.done():
+                future.set_exception(error)
+        self._inflight.clear()
+        self._drain_waiters = []
+
+        self._wake_consumer()
+        self._closed.set_result(None)
+
+    # Client operations
+
+    async def connect(self, client_id, keepalive=60, connect_spec=None):
+        """Send CONNECT and wait for the CONNACK.
+
+        See :func:`connect` for the parameters.
+
+        :raises: MQTTConnectionRefusedError if the server refuses the
+            connection.
+
+        :returns: The session present flag of the CONNACK.
+        """
+        self._connack = self._loop.create_future()
+        self._send(_builders.connect(client_id, keepalive, connect_spec))
+        packet = await self._connack
+        if packet.return_code != _constants.CONNACK_ACCEPTED:
+            self._transport.close()
+            raise _errors.MQTTConnectionRefusedError(packet.return_code)
+
+        self._keepalive = keepalive
+        if keepalive:
+            self._keepalive_handle = self._loop.call_later(
+                keepalive,
+                self._on_keepalive,
+            )
+        return bool(packet.session_present)
+
+    async def subscribe(self, topicspecs):
+        """Subscribe and wait for the SUBACK.
+
+        :param topicspecs: The topic filters to subscribe to.
+        :type topicspecs: list of :class:`SubscriptionSpec`
+
+        :returns: The return code for each topic filter.
+        """
+        self._check_open()
+        return await self._wait(self._session.subscribe(topicspecs))
+
+    async def unsubscribe(self, topics):
+        """Unsubscribe and wait for the UNSUBACK.
+
+        :param topics: The topic filters to unsubscribe from.
+        :type topics: list of unicode
+        """
+        self._check_open()
+        await self._wait(self._session.unsubscribe(topics))
+
+    async def publish(self, topic, payload, qos=0, retain=False):
+        """Publish a message.
+
+        A QoS 0 message is sent without waiting for an acknowledgement,
+        but waits for the transport's write buffer to drain if it is
+        full.  A QoS 1 message waits for the PUBACK and a QoS 2 message
+        waits for the PUBCOMP.
+        """
+        self._check_open()
+        packet_id = self._session.publish(topic, payload, qos, retain)
+        if packet_id is None:
+            self._send_session_data()
+            await self._drain()
+        else:
+            await self._wait(packet_id)
+
+    async def disconnect(self):
+        """Send DISCONNECT and close the connection."""
+        if not self._transport.is_closing():
+            self._send(_builders.disconnect())
+            self._flush()
+            self._transport.close()
+        await self._closed
+
+    async def wait_closed(self):
+        """Wait until the connection is closed."""
+        await self._closed
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        """Return the next received PUBLISH packet.
+
+        :raises: StopAsyncIteration when the connection was closed, or
+            the error that closed it.
+        """
+        while not self._messages:
+            if self._closed.done():
+                if self._exc is not None:
+                    raise self._exc
+                raise StopAsyncIteration
+            self._message_waiter = self._loop.create_future()
+            await self._message_waiter
+
+        packet = self._messages.popleft()
+        if self._read_paused and len(self._messages) <= self._max_queued // 2:
+            self._read_paused = False
+            # Decode the data received before reading was paused, which
+            # may fill the queue again.
+            if not self._transport.is_closing():
+                self._decode()
+            if not self._read_paused:
+                self._transport.resume_reading()
+        return packet
+
+    # Internals
+
+    def _check_open(self):
+        # type: () -> None
+        if self._transport.is_closing():
+            raise self._exc or ConnectionError('Connection closed')
+
+    def _send(self, data):
+        # type: (bytes) -> None
+        """Queue a packet to be written at the next loop iteration."""
+        self._check_open()
+        self._writes.append(data)
+        self._schedule_flush()
+
+    def _send_session_data(self):
+        # type: () -> None
+        """Queue the packets built by the session."""
+        self._writes.extend(self._session.data_to_send())
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        # type: () -> None
+        loop = self._loop
+        assert loop is not None, 'Not connected'
+        self._last_write = loop.time()
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_soon(self._flush)
+
+    def _flush(self):
+        # type: () -> None
+        self._flush_handle = None
+        if self._writes:
+            self._transport.writelines(self._writes)
+            self._writes = []
+
+    async def _drain(self):
+        if self._write_paused:
+            waiter = self._loop.create_future()
+            self._drain_waiters.append(waiter)
+            await waiter
+
+    async def _wait(self, packet_id):
+        """Send the packet the session built for packet_id and wait
+        for its acknowledgement.
+        """
+        future = self._inflight[packet_id] = self._loop.create_future()
+        self._send_session_data()
+        return await future
+
+    def _decode(self):
+        # type: () -> None
+        """Handle the decoded packets until reading is paused."""
+        try:
+            for packet in self._decoder:
+                self._handle(packet)
+                if self._read_paused:
+                    return
+        except (_errors.MQTTParseError, _errors.MQTTInvalidPacketError) as e:
+            self._abort(e)
+
+    def _handle(self, packet):
+        """Handle a received packet."""
+        pkt_type = packet.pkt_type
+        if pkt_type in _SESSION_PACKETS:
+            event = self._session.receive(packet)
+            self._send_session_data()
+            if event is None:
+                return
+            if pkt_type == _constants.MQTT_PACKET_PUBLISH:
+                self._receive(event)
+                return
+            future = self._inflight.pop(event.packet_id, None)
+            if future is not None and not future.done():
+                future.set_result(getattr(event, 'return_codes', None))
+        elif pkt_type == _constants.MQTT_PACKET_PINGRESP:
+            self._ping_outstanding = False
+        elif (pkt_type == _constants.MQTT_PACKET_CONNACK
+              and self._connack is not None
+              and not self._connack.done()):
+            self._connack.set_result(packet)
+        else:
+            self._abort(_errors.MQTTInvalidPacketError(
+                'Unexpected packet type {}'.format(pkt_type)
+            ))
+
+    def _receive(self, packet):
+        """Queue a received PUBLISH for the consumer."""
+        self._messages.append(packet)
+        self._wake_consumer()
+        if not self._read_paused and len(self._messages) >= self._max_queued:
+            self._read_paused = True
+            self._transport.pause_reading()
+
+    def _wake_consumer(self):
+        waiter = self._message_waiter
+        if waiter is not None:
+            self._message_waiter = None
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _on_keepalive(self):
+        """Send PINGREQ when nothing was sent for the keep alive interval.
+
+        The connection is closed if the previous PINGREQ was not answered
+        within the interval.
+        """
+        if self._transport.is_closing():
+            return
+
+        if self._ping_outstanding:
+            self._abort(TimeoutError('No PINGRESP received'))
+            return
+
+        now = self._loop.time()
+        deadline = self._last_write + self._keepalive
+        if now >= deadline:
+            self._send(_builders.pingreq())
+            self._ping_outstanding = True
+            deadline = now + self._keepalive
+        self._keepalive_handle = self._loop.call_later(
+            deadline - now,
+            self._on_keepalive,
+        )
+
+    def _abort(self, exc):
+        # type: (BaseException) -> None
+        if self._exc is None:
+            self._exc = exc
+        self._transport.abort()
+
+
+async def open_connection(host, port, client_id, keepalive=60,
+                          connect_spec=None,
+                          max_queued=_DEFAULT_MAX_QUEUED, **kwargs):
+    """Connect to a server.
+
+    Additional keyword arguments, such as ``ssl``, are passed to
+    ``loop.create_connection``.
+
+    :raises: MQTTConnectionRefusedError if the server refuses the
+        connection.
+
+    :returns: The connected :class:`MQTTClientProtocol`.
+    """
+    loop = asyncio.get_running_loop()
+    _transport, protocol = await loop.create_connection(
+        lambda: MQTTClientProtocol(max_queued),
+        host,
+        port,
+        **kwargs
+    )
+    await protocol.connect(client_id, keepalive, connect_spec)
+    return protocol
@@ -0,0 +1,99 @@
+"""
+Copyright 2018 Jason Litzinger
+See LICENSE for details.
+
+Selection of the implementation of the parser and builder hot paths.
+
+The optional ``_speedups`` C extension provides drop in replacements for
+a few functions.  When it is available it is used, unless the
+``MQTTPACKET_NO_EXTENSIONS`` environment variable is set.
+"""
+from __future__ import absolute_import
+import os
+import sys
+from typing import Any, Dict, List  # pylint: disable=unused-import
+
+from . import _builders, _constants, _parsing, _varint
+
+try:
+    if os.environ.get('MQTTPACKET_NO_EXTENSIONS'):
+        raise ImportError('C extensions disabled')
+    from . import _speedups  # type: ignore
+except ImportError:
+    _speedups = None
+
+PYTHON = 'python'
+C = 'c'
+
+_FUNCTIONS = (
+    'decode_remaining_length',
+    'encode_remaining_length',
+    'iter_frames',
+    'parse_publish',
+    'publish',
+)
+
+# The implementations are stored as Any, as the C functions have no
+# type information to check against the Python signatures.
+_IMPLEMENTATIONS = {
+    PYTHON: {
+        'decode_remaining_length': _varint.decode_remaining_length,
+        'encode_remaining_length': _varint.encode_remaining_length,
+        'iter_frames': _parsing.iter_frames,
+        'parse_publish': _parsing.parse_publish,
+        'publish': _builders.publish,
+    },
+}  # type: Dict[str, Dict[str, Any]]
+
+if _speedups is not None:
+    _IMPLEMENTATIONS[C] = dict(
+        (name, getattr(_speedups, name)) for name in _FUNCTIONS
+    )
+
+_current = [PYTHON]
+
+
+def available():
+    # type: () -> List[str]
+    """Get the names of the available backends."""
+    return sorted(_IMPLEMENTATIONS)
+
+
+def get_backend():
+    # type: () -> str
+    """Get the name of the backend in use."""
+    return _current[0]
+
+
+def set_backend(name):
+    # type: (str) -> None
+    """Use the named backend for the parser and builder hot paths.
+
+    :raises: ValueError if the backend is not available.
+    """
+    try:
+        impl = _IMPLEMENTATIONS[name]
+    except KeyError:
+        raise ValueError('Backend {} is not available'.format(name))
+
+    # The package re-exports some of the functions, so its names are
+    # replaced too.  It is typed as Any as mypy does not know it is the
+    # package of this module.
+    package = sys.modules[__name__.rpartition('.')[0]]  # type: Any
+
+    _varint.decode_remaining_length = impl['decode_remaining_length']
+    _varint.encode_remaining_length = impl['encode_remaining_length']
+    _builders.encode_remainining_length = impl['encode_remaining_length']
+    package.encode_remainining_length = impl['encode_remaining_length']
+
+    _parsing.iter_frames = impl['iter_frames']
+    _parsing.parse_publish = impl['parse_publish']
+    _parsing.PARSERS[_constants.MQTT_PACKET_PUBLISH] = impl['parse_publish']
+
+    _builders.publish = impl['publish']
+    package.publish = impl['publish']
+
+    _current[0] = name
+
+
+set_backend(C if C in _IMPLEMENTATIONS else PYTHON)
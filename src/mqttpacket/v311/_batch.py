@@ -0,0 +1,174 @@
+"""
+Copyright 2018 Jason Litzinger
+See LICENSE for details.
+
+Columnar parsing of many packets into arrays.
+"""
+from __future__ import absolute_import
+import array
+from typing import Optional, Tuple  # pylint: disable=unused-import
+
+from . import _constants, _errors, _parsing
+
+
+class PacketBatch(object):
+    """
+    The fixed header, packet id and topic location of parsed packets,
+    stored in one ``array.array`` per field.
+
+    Packet ``i`` of the batch is described by the ``i``-th item of each
+    array.  Offsets are into the data the batch was parsed from, so
+    topics and payloads can be sliced from it only when needed.  Every
+    packet of a batch must be parsed from the same buffer; to append
+    packets received later, extend the buffer and resume parsing at the
+    returned offset.  Each array supports the buffer protocol, so it can
+    be wrapped without a copy, for example with ``numpy.frombuffer``.
+
+    :ivar pkt_type: The packet type.
+
+    :ivar flags: The flags of the fixed header.
+
+    :ivar offset: The offset of the payload of a PUBLISH, or of the
+        variable header of any other packet.
+
+    :ivar length: The length of the payload or variable header at
+        offset.
+
+    :ivar packet_id: The packet id, or 0 if the packet has none.
+
+    :ivar topic_offset: The offset of the topic of a PUBLISH, otherwise 0.
+
+    :ivar topic_len: The length of the topic of a PUBLISH, otherwise 0.
+    """
+    __slots__ = (
+        'pkt_type',
+        'flags',
+        'offset',
+        'length',
+        'packet_id',
+        'topic_offset',
+        'topic_len',
+    )
+
+    def __init__(self):
+        # type: () -> None
+        self.pkt_type = array.array('B')
+        self.flags = array.array('B')
+        self.offset = array.array('L')
+        self.length = array.array('L')
+        self.packet_id = array.array('H')
+        self.topic_offset = array.array('L')
+        self.topic_len = array.array('H')
+
+    def __len__(self):
+        # type: () -> int
+        """Number of packets in the batch."""
+        return len(self.pkt_type)
+
+    def clear(self):
+        # type: () -> None
+        """Remove every packet from the batch."""
+        for name in self.__slots__:
+            del getattr(self, name)[:]
+
+    def topic(self, data, index):
+        # type: (bytearray, int) -> bytes
+        """Get the encoded topic of a PUBLISH in the batch."""
+        begin = self.topic_offset[index]
+        return bytes(data[begin:begin + self.topic_len[index]])
+
+    def payload(self, data, index):
+        # type: (bytearray, int) -> memoryview
+        """Get a view of the payload of a PUBLISH in the batch.
+
+        A bytearray cannot be resized while a view of it exists, so the
+        view must be released, or deleted on Python 2, before data is
+        extended or trimmed.  Copy it with ``tobytes()`` to keep the
+        payload.
+        """
+        begin = self.offset[index]
+        return memoryview(data)[begin:begin + self.length[index]]
+
+
+def parse_batch(data, batch=None, start=0):
+    # type: (bytearray, Optional[PacketBatch], int) -> Tuple[PacketBatch, int]
+    """Parse packets from data into a :class:`PacketBatch`.
+
+    Only the fixed header, the packet id and the location of the topic
+    and payload of each packet are parsed, and no object is created per
+    packet.  As with :func:`parse`, parsing stops at the first incomplete
+    packet.
+
+    :param data: Data to parse into MQTT packets.
+    :type data: bytearray
+
+    :param batch: A batch to append to, or None to create one.  The
+        batch must have been parsed from the same data.
+
+    :param start: The offset in data of the first packet to parse.
+
+    :raises: MQTTParseError if a remaining length is malformed or a
+        PUBLISH topic exceeds its packet.
+
+    :raises: MQTTInvalidPacketError if a packet type is reserved, a
+        PUBLISH has a QoS of 3, or a packet that must have a packet id is
+        too short to contain one.
+
+    :returns: The batch and the offset in data following the last
+        parsed packet.
+    """
+    if not isinstance(data, bytearray):
+        raise TypeError("data must be a bytearray")
+
+    if batch is None:
+        batch = PacketBatch()
+
+    add_type = batch.pkt_type.append
+    add_flags = batch.flags.append
+    add_offset = batch.offset.append
+    add_length = batch.length.append
+    add_packet_id = batch.packet_id.append
+    add_topic_offset = batch.topic_offset.append
+    add_topic_len = batch.topic_len.append
+
+    offset = start
+    frames = _parsing.iter_frames(data, start)
+    for pkt_type, flags, _, body, end_packet in frames:
+        packet_id = 0
+        topic_offset = 0
+        topic_len = 0
+        remaining_length = end_packet - body
+        if pkt_type == _constants.MQTT_PACKET_PUBLISH:
+            if flags & 0x06 == 0x06:
+                raise _errors.MQTTInvalidPacketError(
+                    "Invalid QoS 3 in PUBLISH"
+                )
+            if remaining_length < _constants.STRING_LENGTH_BYTES:
+                raise _errors.MQTTParseError("Remaining length invalid")
+            topic_len = (data[body] << 8) | data[body+1]
+            topic_offset = body + _constants.STRING_LENGTH_BYTES
+            body = topic_offset + topic_len
+            if flags & 0x06:
+                body += _constants.PACKET_ID_LEN
+                if body <= end_packet:
+                    packet_id = (data[body-2] << 8) | data[body-1]
+            if body > end_packet:
+                raise _errors.MQTTParseError("Topic length exceeds packet")
+        elif (_constants.MQTT_PACKET_PUBACK <= pkt_type
+              <= _constants.MQTT_PACKET_UNSUBACK):
+            if remaining_length < _constants.PACKET_ID_LEN:
+                raise _errors.MQTTInvalidPacketError(
+                    'Packet id missing from packet type {}'.format(pkt_type)
+                )
+            packet_id = (data[body] << 8) | data[body+1]
+
+        add_type(pkt_type)
+        add_flags(flags)
+        add_offset(body)
+        add_length(end_packet - body)
+        add_packet_id(packet_id)
+        add_topic_offset(topic_offset)
+        add_topic_len(topic_len)
+        offset = end_packet
+
+    return batch, offset
@@ -2,13 +2,19 @@
 Copyright 2018 Jason Litzinger
 See LICENSE for details.
 """
+import itertools
 import struct
-from typing import Union # pylint: disable=unused-import
+from typing import (  # pylint: disable=unused-import
+    ByteString,
+    List,
+    Tuple,
+    Union,
+)
 
 import attr
 import six
 
-from . import _constants
+from . import _constants, _varint
 
 _CONNECT_REMAINING_LENGTH = 10
 
@@ -35,25 +41,7 @@ def _check_will_qos(instance, _attribute, value):
         raise ValueError('Will QOS requires topic/message')
 
 
-def encode_remainining_length(remaining_length):
-    # type: (int) -> bytes
-    """Encode the remaining length for the packet.
-
-    :returns: Encoded remaining length
-    :rtype: bytes
-    """
-    encoding = True
-    encoded_bytes = bytearray()
-    encoded_byte = 0
-    while encoding:
-        encoded_byte = remaining_length % 128
-        remaining_length //= 128
-        if remaining_length:
-            encoded_byte |= 0x80
-        else:
-            encoding = False
-        encoded_bytes.append(encoded_byte)
-    return bytes(encoded_bytes)
+encode_remainining_length = _varint.encode_remaining_length
 
 
 def encode_string(text):
@@ -123,16 +111,16 @@ class ConnectSpec(object):
     def payload(self):
         """Return the encoded connect options."""
         parts = []
+        if self.will_topic:
+            parts.append(encode_string(self.will_topic))
+            parts.append(encode_string(self.will_message))
+
         if self.username:
             parts.append(encode_string(self.username))
 
         if self.password:
             parts.append(encode_string(self.password))
 
-        if self.will_topic:
-            parts.append(encode_string(self.will_topic))
-            parts.append(encode_string(self.will_message))
-
         return b''.join(parts)
 
 
@@ -153,7 +141,34 @@ def connect(client_id, keepalive=60, connect_spec=None):
     :rtype: bytes
 
     """
+    return b''.join(_connect_parts(client_id, keepalive, connect_spec))
+
 
+def connect_into(buf, offset, client_id, keepalive=60, connect_spec=None):
+    """Write a CONNECT packet into a buffer.
+
+    :param buf: The buffer to write the packet into.
+    :type buf: bytearray or memoryview
+
+    :param offset: Offset in buf to write the packet at.
+    :type offset: int
+
+    See :func:`connect` for the remaining parameters.
+
+    :raises: ValueError if the packet does not fit in buf.
+
+    :returns: The offset one past the end of the written packet.
+    :rtype: int
+    """
+    return _write_parts(
+        buf,
+        offset,
+        _connect_parts(client_id, keepalive, connect_spec),
+    )
+
+
+def _connect_parts(client_id, keepalive, connect_spec):
+    """Encode the parts of a CONNECT packet."""
     remaining_length = 0
 
     msg = six.int2byte(
@@ -195,7 +210,7 @@ def connect(client_id, keepalive=60, connect_spec=None):
     parts.append(encoded_client_id)
     parts.append(encoded_conn_spec)
 
-    return b''.join(parts)
+    return parts
 
 
 def pingreq():
@@ -251,8 +266,31 @@ def subscribe(packetid, topicspecs):
     :param qos: The QoS level to use.
 
     """
-    if not 0 < packetid < 65535:
-        raise ValueError('Packetid must be 0 < packetid < 65535')
+    return b''.join(_subscribe_parts(packetid, topicspecs))
+
+
+def subscribe_into(buf, offset, packetid, topicspecs):
+    """Write a SUBSCRIBE packet into a buffer.
+
+    :param buf: The buffer to write the packet into.
+    :type buf: bytearray or memoryview
+
+    :param offset: Offset in buf to write the packet at.
+    :type offset: int
+
+    See :func:`subscribe` for the remaining parameters.
+
+    :raises: ValueError if the packet does not fit in buf.
+
+    :returns: The offset one past the end of the written packet.
+    :rtype: int
+    """
+    return _write_parts(buf, offset, _subscribe_parts(packetid, topicspecs))
+
+
+def _subscribe_parts(packetid, topicspecs):
+    """Encode the parts of a SUBSCRIBE packet."""
+    _check_packet_id(packetid)
 
     remaining_len = 2 # packetid
     for spec in topicspecs:
@@ -269,7 +307,7 @@ def subscribe(packetid, topicspecs):
         [s.to_bytes() for s in topicspecs]
     )
 
-    return b''.join(encoded_specs)
+    return encoded_specs
 
 
 def disconnect():
@@ -282,16 +320,14 @@ def disconnect():
     )
 
 
-def publish(topic, dup, qos, retain, payload, packet_id=None):
-    # type: (str, bool, int, bool, bytes, Union[None,int]) -> bytes
-    """Build a PUBLISH packet.
-    """
-    #remaining_len = (topiclen after encoding + 2) + (2 | 0 if packetid) + payload_len
+def _check_publish(topic, dup, qos, packet_id):
+    # type: (str, bool, int, Union[None,int]) -> None
+    """Validate the header arguments for a PUBLISH packet."""
     if qos not in _constants.VALID_QOS:
         raise ValueError('QoS must be 0, 1, or 2')
 
     if not isinstance(topic, six.text_type):
-        raise ValueError('Qos must be 0, 1, or 2')
+        raise ValueError('Topic must be unicode')
 
     if qos > 0 and packet_id is None:
         raise ValueError('QoS of 1 or 2 must have a packet id')
@@ -299,37 +335,382 @@ def publish(topic, dup, qos, retain, payload, packet_id=None):
     if qos == 0 and dup:
         raise ValueError('Dup must not be set on QoS of 0')
 
+
+def publish(topic, dup, qos, retain, payload, packet_id=None):
+    # type: (str, bool, int, bool, bytes, Union[None,int]) -> bytes
+    """Build a PUBLISH packet.
+    """
+    _check_publish(topic, dup, qos, packet_id)
+
     if not isinstance(payload, bytes):
         raise TypeError('Payload must be bytes')
 
-    remaining_len = len(payload)
-    encoded_packet_id = b''
-    if qos > 0:
-        remaining_len += _constants.PACKET_ID_LEN
-        encoded_packet_id = struct.pack('!H', packet_id)
+    return b''.join((
+        _publish_header(topic, dup, qos, retain, len(payload), packet_id),
+        payload,
+    ))
+
 
-    encoded_topic = encode_string(topic)
-    remaining_len += len(encoded_topic)
+def publish_header(topic, dup, qos, retain, payload_len, packet_id=None):
+    # type: (str, bool, int, bool, int, Union[None,int]) -> bytes
+    """Build the header of a PUBLISH packet.
 
-    rl = encode_remainining_length(remaining_len)
+    The header is everything that precedes the payload: the fixed
+    header, the topic and the packet id.  Sending the header followed
+    by the payload, for example with ``socket.sendmsg`` or
+    ``transport.writelines``, avoids copying the payload.
+
+    :param payload_len: The length of the payload that will follow
+        the header.
+    :type payload_len: int
+
+    See :func:`publish` for the remaining parameters.
+
+    :returns: The encoded header.
+    :rtype: bytes
+    """
+    _check_publish(topic, dup, qos, packet_id)
+    return _publish_header(topic, dup, qos, retain, payload_len, packet_id)
+
+
+def publish_parts(topic, dup, qos, retain, payload, packet_id=None):
+    # type: (str, bool, int, bool, ByteString, Union[None,int]) -> Tuple[bytes, ByteString]
+    """Build a PUBLISH packet as a header and the unmodified payload.
+
+    :param payload: The payload.
+    :type payload: bytes, bytearray or memoryview
+
+    See :func:`publish` for the remaining parameters.
+
+    :returns: The header and payload, ready for ``socket.sendmsg`` or
+        ``transport.writelines``.
+    :rtype: tuple
+    """
+    _check_publish(topic, dup, qos, packet_id)
+
+    if not isinstance(payload, (bytes, bytearray, memoryview)):
+        raise TypeError('Payload must be bytes, bytearray or memoryview')
+
+    return (
+        _publish_header(topic, dup, qos, retain, len(payload), packet_id),
+        payload,
+    )
+
+
+def _publish_header(topic, dup, qos, retain, payload_len, packet_id):
+    # type: (str, bool, int, bool, int, Union[None,int]) -> bytes
+    """Encode the header of a PUBLISH packet without validation."""
+    return _encode_publish_header(
+        _publish_byte1(dup, qos, retain),
+        encode_string(topic),
+        payload_len,
+        packet_id,
+    )
+
+
+def _publish_byte1(dup, qos, retain):
+    # type: (bool, int, bool) -> int
+    """Encode the first byte of the fixed header of a PUBLISH."""
     byte1 = _constants.MQTT_PACKET_PUBLISH << 4
     byte1 |= (int(dup) << 3)
     byte1 |= qos << 1
     byte1 |= int(retain)
+    return byte1
+
+
+def _encode_publish_header(byte1, encoded_topic, payload_len, packet_id):
+    # type: (int, bytes, int, Union[None,int]) -> bytes
+    """Encode a PUBLISH header from its pre-encoded parts.
+
+    :param encoded_topic: The topic as encoded by :func:`encode_string`.
+    """
+    #remaining_len = (topiclen after encoding + 2) + (2 | 0 if packetid) + payload_len
+    remaining_len = payload_len + len(encoded_topic)
+    encoded_packet_id = b''
+    if byte1 & 0x06:
+        remaining_len += _constants.PACKET_ID_LEN
+        encoded_packet_id = struct.pack('!H', packet_id)
+
     return b''.join((
         six.int2byte(byte1),
-        rl,
+        encode_remainining_length(remaining_len),
         encoded_topic,
         encoded_packet_id,
-        payload
     ))
 
 
+def publish_into(buf, offset, topic, dup, qos, retain, payload,
+                 packet_id=None):
+    # type: (bytearray, int, str, bool, int, bool, bytes, Union[None,int]) -> int
+    """Write a PUBLISH packet into a buffer.
+
+    The packet is written directly into buf, so many packets can be
+    batched into a single preallocated send buffer.
+
+    :param buf: The buffer to write the packet into.
+    :type buf: bytearray or memoryview
+
+    :param offset: Offset in buf to write the packet at.
+    :type offset: int
+
+    See :func:`publish` for the remaining parameters.
+
+    :raises: ValueError if the packet does not fit in buf.
+
+    :returns: The offset one past the end of the written packet.
+    :rtype: int
+    """
+    _check_publish(topic, dup, qos, packet_id)
+
+    if not isinstance(payload, bytes):
+        raise TypeError('Payload must be bytes')
+
+    return _write_publish(
+        buf,
+        offset,
+        _publish_byte1(dup, qos, retain),
+        encode_string(topic),
+        payload,
+        packet_id,
+    )
+
+
+def _write_publish(buf, offset, byte1, encoded_topic, payload, packet_id):
+    # type: (bytearray, int, int, bytes, bytes, Union[None,int]) -> int
+    """Write a PUBLISH from its pre-encoded parts into buf at offset."""
+    topic_len = len(encoded_topic)
+    remaining_len = topic_len + len(payload)
+    has_packet_id = byte1 & 0x06
+    if has_packet_id:
+        remaining_len += _constants.PACKET_ID_LEN
+
+    end = offset + 1 + _varint.remaining_length_size(remaining_len)
+    end += remaining_len
+    if end > len(buf):
+        raise ValueError('Buffer too small for packet')
+
+    # Item assignment to a memoryview needs a str on Python 2.
+    struct.pack_into('!B', buf, offset, byte1)
+    offset = _varint.encode_remaining_length_into(
+        buf,
+        offset + 1,
+        remaining_len,
+    )
+    buf[offset:offset + topic_len] = encoded_topic
+    offset += topic_len
+    if has_packet_id:
+        struct.pack_into('!H', buf, offset, packet_id)
+        offset += _constants.PACKET_ID_LEN
+    buf[offset:end] = payload
+    return end
+
+
+@attr.s(slots=True, frozen=True)
+class PublishTemplate(object):
+    """
+    Pre-encoded topic and flags for repeated PUBLISH packets.
+
+    The topic is validated and encoded once, when the template is
+    created, so building a packet only encodes the remaining length
+    and packet id.  Templates are immutable, use ``attr.evolve`` to
+    create one with a different topic, QoS or retain flag.
+
+    :ivar topic: The topic to publish to.
+
+    :ivar qos: The QoS of the published messages.
+
+    :ivar retain: Whether the published messages are retained.
+    """
+    topic = attr.ib(
+        validator=attr.validators.instance_of(six.text_type),
+    )
+
+    qos = attr.ib(
+        default=0,
+        validator=_validate_qos,
+    )
+
+    retain = attr.ib(default=False)
+
+    _encoded_topic = attr.ib(init=False)
+
+    _byte1 = attr.ib(init=False)
+
+    def __attrs_post_init__(self):
+        # The instance is frozen, so the cached fields are set directly.
+        object.__setattr__(self, '_encoded_topic', encode_string(self.topic))
+        object.__setattr__(
+            self,
+            '_byte1',
+            _publish_byte1(False, self.qos, self.retain),
+        )
+
+    def _flags(self, packet_id, dup):
+        # type: (Union[None,int], bool) -> int
+        """Get the first byte of the fixed header for one message."""
+        if self.qos:
+            if packet_id is None:
+                raise ValueError('QoS of 1 or 2 must have a packet id')
+            if dup:
+                return self._byte1 | 0x08
+        elif dup:
+            raise ValueError('Dup must not be set on QoS of 0')
+        return self._byte1
+
+    def header(self, payload_len, packet_id=None, dup=False):
+        # type: (int, Union[None,int], bool) -> bytes
+        """Build the header of a PUBLISH, see :func:`publish_header`."""
+        return _encode_publish_header(
+            self._flags(packet_id, dup),
+            self._encoded_topic,
+            payload_len,
+            packet_id,
+        )
+
+    def build(self, payload, packet_id=None, dup=False):
+        # type: (bytes, Union[None,int], bool) -> bytes
+        """Build a PUBLISH packet, see :func:`publish`."""
+        if not isinstance(payload, bytes):
+            raise TypeError('Payload must be bytes')
+
+        return b''.join((
+            self.header(len(payload), packet_id, dup),
+            payload,
+        ))
+
+    def build_into(self, buf, offset, payload, packet_id=None, dup=False):
+        # type: (bytearray, int, bytes, Union[None,int], bool) -> int
+        """Write a PUBLISH packet into buf, see :func:`publish_into`."""
+        if not isinstance(payload, bytes):
+            raise TypeError('Payload must be bytes')
+
+        return _write_publish(
+            buf,
+            offset,
+            self._flags(packet_id, dup),
+            self._encoded_topic,
+            payload,
+            packet_id,
+        )
+
+    def build_many(self, payloads, packet_ids=None):
+        # type: (List[bytes], Union[None,List[int]]) -> bytearray
+        """Build a PUBLISH packet for each payload into one buffer.
+
+        :param payloads: The payloads to publish.
+
+        :param packet_ids: A packet id for each payload, required if
+            the QoS is 1 or 2.
+
+        :returns: The packets, back to back.
+        :rtype: bytearray
+        """
+        if packet_ids is None:
+            if self.qos:
+                raise ValueError('QoS of 1 or 2 must have packet ids')
+        elif len(packet_ids) != len(payloads):
+            raise ValueError('A packet id is required for each payload')
+
+        fixed_len = len(self._encoded_topic)
+        if self.qos:
+            fixed_len += _constants.PACKET_ID_LEN
+
+        total = 0
+        for payload in payloads:
+            if not isinstance(payload, bytes):
+                raise TypeError('Payload must be bytes')
+            remaining_len = fixed_len + len(payload)
+            total += 1 + _varint.remaining_length_size(remaining_len)
+            total += remaining_len
+
+        buf = bytearray(total)
+        offset = 0
+        byte1 = self._byte1
+        encoded_topic = self._encoded_topic
+        ids = itertools.repeat(None) if packet_ids is None else packet_ids
+        for payload, packet_id in zip(payloads, ids):
+            if self.qos and packet_id is None:
+                raise ValueError('QoS of 1 or 2 must have a packet id')
+            offset = _write_publish(
+                buf,
+                offset,
+                byte1,
+                encoded_topic,
+                payload,
+                packet_id,
+            )
+        return buf
+
+
+def publish_many(topic, qos, payloads, packet_ids=None, retain=False):
+    # type: (str, int, List[bytes], Union[None,List[int]], bool) -> bytearray
+    """Build a PUBLISH packet to one topic for each of many payloads.
+
+    The topic is encoded once and every packet is written into a
+    single buffer.
+
+    :param topic: The topic to publish to.
+
+    :param qos: The QoS of the published messages.
+
+    :param payloads: The payloads to publish.
+
+    :param packet_ids: A packet id for each payload, required if
+        qos is 1 or 2.
+
+    :param retain: Whether the published messages are retained.
+
+    :returns: The packets, back to back.
+    :rtype: bytearray
+    """
+    return PublishTemplate(topic, qos, retain).build_many(payloads, packet_ids)
+
+
+def _write_parts(buf, offset, parts):
+    # type: (bytearray, int, List[bytes]) -> int
+    """Write encoded packet parts into buf at offset."""
+    end = offset + sum(len(p) for p in parts)
+    if end > len(buf):
+        raise ValueError('Buffer too small for packet')
+
+    for part in parts:
+        part_end = offset + len(part)
+        buf[offset:part_end] = part
+        offset = part_end
+    return end
+
+
 def unsubscribe(packet_id, topics):
     # (int, List[str]) -> bytes
     """Build an UNSUBSCRIBE message for the specified topics."""
+    return b''.join(_unsubscribe_parts(packet_id, topics))
+
+
+def unsubscribe_into(buf, offset, packet_id, topics):
+    # (bytearray, int, int, List[str]) -> int
+    """Write an UNSUBSCRIBE packet into a buffer.
+
+    :param buf: The buffer to write the packet into.
+    :type buf: bytearray or memoryview
+
+    :param offset: Offset in buf to write the packet at.
+    :type offset: int
+
+    See :func:`unsubscribe` for the remaining parameters.
+
+    :raises: ValueError if the packet does not fit in buf.
+
+    :returns: The offset one past the end of the written packet.
+    :rtype: int
+    """
+    return _write_parts(buf, offset, _unsubscribe_parts(packet_id, topics))
+
+
+def _unsubscribe_parts(packet_id, topics):
+    """Encode the parts of an UNSUBSCRIBE packet."""
     if not topics:
         raise ValueError('At least one topic must be specified')
+    _check_packet_id(packet_id)
 
     remaining_len = 2
     encoded_packet_id = struct.pack('!H', packet_id)
@@ -341,4 +722,172 @@ def unsubscribe(packet_id, topics):
     parts.append(encode_remainining_length(remaining_len))
     parts.append(encoded_packet_id)
     parts.extend(encoded_topics)
-    return b''.join(parts)
+    return parts
+
+
+_pack_ack = struct.Struct('!BBH').pack
+_pack_ack_into = struct.Struct('!BBH').pack_into
+_ACK_LEN = 4
+
+_ACK_BYTE1 = {
+    _constants.MQTT_PACKET_PUBACK: _constants.MQTT_PACKET_PUBACK << 4,
+    _constants.MQTT_PACKET_PUBREC: _constants.MQTT_PACKET_PUBREC << 4,
+    _constants.MQTT_PACKET_PUBREL: (_constants.MQTT_PACKET_PUBREL << 4) | 0x02,
+    _constants.MQTT_PACKET_PUBCOMP: _constants.MQTT_PACKET_PUBCOMP << 4,
+    _constants.MQTT_PACKET_UNSUBACK: _constants.MQTT_PACKET_UNSUBACK << 4,
+}
+
+
+def _check_packet_id(packet_id):
+    # type: (int) -> None
+    if not 0 < packet_id <= _constants.MAX_PACKET_ID:
+        raise ValueError('Packet id must be 0 < packet id <= 65535')
+
+
+def _ack(pkt_type, packet_id):
+    # type: (int, int) -> bytes
+    _check_packet_id(packet_id)
+    return _pack_ack(_ACK_BYTE1[pkt_type], 2, packet_id)
+
+
+def puback(packet_id):
+    # type: (int) -> bytes
+    """Build a PUBACK packet."""
+    return _ack(_constants.MQTT_PACKET_PUBACK, packet_id)
+
+
+def pubrec(packet_id):
+    # type: (int) -> bytes
+    """Build a PUBREC packet."""
+    return _ack(_constants.MQTT_PACKET_PUBREC, packet_id)
+
+
+def pubrel(packet_id):
+    # type: (int) -> bytes
+    """Build a PUBREL packet."""
+    return _ack(_constants.MQTT_PACKET_PUBREL, packet_id)
+
+
+def pubcomp(packet_id):
+    # type: (int) -> bytes
+    """Build a PUBCOMP packet."""
+    return _ack(_constants.MQTT_PACKET_PUBCOMP, packet_id)
+
+
+def unsuback(packet_id):
+    # type: (int) -> bytes
+    """Build an UNSUBACK packet."""
+    return _ack(_constants.MQTT_PACKET_UNSUBACK, packet_id)
+
+
+def acks_into(buf, offset, pkt_type, packet_ids):
+    # type: (bytearray, int, int, List[int]) -> int
+    """Write an acknowledgement for each packet id into a buffer.
+
+    Each acknowledgement is 4 bytes, so buf must have room for
+    ``4 * len(packet_ids)`` bytes after offset.
+
+    :param buf: The buffer to write the packets into.
+    :type buf: bytearray or memoryview
+
+    :param offset: Offset in buf to write the first packet at.
+    :type offset: int
+
+    :param pkt_type: One of MQTT_PACKET_PUBACK, MQTT_PACKET_PUBREC,
+        MQTT_PACKET_PUBREL, MQTT_PACKET_PUBCOMP or MQTT_PACKET_UNSUBACK.
+
+    :param packet_ids: The packet ids to acknowledge.
+
+    :raises: ValueError if the packets do not fit in buf, or a packet id
+        or the packet type is invalid.
+
+    :returns: The offset one past the end of the last written packet.
+    :rtype: int
+    """
+    try:
+        byte1 = _ACK_BYTE1[pkt_type]
+    except KeyError:
+        raise ValueError('Packet type {} is not an ack'.format(pkt_type))
+
+    end = offset + _ACK_LEN * len(packet_ids)
+    if end > len(buf):
+        raise ValueError('Buffer too small for packets')
+
+    # Validate every id first, so nothing is written if one is invalid.
+    for packet_id in packet_ids:
+        _check_packet_id(packet_id)
+
+    for packet_id in packet_ids:
+        _pack_ack_into(buf, offset, byte1, 2, packet_id)
+        offset += _ACK_LEN
+    return end
+
+
+_CONNACKS = dict(
+    (
+        (return_code, session_present),
+        struct.pack(
+            '!BBBB',
+            _constants.MQTT_PACKET_CONNACK << 4,
+            2,
+            int(session_present),
+            return_code,
+        ),
+    )
+    for return_code in range(_constants.CONNACK_NOT_AUTHORIZED + 1)
+    for session_present in (False, True)
+    if return_code == _constants.CONNACK_ACCEPTED or not session_present
+)
+
+
+def connack(return_code=_constants.CONNACK_ACCEPTED, session_present=False):
+    # type: (int, bool) -> bytes
+    """Build a CONNACK packet.
+
+    :param return_code: The connect return code.
+
+    :param session_present: Whether the server has stored session
+        state.  Must be False unless the connection was accepted.
+
+    :raises: ValueError if the return code is invalid, or
+        session_present is set for a refused connection.
+    """
+    try:
+        return _CONNACKS[(return_code, bool(session_present))]
+    except KeyError:
+        raise ValueError(
+            'Return code must be 0 - 5 and session present only set on 0'
+        )
+
+
+def suback(packet_id, return_codes):
+    # type: (int, List[int]) -> bytes
+    """Build a SUBACK packet.
+
+    :param packet_id: The packet id of the SUBSCRIBE being ack'd.
+
+    :param return_codes: A return code for each subscription, the
+        granted QoS or SUBACK_FAILURE.
+    """
+    _check_packet_id(packet_id)
+    if not return_codes:
+        raise ValueError('At least one return code must be specified')
+
+    for rc in return_codes:
+        if rc not in _constants.VALID_SUBACK_RETURN_CODES:
+            raise ValueError('Invalid SUBACK return code {}'.format(rc))
+
+    return b''.join((
+        six.int2byte(_constants.MQTT_PACKET_SUBACK << 4),
+        encode_remainining_length(_constants.PACKET_ID_LEN + len(return_codes)),
+        struct.pack('!H', packet_id),
+        bytes(bytearray(return_codes)),
+    ))
+
+
+def pingresp():
+    # type: () -> bytes
+    """
+    Create a PINGRESP packet.
+    """
+    return b'\xd0\x00'
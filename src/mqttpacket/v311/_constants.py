@@ -26,4 +26,29 @@ PROTOCOL_LEVEL = 4 # MQTT 3.1.1
 
 VALID_QOS = (0x00, 0x01, 0x02)
 PACKET_ID_LEN = 2
+MAX_REMAINING_LENGTH = 268435455
+MAX_PACKET_ID = 65535
+
+CONNACK_ACCEPTED = 0x00
+CONNACK_UNACCEPTABLE_PROTOCOL_VERSION = 0x01
+CONNACK_IDENTIFIER_REJECTED = 0x02
+CONNACK_SERVER_UNAVAILABLE = 0x03
+CONNACK_BAD_USERNAME_OR_PASSWORD = 0x04
+CONNACK_NOT_AUTHORIZED = 0x05
+
+SUBACK_FAILURE = 0x80
+VALID_SUBACK_RETURN_CODES = (0x00, 0x01, 0x02, SUBACK_FAILURE)
 STRING_LENGTH_BYTES = 2
+
+# Remaining length required by packets without a payload.
+FIXED_REMAINING_LENGTHS = {
+    MQTT_PACKET_CONNACK: 2,
+    MQTT_PACKET_PUBACK: 2,
+    MQTT_PACKET_PUBREC: 2,
+    MQTT_PACKET_PUBREL: 2,
+    MQTT_PACKET_PUBCOMP: 2,
+    MQTT_PACKET_UNSUBACK: 2,
+    MQTT_PACKET_PINGREQ: 0,
+    MQTT_PACKET_PINGRESP: 0,
+    MQTT_PACKET_DISCONNECT: 0,
+}
@@ -0,0 +1,382 @@
+"""
+Copyright 2018 Jason Litzinger
+See LICENSE for details.
+
+Incremental decoding of a stream of MQTT packets.
+"""
+from __future__ import absolute_import
+from typing import (  # pylint: disable=unused-import
+    Any,
+    Dict,
+    Iterator,
+    Optional,
+    Tuple,
+)
+
+from . import _constants, _errors, _packet, _parsing, _varint
+
+_DEFAULT_BUFFER_SIZE = 4096
+_MIN_READ_SIZE = 1024
+
+
+def _max_remaining_length(max_packet_size):
+    # type: (int) -> int
+    """Get the largest remaining length of a packet of at most
+    max_packet_size bytes, or -1 if no packet is that small.
+    """
+    remaining_length = min(
+        max_packet_size - 2,
+        _constants.MAX_REMAINING_LENGTH,
+    )
+    while (remaining_length >= 0 and
+           1 + _varint.remaining_length_size(remaining_length)
+           + remaining_length > max_packet_size):
+        remaining_length -= 1
+    return remaining_length
+
+
+class Decoder(object):
+    """
+    Incrementally decode MQTT packets from a byte stream.
+
+    Data is fed to the decoder as it is received and completed packets
+    are obtained by iterating over the decoder::
+
+        decoder = Decoder()
+        decoder.feed(sock.recv(4096))
+        for packet in decoder:
+            handle(packet)
+
+    Alternatively data can be received directly into the decoder, as
+    with ``socket.recv_into`` or ``asyncio.BufferedProtocol``::
+
+        nbytes = sock.recv_into(decoder.get_buffer())
+        decoder.buffer_updated(nbytes)
+
+    Received data is kept in a single growable buffer.  Consumed bytes
+    are only reclaimed when room is needed for new data, and the fixed
+    header of a partially received packet is decoded only once, so a
+    packet received in many pieces costs time proportional to its size.
+
+    The size of each packet is checked as soon as its fixed header is
+    received, so a packet that is too large is rejected without waiting
+    for its body.  Packets without a payload, such as CONNACK and
+    PINGRESP, must have the remaining length required for their type.
+
+    A PUBLISH with a remaining length greater than ``stream_over`` is
+    not buffered whole.  Instead a :class:`PublishHeader` is returned
+    once its topic and packet id are received, followed by a
+    :class:`PayloadChunk` for the payload received so far each time the
+    decoder is iterated, so the memory used does not depend on the size
+    of the payload::
+
+        decoder = Decoder(stream_over=65536)
+        for event in decoder:
+            if isinstance(event, PublishHeader):
+                out = open(event.topic, 'wb')
+            elif isinstance(event, PayloadChunk):
+                out.write(event.data)
+                if event.last:
+                    out.close()
+
+    The size limits also apply to streamed packets.
+
+    :param buffer_size: The initial size of the buffer.
+
+    :param max_packet_size: The maximum size of any packet, including
+        its fixed header, or None for no limit.
+
+    :param packet_size_limits: A dict mapping packet types to the
+        maximum size of packets of that type.  A limit larger than
+        max_packet_size is lowered to it.
+
+    :param stream_over: The remaining length above which the payload of
+        a PUBLISH is returned in chunks, or None to never stream.
+    """
+
+    def __init__(self, buffer_size=_DEFAULT_BUFFER_SIZE,
+                 max_packet_size=None, packet_size_limits=None,
+                 stream_over=None):
+        # type: (int, Optional[int], Optional[Dict[int, int]], Optional[int]) -> None
+        if stream_over is None:
+            stream_over = _constants.MAX_REMAINING_LENGTH
+        self._stream_over = stream_over
+        self._limits = self._remaining_length_limits(
+            max_packet_size,
+            packet_size_limits or {},
+        )
+        self._buf = bytearray(buffer_size)
+        self._start = 0
+        self._end = 0
+        # Fixed header of the packet at _start, once decoded.  Lengths
+        # are relative to _start as the buffer may be compacted.
+        self._pkt_type = -1
+        self._remaining_length = 0
+        self._header_len = 0
+        # Payload bytes of a streamed PUBLISH not yet returned, or -1.
+        self._payload_left = -1
+
+    @staticmethod
+    def _remaining_length_limits(max_packet_size, packet_size_limits):
+        # type: (Optional[int], Dict[int, int]) -> Dict[int, Tuple[int, int]]
+        """Get the minimum and maximum remaining length of each valid
+        packet type.
+        """
+        limits = {}
+        for pkt_type in _parsing.PARSERS:
+            size = packet_size_limits.get(pkt_type)
+            if size is None:
+                size = max_packet_size
+            elif max_packet_size is not None:
+                size = min(size, max_packet_size)
+            maximum = _constants.MAX_REMAINING_LENGTH
+            if size is not None:
+                maximum = _max_remaining_length(size)
+
+            minimum = _constants.FIXED_REMAINING_LENGTHS.get(pkt_type, 0)
+            if pkt_type in _constants.FIXED_REMAINING_LENGTHS:
+                maximum = min(maximum, minimum)
+            limits[pkt_type] = (minimum, maximum)
+        return limits
+
+    def __len__(self):
+        # type: () -> int
+        """Number of received bytes not yet consumed as packets."""
+        return self._end - self._start
+
+    def feed(self, data):
+        # type: (bytes) -> None
+        """Append received data to the decoder.
+
+        :param data: Data received from the network.
+        :type data: bytes, bytearray or memoryview
+        """
+        nbytes = len(data)
+        self._reserve(nbytes)
+        self._buf[self._end:self._end + nbytes] = data
+        self._end += nbytes
+
+    def get_buffer(self, min_size=-1):
+        # type: (int) -> memoryview
+        """Get a writable buffer to receive data into.
+
+        The received data must be written to the start of the buffer and
+        then committed with :meth:`buffer_updated`.  The buffer is only
+        valid until the next call to a method of the decoder.
+
+        :param min_size: The minimum size of the buffer.  If zero or
+            negative a buffer of at least 1KiB is returned.
+
+        :returns: The free space at the end of the internal buffer.
+        """
+        self._reserve(max(min_size, _MIN_READ_SIZE))
+        return memoryview(self._buf)[self._end:]
+
+    def buffer_updated(self, nbytes):
+        # type: (int) -> None
+        """Commit data written to the buffer from :meth:`get_buffer`.
+
+        :param nbytes: Number of bytes written to the buffer.
+
+        :raises: ValueError if nbytes exceeds the size of the buffer.
+        """
+        if not 0 <= nbytes <= len(self._buf) - self._end:
+            raise ValueError('nbytes must be within the buffer')
+        self._end += nbytes
+
+    def _reserve(self, nbytes):
+        # type: (int) -> None
+        """Ensure there is room for nbytes after the received data.
+
+        The buffer is only ever compacted in place or replaced, never
+        resized, so views returned by get_buffer do not prevent it.
+        """
+        buf = self._buf
+        if len(buf) - self._end >= nbytes:
+            return
+
+        used = self._end - self._start
+        if used + nbytes <= len(buf):
+            buf[:used] = buf[self._start:self._end]
+        else:
+            buf = bytearray(max(2 * len(buf), used + nbytes))
+            buf[:used] = self._buf[self._start:self._end]
+            self._buf = buf
+
+        self._start = 0
+        self._end = used
+
+    def _decode_header(self):
+        # type: () -> bool
+        """Decode the fixed header at the start of the received data."""
+        start = self._start
+        remaining_length, variable_begin = _varint.decode_remaining_length(
+            self._buf,
+            start + 1,
+            self._end,
+        )
+        if remaining_length < 0:
+            return False
+
+        pkt_type = self._buf[start] >> 4
+        try:
+            minimum, maximum = self._limits[pkt_type]
+        except KeyError:
+            raise _errors.MQTTInvalidPacketError(
+                'Invalid packet type {}'.format(pkt_type)
+            )
+        if not minimum <= remaining_length <= maximum:
+            self._reject(pkt_type, remaining_length)
+
+        self._pkt_type = pkt_type
+        self._remaining_length = remaining_length
+        self._header_len = variable_begin - start
+        return True
+
+    def _reject(self, pkt_type, remaining_length):
+        # type: (int, int) -> None
+        """Raise the error for a remaining length outside the limits."""
+        fixed = _constants.FIXED_REMAINING_LENGTHS.get(pkt_type)
+        if fixed is not None and remaining_length != fixed:
+            raise _errors.MQTTInvalidPacketError(
+                'Remaining length should be {} for packet type {}'.format(
+                    fixed,
+                    pkt_type,
+                )
+            )
+        raise _errors.MQTTPacketTooLargeError(
+            'Packet of type {} with remaining length {} is too large'.format(
+                pkt_type,
+                remaining_length,
+            )
+        )
+
+    def __iter__(self):
+        # type: () -> Iterator[Any]
+        return self
+
+    def __next__(self):
+        # type: () -> Any
+        """Return the next complete packet.
+
+        :raises: StopIteration if no complete packet, or no part of a
+            streamed payload, has been received.
+
+        :raises: MQTTParseError if the remaining length is malformed.
+
+        :raises: MQTTInvalidPacketError if the packet type is reserved, or
+            the remaining length is invalid for the packet type.
+
+        :raises: MQTTPacketTooLargeError if the packet exceeds a size
+            limit.
+        """
+        if self._payload_left >= 0:
+            return self._next_chunk()
+
+        start = self._start
+        if start == self._end:
+            raise StopIteration
+
+        if self._pkt_type < 0 and not self._decode_header():
+            raise StopIteration
+
+        if (self._pkt_type == _constants.MQTT_PACKET_PUBLISH
+                and self._remaining_length > self._stream_over):
+            return self._publish_header()
+
+        variable_begin = start + self._header_len
+        end_packet = variable_begin + self._remaining_length
+        if end_packet > self._end:
+            raise StopIteration
+
+        try:
+            parser = _parsing.PARSERS[self._pkt_type]
+        except KeyError:
+            raise _errors.MQTTInvalidPacketError(
+                'Invalid packet type {}'.format(self._pkt_type)
+            )
+
+        packet = parser(
+            self._buf,
+            start,
+            self._remaining_length,
+            variable_begin,
+        )
+
+        self._pkt_type = -1
+        self._consume(end_packet)
+        return packet
+
+    next = __next__
+
+    def _consume(self, end):
+        # type: (int) -> None
+        """Discard the received data before end."""
+        if end == self._end:
+            self._start = self._end = 0
+        else:
+            self._start = end
+
+    def _publish_header(self):
+        # type: () -> _packet.PublishHeader
+        """Return the header of a streamed PUBLISH once its topic and
+        packet id have been received.
+        """
+        buf = self._buf
+        start = self._start
+        variable_begin = start + self._header_len
+        end_packet = variable_begin + self._remaining_length
+        if variable_begin + _constants.STRING_LENGTH_BYTES > self._end:
+            raise StopIteration
+
+        flags = buf[start] & 0x0F
+        qos = (flags & 0x06) >> 1
+        if qos == 3:
+            raise _errors.MQTTInvalidPacketError("Invalid QoS 3 in PUBLISH")
+        topic_len = (buf[variable_begin] << 8) | buf[variable_begin+1]
+        topic_begin = variable_begin + _constants.STRING_LENGTH_BYTES
+        payload_begin = topic_begin + topic_len
+        if qos:
+            payload_begin += _constants.PACKET_ID_LEN
+        if payload_begin > end_packet:
+            raise _errors.MQTTParseError("Topic length exceeds packet")
+        if payload_begin > self._end:
+            raise StopIteration
+
+        packetid = None
+        if qos:
+            packetid = (buf[payload_begin-2] << 8) | buf[payload_begin-1]
+        header = _packet.PublishHeader(
+            (flags & 0x08) >> 3,
+            qos,
+            flags & 0x1,
+            bytes(buf[topic_begin:topic_begin+topic_len]),
+            packetid,
+            end_packet - payload_begin,
+        )
+
+        self._pkt_type = -1
+        self._payload_left = end_packet - payload_begin
+        self._consume(payload_begin)
+        return header
+
+    def _next_chunk(self):
+        # type: () -> _packet.PayloadChunk
+        """Return the received part of a streamed payload."""
+        start = self._start
+        size = min(self._end - start, self._payload_left)
+        if not size and self._payload_left:
+            raise StopIteration
+
+        # Copy the chunk once through a view, dropped before the buffer
+        # can be compacted.  memoryview.release() is not available on
+        # Python 2.
+        view = memoryview(self._buf)[start:start + size]
+        data = view.tobytes()
+        del view
+        self._payload_left -= size
+        last = not self._payload_left
+        if last:
+            self._payload_left = -1
+        self._consume(start + size)
+        return _packet.PayloadChunk(data, last)
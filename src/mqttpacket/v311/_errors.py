@@ -13,3 +13,19 @@ class MQTTMoreDataNeededError(Exception):
     
 class MQTTInvalidPacketError(Exception):
     """Invalid packet"""
+
+
+class MQTTPacketTooLargeError(MQTTInvalidPacketError):
+    """A packet exceeds the maximum size allowed for it"""
+
+
+class MQTTConnectionRefusedError(Exception):
+    """The server refused the connection.
+
+    :ivar return_code: The return code of the CONNACK.
+    """
+    def __init__(self, return_code):
+        super(MQTTConnectionRefusedError, self).__init__(
+            'Connection refused with return code {}'.format(return_code)
+        )
+        self.return_code = return_code
@@ -0,0 +1,292 @@
+"""
+Copyright 2018 Jason Litzinger
+See LICENSE for details.
+
+Matching of topic names against subscribed topic filters.
+"""
+from __future__ import absolute_import
+import collections
+from typing import (  # pylint: disable=unused-import
+    AbstractSet,
+    Any,
+    Dict,
+    List,
+    Set,
+)
+
+import six
+
+_SEPARATOR = b'/'
+_SINGLE = b'+'
+_MULTI = b'#'
+_DOLLAR = b'$'[0]
+
+
+def _to_bytes(topic):
+    # type: (Any) -> bytes
+    """Copy a bytes-like topic to bytes.
+
+    bytes(memoryview) is the repr of the view on Python 2.
+    """
+    if isinstance(topic, memoryview):
+        return topic.tobytes()
+    return bytes(topic)
+
+
+def _encode(topic):
+    # type: (Any) -> bytes
+    if isinstance(topic, six.text_type):
+        return topic.encode('utf-8')
+    return _to_bytes(topic)
+
+
+def _filter_levels(topicfilter):
+    # type: (Any) -> List[bytes]
+    """Split a topic filter into levels, validating its wildcards.
+
+    :raises: ValueError if the topic filter is invalid.
+    """
+    levels = _encode(topicfilter).split(_SEPARATOR)
+    last = len(levels) - 1
+    for i, level in enumerate(levels):
+        if _MULTI in level and (level != _MULTI or i != last):
+            raise ValueError(
+                "'#' must be the last level of a topic filter"
+            )
+        if _SINGLE in level and level != _SINGLE:
+            raise ValueError("'+' must occupy an entire level")
+    if levels == [b'']:
+        raise ValueError('Topic filter must not be empty')
+    return levels
+
+
+if hasattr(collections.OrderedDict, 'move_to_end'):
+    def _move_to_end(cache, key):
+        # type: (collections.OrderedDict, Any) -> None
+        cache.move_to_end(key)
+else:
+    def _move_to_end(cache, key):
+        # type: (collections.OrderedDict, Any) -> None
+        cache[key] = cache.pop(key)
+
+
+class _Node(object):
+    """A level of the subscription trie."""
+    __slots__ = ('children', 'subscribers')
+
+    def __init__(self):
+        # type: () -> None
+        self.children = {}  # type: Dict[bytes, _Node]
+        self.subscribers = set()  # type: Set[Any]
+
+
+class TopicMatcher(object):
+    """
+    Match topic names against subscribed topic filters.
+
+    Subscriptions are kept in a trie with one level per topic level, so
+    adding or removing a subscription takes time proportional to the
+    depth of its topic filter, and matching a topic only visits the
+    levels of filters that can match it::
+
+        matcher = TopicMatcher()
+        matcher.add(u'sensors/+/temperature', client)
+        for subscriber in matcher.match(packet.topic_bytes):
+            subscriber.send(packet)
+
+    Topic filters and topic names may be given as text or as UTF-8
+    encoded bytes.  Matching on :attr:`PublishPacket.topic_bytes` avoids
+    decoding the topic.
+
+    As required by the specification, topic names starting with ``$``
+    are not matched by filters starting with a wildcard.
+    """
+
+    def __init__(self):
+        # type: () -> None
+        self._root = _Node()
+        self._count = 0
+
+    def __len__(self):
+        # type: () -> int
+        """Number of subscriptions."""
+        return self._count
+
+    def add(self, topicfilter, subscriber):
+        # type: (Any, Any) -> bool
+        """Subscribe to a topic filter.
+
+        :param topicfilter: The topic filter.
+        :type topicfilter: unicode or bytes
+
+        :param subscriber: The subscriber returned on a match.  Must be
+            hashable.
+
+        :raises: ValueError if the topic filter is invalid.
+
+        :returns: False if the subscription already existed.
+        """
+        node = self._root
+        for level in _filter_levels(topicfilter):
+            child = node.children.get(level)
+            if child is None:
+                child = node.children[level] = _Node()
+            node = child
+
+        if subscriber in node.subscribers:
+            return False
+        node.subscribers.add(subscriber)
+        self._count += 1
+        return True
+
+    def remove(self, topicfilter, subscriber):
+        # type: (Any, Any) -> None
+        """Unsubscribe from a topic filter.
+
+        :raises: KeyError if the subscription does not exist.
+
+        :raises: ValueError if the topic filter is invalid.
+        """
+        levels = _filter_levels(topicfilter)
+        path = [self._root]
+        for level in levels:
+            child = path[-1].children.get(level)
+            if child is None:
+                raise KeyError(topicfilter)
+            path.append(child)
+
+        path[-1].subscribers.remove(subscriber)
+        self._count -= 1
+
+        # Prune the levels left without subscriptions.
+        for i in range(len(levels), 0, -1):
+            node = path[i]
+            if node.children or node.subscribers:
+                break
+            del path[i-1].children[levels[i-1]]
+
+    def match(self, topic):
+        # type: (Any) -> AbstractSet[Any]
+        """Get the subscribers of every topic filter matching a topic.
+
+        The topic name is not validated.
+
+        :param topic: The topic name.
+        :type topic: unicode or bytes
+
+        :returns: A new set of the subscribers.
+        """
+        levels = _encode(topic).split(_SEPARATOR)
+        matched = set()  # type: Set[Any]
+        nodes = [self._root]
+        # Wildcards at the first level do not match topics starting
+        # with '$'.
+        wildcards = not levels[0] or levels[0][0] != _DOLLAR
+        for level in levels:
+            found = []
+            for node in nodes:
+                children = node.children
+                if wildcards:
+                    child = children.get(_MULTI)
+                    if child is not None:
+                        matched.update(child.subscribers)
+                    child = children.get(_SINGLE)
+                    if child is not None:
+                        found.append(child)
+                child = children.get(level)
+                if child is not None:
+                    found.append(child)
+            if not found:
+                return matched
+            nodes = found
+            wildcards = True
+
+        for node in nodes:
+            matched.update(node.subscribers)
+            # 'a/#' also matches 'a'.
+            child = node.children.get(_MULTI)
+            if child is not None:
+                matched.update(child.subscribers)
+        return matched
+
+
+class CachingTopicMatcher(TopicMatcher):
+    """
+    A :class:`TopicMatcher` that caches the subscribers matched by the
+    most recently used topics.
+
+    When the same topics are published repeatedly, matching a topic
+    is a single lookup in the cache.  Each cached match records the
+    generation of the subscriptions it was made against, and adding or
+    removing a subscription starts a new generation, so matches are
+    always current and changing subscriptions takes constant time.
+    Outdated matches are replaced when their topic is next matched.
+
+    Text topics are cached as given and other topics as bytes, so a
+    topic matched both as text and as bytes is cached twice.
+
+    :param maxsize: The maximum number of topics to cache.
+
+    :ivar hits: Number of matches answered from the cache.
+
+    :ivar misses: Number of matches that searched the trie.
+    """
+
+    def __init__(self, maxsize=65536):
+        # type: (int) -> None
+        if maxsize < 1:
+            raise ValueError('maxsize must be positive')
+        super(CachingTopicMatcher, self).__init__()
+        self._cache = collections.OrderedDict()  # type: collections.OrderedDict
+        self._maxsize = maxsize
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def add(self, topicfilter, subscriber):
+        # type: (Any, Any) -> bool
+        added = super(CachingTopicMatcher, self).add(topicfilter, subscriber)
+        if added:
+            self._generation += 1
+        return added
+
+    def remove(self, topicfilter, subscriber):
+        # type: (Any, Any) -> None
+        super(CachingTopicMatcher, self).remove(topicfilter, subscriber)
+        self._generation += 1
+
+    def match(self, topic):
+        # type: (Any) -> AbstractSet[Any]
+        """Get the subscribers of every topic filter matching a topic.
+
+        :returns: A frozenset of the subscribers, shared with the cache.
+        """
+        if not isinstance(topic, (six.text_type, bytes)):
+            topic = _to_bytes(topic)
+
+        cache = self._cache
+        cached = cache.get(topic)
+        if cached is not None:
+            _move_to_end(cache, topic)
+            if cached[0] == self._generation:
+                self.hits += 1
+                return cached[1]
+
+        self.misses += 1
+        matched = frozenset(super(CachingTopicMatcher, self).match(topic))
+        cache[topic] = (self._generation, matched)
+        if cached is None and len(cache) > self._maxsize:
+            cache.popitem(last=False)
+        return matched
+
+    def cache_len(self):
+        # type: () -> int
+        """Number of cached topics, including outdated matches."""
+        return len(self._cache)
+
+    def clear_cache(self):
+        # type: () -> None
+        """Discard every cached topic and reset the counters."""
+        self._cache.clear()
+        self.hits = 0
+        self.misses = 0
@@ -1,12 +1,21 @@
 """
 Copyright 2018 Jason Litzinger
 See LICENSE for details
+
+Packets returned by the parser.  These are slotted and perform no
+validation when created, as the parser has already validated their
+contents.  The packet type is a class attribute rather than a field.
 """
+import codecs
+
 import attr
+import six
 
 from . import _constants
 
-@attr.s
+_decode_utf8 = codecs.utf_8_decode
+
+@attr.s(slots=True)
 class ConnackPacket(object):
     """Parsed CONNACK packet
 
@@ -18,33 +27,134 @@ class ConnackPacket(object):
     """
     return_code = attr.ib()
     session_present = attr.ib()
-    pkt_type = attr.ib(default=_constants.MQTT_PACKET_CONNACK)
+    pkt_type = _constants.MQTT_PACKET_CONNACK
 
 
-@attr.s
+@attr.s(slots=True)
 class SubackPacket(object):
     """Parsed SUBACK packet
 
     """
     packet_id = attr.ib()
     return_codes = attr.ib()
-    pkt_type = attr.ib(default=_constants.MQTT_PACKET_SUBACK)
+    pkt_type = _constants.MQTT_PACKET_SUBACK
 
 
 @attr.s(slots=True)
 class PublishPacket(object):
     """
     Packet representing an incoming publish message.
+
+    The topic is only decoded when :attr:`topic` is first accessed, so
+    forwarding a message by its :attr:`topic_bytes` never decodes it.
+
+    Use :meth:`create` to build a packet from values that have not
+    been validated.
+
+    :ivar topic_bytes: The UTF-8 encoded topic.
+
+    :ivar payload: The application message.  A bytearray, or a memoryview
+        into the parsed buffer when parsed with ``zero_copy=True``.
     """
     dup = attr.ib()
-    qos = attr.ib(
-        validator=attr.validators.in_(_constants.VALID_QOS)
-    )
+    qos = attr.ib()
     retain = attr.ib()
-    topic = attr.ib()
+    topic_bytes = attr.ib()
     packetid = attr.ib()
     payload = attr.ib()
-    pkt_type = attr.ib(default=_constants.MQTT_PACKET_PUBLISH)
+    _topic = attr.ib(default=None, init=False, repr=False, eq=False)
+    pkt_type = _constants.MQTT_PACKET_PUBLISH
+
+    @property
+    def topic(self):
+        """The decoded topic.
+
+        :raises: UnicodeDecodeError if the topic is not valid UTF-8.
+        """
+        if self._topic is None:
+            self._topic = _decode_utf8(self.topic_bytes, 'strict', True)[0]
+        return self._topic
+
+    @classmethod
+    def create(cls, dup, qos, retain, topic, packetid, payload):
+        """Create a packet, validating every field.
+
+        :raises: ValueError or TypeError if a field is invalid.
+        """
+        if qos not in _constants.VALID_QOS:
+            raise ValueError('QoS must be 0, 1, or 2')
+
+        if not isinstance(topic, six.text_type):
+            raise TypeError('Topic must be unicode')
+
+        if qos:
+            if packetid is None or not 0 < packetid <= 0xFFFF:
+                raise ValueError('QoS of 1 or 2 must have a packet id')
+        elif dup:
+            raise ValueError('Dup must not be set on QoS of 0')
+
+        if not isinstance(payload, (bytes, bytearray, memoryview)):
+            raise TypeError('Payload must be bytes, bytearray or memoryview')
+
+        packet = cls(
+            int(dup),
+            qos,
+            int(retain),
+            topic.encode('utf-8'),
+            packetid,
+            payload,
+        )
+        packet._topic = topic  # pylint: disable=protected-access
+        return packet
+
+
+@attr.s(slots=True)
+class PublishHeader(object):
+    """
+    The start of a PUBLISH whose payload is delivered in chunks by a
+    :class:`Decoder`.
+
+    It is followed by one or more :class:`PayloadChunk`, the last of
+    which has ``last`` set.
+
+    :ivar topic_bytes: The UTF-8 encoded topic.
+
+    :ivar payload_length: The total length of the payload.
+    """
+    dup = attr.ib()
+    qos = attr.ib()
+    retain = attr.ib()
+    topic_bytes = attr.ib()
+    packetid = attr.ib()
+    payload_length = attr.ib()
+    _topic = attr.ib(default=None, init=False, repr=False, eq=False)
+    pkt_type = _constants.MQTT_PACKET_PUBLISH
+
+    @property
+    def topic(self):
+        """The decoded topic.
+
+        :raises: UnicodeDecodeError if the topic is not valid UTF-8.
+        """
+        if self._topic is None:
+            self._topic = _decode_utf8(self.topic_bytes, 'strict', True)[0]
+        return self._topic
+
+
+@attr.s(slots=True)
+class PayloadChunk(object):
+    """
+    Part of the payload of a PUBLISH following a :class:`PublishHeader`.
+
+    A chunk is not a packet, so its packet type is None.
+
+    :ivar data: The bytes of the payload, in the order received.
+
+    :ivar last: Whether this is the end of the payload.
+    """
+    data = attr.ib()
+    last = attr.ib()
+    pkt_type = None
 
 
 @attr.s(slots=True)
@@ -55,7 +165,7 @@ class DisconnectPacket(object):
     :ivar reserved: Reserved bits from the packet.
     """
     reserved = attr.ib()
-    pkt_type = attr.ib(default=_constants.MQTT_PACKET_DISCONNECT)
+    pkt_type = _constants.MQTT_PACKET_DISCONNECT
 
 
 @attr.s(slots=True)
@@ -66,7 +176,51 @@ class PubackPacket(object):
     :ivar packet_id: The packet identifier being ack'd.
     """
     packet_id = attr.ib()
-    pkt_type = attr.ib(default=_constants.MQTT_PACKET_PUBACK)
+    pkt_type = _constants.MQTT_PACKET_PUBACK
+
+
+@attr.s(slots=True)
+class PubrecPacket(object):
+    """
+    Class representing a PUBREC packet.
+
+    :ivar packet_id: The packet identifier being received.
+    """
+    packet_id = attr.ib()
+    pkt_type = _constants.MQTT_PACKET_PUBREC
+
+
+@attr.s(slots=True)
+class PubrelPacket(object):
+    """
+    Class representing a PUBREL packet.
+
+    :ivar packet_id: The packet identifier being released.
+    """
+    packet_id = attr.ib()
+    pkt_type = _constants.MQTT_PACKET_PUBREL
+
+
+@attr.s(slots=True)
+class PubcompPacket(object):
+    """
+    Class representing a PUBCOMP packet.
+
+    :ivar packet_id: The packet identifier being completed.
+    """
+    packet_id = attr.ib()
+    pkt_type = _constants.MQTT_PACKET_PUBCOMP
+
+
+@attr.s(slots=True)
+class UnsubackPacket(object):
+    """
+    Class representing an UNSUBACK packet.
+
+    :ivar packet_id: The packet identifier being ack'd.
+    """
+    packet_id = attr.ib()
+    pkt_type = _constants.MQTT_PACKET_UNSUBACK
 
 
 @attr.s(slots=True)
@@ -75,4 +229,121 @@ class PingrespPacket(object):
     Class representing a PINGRESP packet.  In
     generally this can be created once and reused.
     """
-    pkt_type = attr.ib(default=_constants.MQTT_PACKET_PINGRESP)
+    pkt_type = _constants.MQTT_PACKET_PINGRESP
+
+
+@attr.s(slots=True)
+class PingreqPacket(object):
+    """
+    Class representing a PINGREQ packet.  In
+    generally this can be created once and reused.
+    """
+    pkt_type = _constants.MQTT_PACKET_PINGREQ
+
+
+@attr.s(slots=True)
+class ConnectPacket(object):
+    """
+    Parsed CONNECT packet.
+
+    :ivar protocol_level: The protocol level, 4 for MQTT 3.1.1.
+
+    :ivar clean_session: Whether the session should be discarded.
+
+    :ivar keepalive: The keep alive interval in seconds.
+
+    :ivar client_id: The client identifier.
+
+    :ivar will_topic: The will topic, or None.
+
+    :ivar will_message: The will message as bytes, or None.
+
+    :ivar will_qos: The QoS of the will message.
+
+    :ivar will_retain: Whether the will message is retained.
+
+    :ivar username: The user name, or None.
+
+    :ivar password: The password as bytes, or None.
+    """
+    protocol_level = attr.ib()
+    clean_session = attr.ib()
+    keepalive = attr.ib()
+    client_id = attr.ib()
+    will_topic = attr.ib(default=None)
+    will_message = attr.ib(default=None)
+    will_qos = attr.ib(default=0)
+    will_retain = attr.ib(default=False)
+    username = attr.ib(default=None)
+    password = attr.ib(default=None)
+    pkt_type = _constants.MQTT_PACKET_CONNECT
+
+
+@attr.s(slots=True)
+class Subscription(object):
+    """
+    A topic filter and requested QoS from a SUBSCRIBE packet.
+
+    The topic filter is only decoded when :attr:`topicfilter` is first
+    accessed, so forwarding a subscription never decodes it.
+
+    :ivar topicfilter_bytes: The UTF-8 encoded topic filter.
+
+    :ivar qos: The requested QoS.
+    """
+    topicfilter_bytes = attr.ib()
+    qos = attr.ib()
+    _topicfilter = attr.ib(default=None, init=False, repr=False, eq=False)
+
+    @property
+    def topicfilter(self):
+        """The decoded topic filter."""
+        if self._topicfilter is None:
+            self._topicfilter = _decode_utf8(
+                self.topicfilter_bytes,
+                'strict',
+                True,
+            )[0]
+        return self._topicfilter
+
+
+@attr.s(slots=True)
+class SubscribePacket(object):
+    """
+    Parsed SUBSCRIBE packet.
+
+    :ivar packet_id: The packet identifier.
+
+    :ivar subscriptions: A list of :class:`Subscription`.
+    """
+    packet_id = attr.ib()
+    subscriptions = attr.ib()
+    pkt_type = _constants.MQTT_PACKET_SUBSCRIBE
+
+
+@attr.s(slots=True)
+class UnsubscribePacket(object):
+    """
+    Parsed UNSUBSCRIBE packet.
+
+    The topic filters are only decoded when :attr:`topicfilters` is
+    first accessed.
+
+    :ivar packet_id: The packet identifier.
+
+    :ivar topicfilters_bytes: A list of the UTF-8 encoded topic filters.
+    """
+    packet_id = attr.ib()
+    topicfilters_bytes = attr.ib()
+    _topicfilters = attr.ib(default=None, init=False, repr=False, eq=False)
+    pkt_type = _constants.MQTT_PACKET_UNSUBSCRIBE
+
+    @property
+    def topicfilters(self):
+        """The decoded topic filters."""
+        if self._topicfilters is None:
+            self._topicfilters = [
+                _decode_utf8(t, 'strict', True)[0]
+                for t in self.topicfilters_bytes
+            ]
+        return self._topicfilters
@@ -6,22 +6,66 @@ A parser should either consume all packet data, or raise and error.
 
 """
 from __future__ import absolute_import
+import codecs
 from typing import (  # pylint: disable=unused-import
     ByteString,
     List,
     Any,
     Callable,
-    Dict
+    Dict,
+    Iterator,
+    Optional,
+    Tuple,
 )
 
-from . import _packet, _errors, _constants
+import six
 
-def parse_connack(data, remaining_length, variable_begin):
-    # type: (bytearray, int, int) -> _packet.ConnackPacket
+from . import _packet, _errors, _constants, _varint
+
+_decode_utf8 = codecs.utf_8_decode
+
+_PROTOCOL_NAME = b'MQTT'
+
+def _parse_publish_view(view, offset, remaining_length, variable_begin,
+                        handler):
+    # type: (memoryview, int, int, int, Callable[..., Any]) -> Any
+    """Parse a PUBLISH from a memoryview on Python 2.
+
+    Indexing a memoryview gives str on Python 2, so the headers are
+    parsed from a copy and only the payload is a view.
+    """
+    end_packet = variable_begin + remaining_length
+    header_end = variable_begin + _constants.STRING_LENGTH_BYTES
+    if header_end <= end_packet:
+        header_end += (six.indexbytes(view, variable_begin) << 8) | (
+            six.indexbytes(view, variable_begin+1)
+        )
+        if six.indexbytes(view, offset) & 0x06:
+            header_end += _constants.PACKET_ID_LEN
+    header_end = min(header_end, end_packet)
+
+    fields = parse_publish(
+        bytearray(view[offset:header_end]),
+        0,
+        header_end - variable_begin,
+        variable_begin - offset,
+        lambda *fields: fields,
+    )
+    return handler(*(fields[:5] + (view[header_end:end_packet],)))
+
+
+def parse_connack(data, _offset, remaining_length, variable_begin,
+                  handler=_packet.ConnackPacket):
+    # type: (bytearray, int, int, int, Callable[..., Any]) -> Any
     """Parse a CONNACK packet
 
     :param data: Data to parse
 
+    :param offset: Offset of the fixed header of the packet
+
+    :param remaining_length: Remaining length field parsed
+        from the packet.
+
     :param variable_begin: Offset of start of variable length header
 
     :raises: MQTTParseError if packet is malformed
@@ -40,7 +84,7 @@ def parse_connack(data, remaining_length, variable_begin):
     if (ack_flags & 0xFE) != 0:
         raise _errors.MQTTParseError("Reserved bits not clear")
 
-    return _packet.ConnackPacket(
+    return handler(
         rc,
         ack_flags
     )
@@ -48,19 +92,24 @@ def parse_connack(data, remaining_length, variable_begin):
 
 _PINGRESP = _packet.PingrespPacket()
 
-def parse_pingresp(_data, _length, _variable_begin):
+def parse_pingresp(_data, _offset, _length, _variable_begin, handler=None):
     """
     Parse a PINGRESP, consume and discard.
     """
-    return _PINGRESP
+    if handler is None:
+        return _PINGRESP
+    return handler()
 
 
-def parse_suback(data, remaining_length, variable_begin):
+def parse_suback(data, _offset, remaining_length, variable_begin,
+                 handler=_packet.SubackPacket):
     """
     Parse a SUBACK packet.
 
     :param data: The data to parse.
 
+    :param offset: Offset of the fixed header of the packet
+
     :param remaining_length: Remaining length field parsed
         from the packet.
 
@@ -72,43 +121,70 @@ def parse_suback(data, remaining_length, variable_begin):
     end_payload = remaining_length + variable_begin
     packet_id = (data[variable_begin] << 8) | data[variable_begin+1]
     variable_begin += 2
-    return _packet.SubackPacket(
+    return handler(
         packet_id,
         [rc for rc in data[variable_begin:end_payload]]
     )
 
 
 
-def parse_publish(data, remaining_length, variable_begin):
-    # type: (bytearray, int, int) -> _packet.PublishPacket
+def parse_publish(data, offset, remaining_length, variable_begin,
+                  handler=_packet.PublishPacket):
+    # type: (bytearray, int, int, int, Callable[..., Any]) -> Any
     """Parse a PUBLISH packet.
 
-    :param data: Incoming data to parse.
-    :type data: bytearray
+    :param data: Incoming data to parse.  If data is a memoryview the
+        payload of the packet is a memoryview into the same buffer.
+    :type data: bytearray or memoryview
+
+    :param offset: Offset of the fixed header of the packet
+
+    :param remaining_length: Remaining length field parsed
+        from the packet.
 
     :param variable_begin: Offset of start of variable length header
 
-    :param output: List of result messages
+    :param handler: Called with the fields of the packet, defaults to
+        :class:`PublishPacket`.
+
+    The topic is not decoded, see :class:`PublishPacket`.
+
+    :raises: MQTTParseError if the topic does not fit in the packet.
 
-    :returns: number of bytes consumed.
+    :raises: MQTTInvalidPacketError if both QoS bits are set.
+
+    :returns: The parsed packet.
 
     """
-    flags = data[0] & 0x0F
+    if six.PY2 and isinstance(data, memoryview):
+        return _parse_publish_view(data, offset, remaining_length,
+                                   variable_begin, handler)
+
+    flags = data[offset] & 0x0F
     qos = (flags & 0x06) >> 1
+    if qos == 3:
+        raise _errors.MQTTInvalidPacketError("Invalid QoS 3 in PUBLISH")
 
     end_packet = remaining_length + variable_begin
+    if remaining_length < _constants.STRING_LENGTH_BYTES:
+        raise _errors.MQTTParseError("Remaining length invalid")
 
     topic_len = (data[variable_begin] << 8) | data[variable_begin+1]
     variable_begin += 2
-    topic = data[variable_begin:variable_begin+topic_len].decode('utf-8')
-    # Check for wildcard chars
+    topic_end = variable_begin + topic_len
+    if qos:
+        topic_end += _constants.PACKET_ID_LEN
+    if topic_end > end_packet:
+        raise _errors.MQTTParseError("Topic length exceeds packet")
+
+    topic = bytes(data[variable_begin:variable_begin+topic_len])
     variable_begin += topic_len
     packetid = None
     if qos:
         packetid = (data[variable_begin] << 8) | data[variable_begin+1]
         variable_begin += 2
 
-    return _packet.PublishPacket(
+    return handler(
         (flags & 0x08) >> 3,
         qos,
         flags & 0x1,
@@ -118,109 +194,495 @@ def parse_publish(data, remaining_length, variable_begin):
     )
 
 
-def parse_disconnect(data, _remaining_length, _offset):
-    # type: (bytearray, int, int) -> _packet.DisconnectPacket
+def parse_disconnect(data, offset, _remaining_length, _variable_begin,
+                     handler=_packet.DisconnectPacket):
+    # type: (bytearray, int, int, int, Callable[..., Any]) -> Any
     """Parse a DISCONNECT packet and validate"""
-    return _packet.DisconnectPacket(data[0] & 0x0f)
+    return handler(data[offset] & 0x0f)
 
 
-def parse_puback(data, remaining_length, offset):
-    """Parse a puback from a payload."""
+def _parse_packet_id(data, remaining_length, variable_begin, name):
+    # type: (bytearray, int, int, str) -> int
+    """Parse the packet id of a packet that only contains a packet id."""
     if remaining_length != 2:
         raise _errors.MQTTInvalidPacketError(
-            'Remaining length should be 2 for PUBACK'
+            'Remaining length should be 2 for {}'.format(name)
         )
-    return _packet.PubackPacket(
-        (data[offset] << 8) | data[offset+1]
+    return (data[variable_begin] << 8) | data[variable_begin+1]
+
+
+def parse_puback(data, _offset, remaining_length, variable_begin,
+                 handler=_packet.PubackPacket):
+    """Parse a puback from a payload."""
+    return handler(
+        _parse_packet_id(data, remaining_length, variable_begin, 'PUBACK')
+    )
+
+
+def parse_pubrec(data, _offset, remaining_length, variable_begin,
+                 handler=_packet.PubrecPacket):
+    """Parse a PUBREC packet."""
+    return handler(
+        _parse_packet_id(data, remaining_length, variable_begin, 'PUBREC')
+    )
+
+
+def parse_pubrel(data, offset, remaining_length, variable_begin,
+                 handler=_packet.PubrelPacket):
+    """Parse a PUBREL packet.
+
+    :raises: MQTTInvalidPacketError if the reserved flags are not 0010.
+    """
+    if data[offset] & 0x0F != 0x02:
+        raise _errors.MQTTInvalidPacketError(
+            'Reserved flags invalid for PUBREL'
+        )
+    return handler(
+        _parse_packet_id(data, remaining_length, variable_begin, 'PUBREL')
+    )
+
+
+def parse_pubcomp(data, _offset, remaining_length, variable_begin,
+                  handler=_packet.PubcompPacket):
+    """Parse a PUBCOMP packet."""
+    return handler(
+        _parse_packet_id(data, remaining_length, variable_begin, 'PUBCOMP')
+    )
+
+
+def parse_unsuback(data, _offset, remaining_length, variable_begin,
+                   handler=_packet.UnsubackPacket):
+    """Parse an UNSUBACK packet."""
+    return handler(
+        _parse_packet_id(data, remaining_length, variable_begin, 'UNSUBACK')
+    )
+
+
+def _read_string(data, begin, end):
+    # type: (bytearray, int, int) -> Tuple[bytes, int]
+    """Read a length prefixed string or binary field.
+
+    The field is always copied, so the packet does not hold a view of
+    data even when parsing with ``zero_copy=True``.
+
+    :raises: MQTTParseError if the field extends past end.
+
+    :returns: The field as bytes and the offset following it.
+    """
+    string_begin = begin + _constants.STRING_LENGTH_BYTES
+    if string_begin > end:
+        raise _errors.MQTTParseError("String length missing")
+
+    string_end = string_begin + ((data[begin] << 8) | data[begin+1])
+    if string_end > end:
+        raise _errors.MQTTParseError("String length exceeds packet")
+
+    return bytes(data[string_begin:string_end]), string_end
+
+
+def _read_text(data, begin, end):
+    # type: (bytearray, int, int) -> Tuple[str, int]
+    """Read a UTF-8 encoded string field.
+
+    :raises: MQTTInvalidPacketError if the field is not valid UTF-8.
+    """
+    encoded, begin = _read_string(data, begin, end)
+    try:
+        return _decode_utf8(encoded, 'strict', True)[0], begin
+    except UnicodeDecodeError:
+        raise _errors.MQTTInvalidPacketError('String is not valid UTF-8')
+
+
+_CONNECT_HEADER_LEN = 10
+
+def parse_connect(data, _offset, remaining_length, variable_begin,
+                  handler=_packet.ConnectPacket):
+    # type: (bytearray, int, int, int, Callable[..., Any]) -> Any
+    """Parse a CONNECT packet.
+
+    The protocol level is not checked, so that a server can refuse an
+    unsupported level with the appropriate CONNACK.
+
+    :raises: MQTTInvalidPacketError if the protocol name or the connect
+        flags are invalid, or a string field is not valid UTF-8.
+
+    :raises: MQTTParseError if a field extends past the packet.
+    """
+    end_packet = variable_begin + remaining_length
+    if remaining_length < _CONNECT_HEADER_LEN:
+        raise _errors.MQTTParseError("Remaining length invalid")
+
+    protocol_name, pos = _read_string(data, variable_begin, end_packet)
+    if protocol_name != _PROTOCOL_NAME:
+        raise _errors.MQTTInvalidPacketError('Invalid protocol name')
+
+    if pos + 4 > end_packet:
+        raise _errors.MQTTParseError("Remaining length invalid")
+
+    protocol_level = data[pos]
+    flags = data[pos+1]
+    keepalive = (data[pos+2] << 8) | data[pos+3]
+    pos += 4
+
+    if flags & 0x01:
+        raise _errors.MQTTInvalidPacketError('Reserved connect flag set')
+
+    will_qos = (flags & 0x18) >> 3
+    will_retain = bool(flags & 0x20)
+    if flags & 0x04:
+        if will_qos not in _constants.VALID_QOS:
+            raise _errors.MQTTInvalidPacketError('Invalid will QoS')
+    elif will_qos or will_retain:
+        raise _errors.MQTTInvalidPacketError('Will QoS or retain without will')
+
+    if flags & 0x40 and not flags & 0x80:
+        raise _errors.MQTTInvalidPacketError('Password without username')
+
+    client_id, pos = _read_text(data, pos, end_packet)
+
+    will_topic = will_message = username = password = None
+    if flags & 0x04:
+        will_topic, pos = _read_text(data, pos, end_packet)
+        will_message, pos = _read_string(data, pos, end_packet)
+
+    if flags & 0x80:
+        username, pos = _read_text(data, pos, end_packet)
+
+    if flags & 0x40:
+        password, pos = _read_string(data, pos, end_packet)
+
+    if pos != end_packet:
+        raise _errors.MQTTParseError("Unexpected data after CONNECT payload")
+
+    return handler(
+        protocol_level,
+        bool(flags & 0x02),
+        keepalive,
+        client_id,
+        will_topic,
+        will_message,
+        will_qos,
+        will_retain,
+        username,
+        password,
     )
 
 
-def _null_parse(_data, _remaining_length, _offset):
-    # type: (bytearray, int, int) -> None
-    """Empty parser"""
+def parse_subscribe(data, offset, remaining_length, variable_begin,
+                    handler=_packet.SubscribePacket):
+    # type: (bytearray, int, int, int, Callable[..., Any]) -> Any
+    """Parse a SUBSCRIBE packet.
+
+    Topic filters are not decoded, see :class:`Subscription`.
+
+    :raises: MQTTInvalidPacketError if the reserved flags are not 0010,
+        there are no subscriptions or a requested QoS is invalid.
+
+    :raises: MQTTParseError if a topic filter extends past the packet.
+    """
+    if data[offset] & 0x0F != 0x02:
+        raise _errors.MQTTInvalidPacketError(
+            'Reserved flags invalid for SUBSCRIBE'
+        )
+
+    if remaining_length <= _constants.PACKET_ID_LEN:
+        raise _errors.MQTTInvalidPacketError(
+            'SUBSCRIBE must contain a subscription'
+        )
+
+    end_packet = variable_begin + remaining_length
+    packet_id = (data[variable_begin] << 8) | data[variable_begin+1]
+    pos = variable_begin + _constants.PACKET_ID_LEN
+
+    subscriptions = []
+    while pos < end_packet:
+        topicfilter, pos = _read_string(data, pos, end_packet)
+        if pos >= end_packet:
+            raise _errors.MQTTParseError("Requested QoS missing")
+        qos = data[pos]
+        if qos not in _constants.VALID_QOS:
+            raise _errors.MQTTInvalidPacketError('Invalid requested QoS')
+        pos += 1
+        subscriptions.append(_packet.Subscription(topicfilter, qos))
+
+    return handler(packet_id, subscriptions)
+
+
+def parse_unsubscribe(data, _offset, remaining_length, variable_begin,
+                      handler=_packet.UnsubscribePacket):
+    # type: (bytearray, int, int, int, Callable[..., Any]) -> Any
+    """Parse an UNSUBSCRIBE packet.
+
+    The reserved flags are not checked, as :func:`unsubscribe` has
+    always set them to 0001 rather than 0010.  Topic filters are not
+    decoded, see :class:`UnsubscribePacket`.
 
+    :raises: MQTTInvalidPacketError if there are no topic filters.
 
+    :raises: MQTTParseError if a topic filter extends past the packet.
+    """
+    if remaining_length <= _constants.PACKET_ID_LEN:
+        raise _errors.MQTTInvalidPacketError(
+            'UNSUBSCRIBE must contain a topic filter'
+        )
+
+    end_packet = variable_begin + remaining_length
+    packet_id = (data[variable_begin] << 8) | data[variable_begin+1]
+    pos = variable_begin + _constants.PACKET_ID_LEN
+
+    topicfilters = []
+    while pos < end_packet:
+        topicfilter, pos = _read_string(data, pos, end_packet)
+        topicfilters.append(topicfilter)
+
+    return handler(packet_id, topicfilters)
+
+
+_PINGREQ = _packet.PingreqPacket()
+
+def parse_pingreq(_data, _offset, _length, _variable_begin, handler=None):
+    """
+    Parse a PINGREQ, consume and discard.
+    """
+    if handler is None:
+        return _PINGREQ
+    return handler()
+
+
+# Each parser passes the fields of the packet to handler, in the order of
+# the attributes of the packet class, and returns its result.  handler
+# defaults to the packet class; PINGREQ and PINGRESP return a shared
+# packet unless a handler is given.
 PARSERS = {
-    _constants.MQTT_PACKET_CONNECT: _null_parse,
+    _constants.MQTT_PACKET_CONNECT: parse_connect,
     _constants.MQTT_PACKET_CONNACK: parse_connack,
     _constants.MQTT_PACKET_PUBLISH: parse_publish,
     _constants.MQTT_PACKET_PUBACK: parse_puback,
-    _constants.MQTT_PACKET_PUBREC: _null_parse,
-    _constants.MQTT_PACKET_PUBREL: _null_parse,
-    _constants.MQTT_PACKET_PUBCOMP: _null_parse,
-    _constants.MQTT_PACKET_SUBSCRIBE: _null_parse,
+    _constants.MQTT_PACKET_PUBREC: parse_pubrec,
+    _constants.MQTT_PACKET_PUBREL: parse_pubrel,
+    _constants.MQTT_PACKET_PUBCOMP: parse_pubcomp,
+    _constants.MQTT_PACKET_SUBSCRIBE: parse_subscribe,
     _constants.MQTT_PACKET_SUBACK: parse_suback,
-    _constants.MQTT_PACKET_UNSUBSCRIBE: _null_parse,
-    _constants.MQTT_PACKET_UNSUBACK: _null_parse,
-    _constants.MQTT_PACKET_PINGREQ: _null_parse,
+    _constants.MQTT_PACKET_UNSUBSCRIBE: parse_unsubscribe,
+    _constants.MQTT_PACKET_UNSUBACK: parse_unsuback,
+    _constants.MQTT_PACKET_PINGREQ: parse_pingreq,
     _constants.MQTT_PACKET_PINGRESP: parse_pingresp,
     _constants.MQTT_PACKET_DISCONNECT: parse_disconnect,
-} # type: Dict[int, Callable[[bytearray, int, int], Any]]
+} # type: Dict[int, Callable[..., Any]]
+
+
+def iter_frames(data, start=0):
+    # type: (bytearray, int) -> Iterator[Tuple[int, int, int, int, int]]
+    """Find the complete packets in data.
+
+    This is the frame loop shared by every parser of a buffer.  Only the
+    fixed header of each packet is decoded.  Iteration stops at the
+    first incomplete packet, which starts at the end of the last packet
+    found.  data must not be resized while it is iterated.
 
+    :param data: Data containing MQTT packets.
 
-_MULTIPLIERS = (1, 128, 128 * 128, 128 * 128 * 128, 0)
-_MAX_REMAINING_LENGTH = 268435455
+    :param start: The offset in data of the first packet.
 
-def check_total_len(data, offset, remaining_length, variable_begin):
-    # type: (ByteString, int, int, int) -> bool
-    """Verify enough data is available"""
-    size_rem_len = variable_begin - offset - 1
-    return (len(data) - offset) == (remaining_length + 1 + size_rem_len)
+    :raises: MQTTParseError if the remaining length is malformed.
 
-def parse(data, output):
-    # type: (ByteString, List[Any]) -> int
+    :raises: MQTTInvalidPacketError if the packet type is reserved.
+
+    :returns: An iterator of ``(pkt_type, flags, start, variable_begin,
+        end)`` for each complete packet.
+    """
+    decode_remaining_length = _varint.decode_remaining_length
+    offset = start
+    data_len = len(data)
+    while offset < data_len:
+        byte1 = data[offset]
+        remaining_length, variable_begin = decode_remaining_length(
+            data,
+            offset + 1,
+            data_len,
+        )
+        if remaining_length < 0:
+            return
+
+        end_packet = variable_begin + remaining_length
+        if end_packet > data_len:
+            return
+
+        pkt_type = byte1 >> 4
+        if not (_constants.MQTT_PACKET_CONNECT <= pkt_type
+                < _constants.MQTT_PACKET_MAX):
+            raise _errors.MQTTInvalidPacketError(
+                'Invalid packet type {}'.format(pkt_type)
+            )
+
+        yield pkt_type, byte1 & 0x0F, offset, variable_begin, end_packet
+        offset = end_packet
+
+
+def parse(data, output, zero_copy=False):
+    # type: (ByteString, List[Any], bool) -> int
     """Parse packets from data.
 
+    Every complete packet in data is parsed and appended to output.
+    Parsing stops at the first incomplete packet, whose bytes are left
+    unconsumed so they can be parsed once the rest of the packet has
+    been received.
+
     :param data: Data to parse into MQTT packets
 
     :param output: Output list for storing parsed packets.
 
+    :param zero_copy: If True, the payload of each parsed PUBLISH is a
+        memoryview into data rather than a copy.  A bytearray cannot be
+        resized while a memoryview of it exists, so every payload must be
+        released (``payload.release()``) or dropped before consumed bytes
+        are removed from data, and any payload that must outlive that
+        should be copied with ``payload.tobytes()`` first.
+
+    :raises: MQTTParseError if the remaining length is malformed.
+
+    :raises: MQTTInvalidPacketError if the packet type is reserved.
+
     :returns: number of bytes from data consumed
 
     """
     if not isinstance(data, bytearray):
         raise TypeError("data must be a bytearray")
 
+    view = memoryview(data) if zero_copy else data
     consumed = 0
-    offset = 0
-
-    while offset < len(data):
-        pkt_type = data[offset] >> 4
-        variable_begin = offset + 1
-        remaining_length = 0
-        parsing_len = True
-        nb = 0
-        while parsing_len:
-            remaining_length += (data[variable_begin] & 127) * _MULTIPLIERS[nb]
-            nb += 1
-            parsing_len = (
-                variable_begin < len(data)
-                and (nb < 5)
-                and ((data[variable_begin] & 128) != 0)
-            )
-            variable_begin += 1
-
-        if nb == 5:
-            raise _errors.MQTTParseError("Invalid remaining length")
-
-        size_rem_len = variable_begin - offset - 1
-
-        if not check_total_len(data, offset, remaining_length, variable_begin):
-            return consumed
-
+    for pkt_type, _, offset, variable_begin, end_packet in iter_frames(data):
         try:
             r = PARSERS[pkt_type](
-                data,
-                remaining_length,
+                view if pkt_type == _constants.MQTT_PACKET_PUBLISH else data,
+                offset,
+                end_packet - variable_begin,
                 variable_begin,
             )
-        except KeyError:
-            offset += 1
         except _errors.MQTTMoreDataNeededError:
-            return consumed
-        else:
-            consumed += size_rem_len + 1 + remaining_length
-            offset += consumed
-            output.append(r)
+            return offset
+
+        output.append(r)
+        consumed = end_packet
 
     return consumed
+
+
+class CallbackParser(object):
+    """
+    Parse packets by calling a handler per packet type.
+
+    A handler is called with the fields of a packet, in the order of the
+    attributes of its packet class, instead of the packet being created
+    and appended to a list::
+
+        def on_publish(dup, qos, retain, topic_bytes, packet_id, payload):
+            ...
+
+        parser = CallbackParser()
+        parser.register(MQTT_PACKET_PUBLISH, on_publish)
+        parser.register(MQTT_PACKET_PUBACK, session.on_puback)
+        consumed = parser.parse(data)
+
+    Packets of a type without a handler are skipped without being
+    parsed.  Registering the packet class as the handler produces the
+    same packet as :func:`parse`.
+    """
+
+    def __init__(self):
+        # type: () -> None
+        self._handlers = {}  # type: Dict[int, Tuple[Callable[..., Any], Callable[..., Any]]]
+
+    def register(self, pkt_type, handler, parser=None):
+        # type: (int, Callable[..., Any], Optional[Callable[..., Any]]) -> None
+        """Set the handler for a packet type.
+
+        :param pkt_type: The packet type, such as MQTT_PACKET_PUBLISH.
+
+        :param handler: Called with the fields of each packet.
+
+        :param parser: The parser used for this instance, with the
+            signature of the entries of PARSERS.  Defaults to the
+            current entry of PARSERS for the packet type.  When parsing
+            with ``zero_copy=True`` the PUBLISH parser is passed a
+            memoryview of the data, and every other parser the data.
+
+        :raises: ValueError if the packet type is reserved.
+        """
+        if parser is None:
+            try:
+                parser = PARSERS[pkt_type]
+            except KeyError:
+                raise ValueError('Invalid packet type {}'.format(pkt_type))
+        self._handlers[pkt_type] = (parser, handler)
+
+    def unregister(self, pkt_type):
+        # type: (int) -> None
+        """Remove the handler for a packet type.
+
+        :raises: KeyError if no handler is registered.
+        """
+        del self._handlers[pkt_type]
+
+    def parse(self, data, zero_copy=False):
+        # type: (bytearray, bool) -> int
+        """Parse packets from data, calling the registered handlers.
+
+        See :func:`parse` for the parameters and errors.  If a handler
+        raises, the exception propagates and the packets before the one
+        being handled have been consumed.
+
+        :returns: number of bytes from data consumed
+        """
+        if not isinstance(data, bytearray):
+            raise TypeError("data must be a bytearray")
+
+        view = memoryview(data) if zero_copy else data
+        handlers = self._handlers
+        frames = iter_frames(data)
+        consumed = 0
+        for pkt_type, _, offset, variable_begin, end_packet in frames:
+            entry = handlers.get(pkt_type)
+            if entry is not None:
+                parser, handler = entry
+                try:
+                    parser(
+                        view if pkt_type == _constants.MQTT_PACKET_PUBLISH
+                        else data,
+                        offset,
+                        end_packet - variable_begin,
+                        variable_begin,
+                        handler,
+                    )
+                except _errors.MQTTMoreDataNeededError:
+                    return offset
+
+            consumed = end_packet
+
+        return consumed
+
+
+def scan_frames(data):
+    # type: (bytearray) -> Iterator[Tuple[int, int, int, int]]
+    """Find the packets in data without parsing them.
+
+    Only the fixed header of each packet is decoded, so packets can be
+    forwarded unchanged without building packet objects.  Scanning stops
+    at the first incomplete packet, which starts at the end of the last
+    packet found.  data must not be modified while it is scanned.
+
+    :param data: Data containing MQTT packets.
+    :type data: bytearray
+
+    :raises: MQTTParseError if the remaining length is malformed.
+
+    :raises: MQTTInvalidPacketError if the packet type is reserved.
+
+    :returns: An iterator of ``(pkt_type, flags, start, end)`` for each
+        complete packet, where ``data[start:end]`` is the whole packet.
+    """
+    if not isinstance(data, bytearray):
+        raise TypeError("data must be a bytearray")
+
+    for pkt_type, flags, start, _, end in iter_frames(data):
+        yield pkt_type, flags, start, end
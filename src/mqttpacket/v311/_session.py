@@ -0,0 +1,237 @@
+"""
+Copyright 2018 Jason Litzinger
+See LICENSE for details.
+
+Client session state for QoS 1 and 2 message flows.
+"""
+from __future__ import absolute_import
+import collections
+from typing import Any, List, Optional, Set, Union  # pylint: disable=unused-import
+
+import six
+
+from . import _builders, _constants
+
+# What an in-flight packet id is waiting for.
+_AWAIT_PUBACK = _constants.MQTT_PACKET_PUBACK
+_AWAIT_PUBREC = _constants.MQTT_PACKET_PUBREC
+_AWAIT_PUBCOMP = _constants.MQTT_PACKET_PUBCOMP
+_AWAIT_SUBACK = _constants.MQTT_PACKET_SUBACK
+_AWAIT_UNSUBACK = _constants.MQTT_PACKET_UNSUBACK
+
+_DUP = 0x08
+
+
+class _PacketIds(object):
+    """
+    Allocate packet ids in constant time.
+
+    Ids that have never been used are handed out in order, after which
+    released ids are reused from a free list.
+    """
+    __slots__ = ('_next', '_free')
+
+    def __init__(self):
+        # type: () -> None
+        self._next = 1
+        self._free = []  # type: List[int]
+
+    def allocate(self):
+        # type: () -> int
+        """Allocate an unused packet id.
+
+        :raises: ValueError if every packet id is in use.
+        """
+        if self._free:
+            return self._free.pop()
+        packet_id = self._next
+        if packet_id > _constants.MAX_PACKET_ID:
+            raise ValueError('No packet identifiers are available')
+        self._next = packet_id + 1
+        return packet_id
+
+    def release(self, packet_id):
+        # type: (int) -> None
+        """Return a packet id to be reused."""
+        self._free.append(packet_id)
+
+
+class _Inflight(object):
+    """An outgoing packet waiting to be acknowledged."""
+    __slots__ = ('awaiting', 'data')
+
+    def __init__(self, awaiting, data):
+        # type: (int, bytes) -> None
+        self.awaiting = awaiting
+        self.data = data
+
+
+class Session(object):
+    """
+    The client side state of the QoS 1 and 2 message flows.
+
+    The session performs no I/O.  Packets to send are built by its
+    methods and collected with :meth:`data_to_send`, and parsed packets
+    are passed to :meth:`receive`::
+
+        session = Session()
+        session.publish(u'a/b', b'payload', qos=1)
+        transport.writelines(session.data_to_send())
+
+        for packet in decoder:
+            event = session.receive(packet)
+            transport.writelines(session.data_to_send())
+
+    Packet ids are allocated and matched with their acknowledgements
+    in constant time, however many are in flight.
+
+    After reconnecting without a clean session, :meth:`retransmit`
+    resends every unacknowledged PUBLISH with DUP set, and every
+    unacknowledged PUBREL, in their original order.
+    """
+
+    def __init__(self):
+        # type: () -> None
+        self._packet_ids = _PacketIds()
+        self._inflight = collections.OrderedDict()  # type: collections.OrderedDict
+        self._received = set()  # type: Set[int]
+        self._outgoing = []  # type: List[Union[bytes, memoryview]]
+
+    def __len__(self):
+        # type: () -> int
+        """Number of packet ids waiting for an acknowledgement."""
+        return len(self._inflight)
+
+    def __contains__(self, packet_id):
+        # type: (int) -> bool
+        return packet_id in self._inflight
+
+    def data_to_send(self):
+        # type: () -> List[Union[bytes, memoryview]]
+        """Get and clear the data to send.
+
+        A retransmitted PUBLISH is split into its header byte and a
+        memoryview of the rest of the packet, so pass the list to
+        ``writelines`` rather than treating each item as a packet.
+        """
+        outgoing = self._outgoing
+        self._outgoing = []
+        return outgoing
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        # type: (str, bytes, int, bool) -> Optional[int]
+        """Publish a message.
+
+        See :func:`publish` for the parameters.
+
+        :returns: The packet id of a QoS 1 or 2 message, or None.
+        """
+        if not qos:
+            self._outgoing.append(
+                _builders.publish(topic, False, qos, retain, payload)
+            )
+            return None
+
+        return self._track(
+            _AWAIT_PUBACK if qos == 1 else _AWAIT_PUBREC,
+            lambda packet_id: _builders.publish(
+                topic, False, qos, retain, payload, packet_id
+            ),
+        )
+
+    def subscribe(self, topicspecs):
+        # type: (List[_builders.SubscriptionSpec]) -> int
+        """Subscribe to topic filters.
+
+        :returns: The packet id of the SUBSCRIBE.
+        """
+        return self._track(
+            _AWAIT_SUBACK,
+            lambda packet_id: _builders.subscribe(packet_id, topicspecs),
+        )
+
+    def unsubscribe(self, topics):
+        # type: (List[str]) -> int
+        """Unsubscribe from topic filters.
+
+        :returns: The packet id of the UNSUBSCRIBE.
+        """
+        return self._track(
+            _AWAIT_UNSUBACK,
+            lambda packet_id: _builders.unsubscribe(packet_id, topics),
+        )
+
+    def receive(self, packet):
+        # type: (Any) -> Any
+        """Update the session with a received packet.
+
+        Any reply the packet requires is queued to be sent.
+
+        :returns: The packet if it completes a message flow or delivers
+            a message: a PUBLISH that was not already received, or a
+            PUBACK, PUBCOMP, SUBACK or UNSUBACK of an in-flight packet
+            id.  Otherwise None.
+        """
+        pkt_type = packet.pkt_type
+        if pkt_type == _constants.MQTT_PACKET_PUBLISH:
+            return self._receive_publish(packet)
+
+        if pkt_type == _constants.MQTT_PACKET_PUBREL:
+            self._received.discard(packet.packet_id)
+            self._outgoing.append(_builders.pubcomp(packet.packet_id))
+            return None
+
+        inflight = self._inflight.get(getattr(packet, 'packet_id', None))
+        if inflight is None or inflight.awaiting != pkt_type:
+            return None
+
+        if pkt_type == _AWAIT_PUBREC:
+            inflight.awaiting = _AWAIT_PUBCOMP
+            inflight.data = _builders.pubrel(packet.packet_id)
+            self._outgoing.append(inflight.data)
+            return None
+
+        del self._inflight[packet.packet_id]
+        self._packet_ids.release(packet.packet_id)
+        return packet
+
+    def retransmit(self):
+        # type: () -> None
+        """Queue every unacknowledged PUBLISH and PUBREL to be resent."""
+        for inflight in self._inflight.values():
+            if inflight.awaiting in (_AWAIT_PUBACK, _AWAIT_PUBREC):
+                data = inflight.data
+                # Only the first byte changes, so the rest of the packet
+                # is sent from the original without copying it.
+                self._outgoing.append(
+                    six.int2byte(six.indexbytes(data, 0) | _DUP)
+                )
+                self._outgoing.append(memoryview(data)[1:])
+            elif inflight.awaiting == _AWAIT_PUBCOMP:
+                self._outgoing.append(inflight.data)
+
+    def _track(self, awaiting, build):
+        # type: (int, Any) -> int
+        """Allocate a packet id, build a packet with it and queue it."""
+        packet_id = self._packet_ids.allocate()
+        try:
+            data = build(packet_id)
+        except Exception:
+            self._packet_ids.release(packet_id)
+            raise
+        self._inflight[packet_id] = _Inflight(awaiting, data)
+        self._outgoing.append(data)
+        return packet_id
+
+    def _receive_publish(self, packet):
+        # type: (Any) -> Any
+        qos = packet.qos
+        if qos == 1:
+            self._outgoing.append(_builders.puback(packet.packetid))
+        elif qos == 2:
+            self._outgoing.append(_builders.pubrec(packet.packetid))
+            # A retransmitted message is delivered only once.
+            if packet.packetid in self._received:
+                return None
+            self._received.add(packet.packetid)
+        return packet
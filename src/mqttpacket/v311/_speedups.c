@@ -0,0 +1,682 @@
+/*
+ * Copyright 2018 Jason Litzinger
+ * See LICENSE for details.
+ *
+ * Optional C implementations of the hot paths of the v311 parser and
+ * builders.  Every function here has a pure Python counterpart with the
+ * same semantics, see _backend.py for how one or the other is selected.
+ */
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+
+#define MQTT_PACKET_CONNECT 1
+#define MQTT_PACKET_PUBLISH 3
+#define MQTT_PACKET_MAX 15
+#define MAX_REMAINING_LENGTH 268435455
+#define STRING_LENGTH_BYTES 2
+#define PACKET_ID_LEN 2
+
+static PyObject *MQTTParseError;
+static PyObject *MQTTInvalidPacketError;
+static PyObject *PublishPacket;
+static PyObject *StructError;
+
+static Py_ssize_t
+remaining_length_size(Py_ssize_t remaining_length)
+{
+    if (remaining_length < 128) {
+        return 1;
+    }
+    if (remaining_length < 16384) {
+        return 2;
+    }
+    if (remaining_length < 2097152) {
+        return 3;
+    }
+    return 4;
+}
+
+static unsigned char *
+write_remaining_length(unsigned char *p, Py_ssize_t remaining_length)
+{
+    while (remaining_length > 127) {
+        *p++ = (unsigned char)((remaining_length & 0x7F) | 0x80);
+        remaining_length >>= 7;
+    }
+    *p++ = (unsigned char)remaining_length;
+    return p;
+}
+
+static int
+check_remaining_length(Py_ssize_t remaining_length)
+{
+    if (remaining_length < 0 || remaining_length > MAX_REMAINING_LENGTH) {
+        PyErr_Format(
+            PyExc_ValueError,
+            "Remaining length must be 0 <= remaining length <= %d",
+            MAX_REMAINING_LENGTH
+        );
+        return -1;
+    }
+    return 0;
+}
+
+/* Get the contents of data.  A bytearray is read directly, other objects
+ * through the buffer protocol, in which case view must be released with
+ * release_data.
+ */
+static int
+get_data(PyObject *data, Py_buffer *view, const unsigned char **buf,
+         Py_ssize_t *len)
+{
+    if (PyByteArray_CheckExact(data)) {
+        view->obj = NULL;
+        *buf = (const unsigned char *)PyByteArray_AS_STRING(data);
+        *len = PyByteArray_GET_SIZE(data);
+        return 0;
+    }
+    if (PyObject_GetBuffer(data, view, PyBUF_SIMPLE) < 0) {
+        return -1;
+    }
+    *buf = (const unsigned char *)view->buf;
+    *len = view->len;
+    return 0;
+}
+
+static void
+release_data(Py_buffer *view)
+{
+    if (view->obj != NULL) {
+        PyBuffer_Release(view);
+    }
+}
+
+#if PY_VERSION_HEX >= 0x03070000
+#define SPEEDUPS_FASTCALL 1
+#define SPEEDUPS_ARGS METH_FASTCALL
+#else
+#define SPEEDUPS_ARGS METH_VARARGS
+#endif
+
+#ifdef SPEEDUPS_FASTCALL
+/* Unpack positional Py_ssize_t arguments following the data argument. */
+static int
+unpack_args(PyObject *const *args, Py_ssize_t nargs, const char *name,
+            Py_ssize_t expected, PyObject **data, Py_ssize_t *values)
+{
+    Py_ssize_t i;
+    if (nargs != expected + 1) {
+        PyErr_Format(PyExc_TypeError, "%s expected %zd arguments, got %zd",
+                     name, expected + 1, nargs);
+        return -1;
+    }
+    *data = args[0];
+    for (i = 0; i < expected; i++) {
+        values[i] = PyNumber_AsSsize_t(args[i + 1], PyExc_OverflowError);
+        if (values[i] == -1 && PyErr_Occurred()) {
+            return -1;
+        }
+    }
+    return 0;
+}
+#endif
+
+PyDoc_STRVAR(decode_remaining_length_doc,
+"decode_remaining_length(data, begin, end) -> (remaining_length, variable_begin)\n\
+\n\
+Decode the remaining length field of a fixed header.");
+
+static PyObject *
+decode_remaining_length(PyObject *data, Py_ssize_t begin, Py_ssize_t end)
+{
+    Py_ssize_t len, pos;
+    Py_buffer view;
+    const unsigned char *buf;
+    Py_ssize_t remaining_length = 0;
+    int shift;
+
+    if (get_data(data, &view, &buf, &len) < 0) {
+        return NULL;
+    }
+    pos = begin;
+    for (shift = 0; shift < 28; shift += 7) {
+        unsigned char encoded_byte;
+        if (pos >= end) {
+            release_data(&view);
+            return Py_BuildValue("nn", (Py_ssize_t)-1, begin);
+        }
+        if (pos < 0 || pos >= len) {
+            release_data(&view);
+            PyErr_SetString(PyExc_IndexError, "index out of range");
+            return NULL;
+        }
+        encoded_byte = buf[pos++];
+        remaining_length |= (Py_ssize_t)(encoded_byte & 0x7F) << shift;
+        if (encoded_byte < 0x80) {
+            release_data(&view);
+            return Py_BuildValue("nn", remaining_length, pos);
+        }
+    }
+
+    release_data(&view);
+    PyErr_SetString(MQTTParseError, "Invalid remaining length");
+    return NULL;
+}
+
+#ifdef SPEEDUPS_FASTCALL
+static PyObject *
+speedups_decode_remaining_length(PyObject *self, PyObject *const *args,
+                                 Py_ssize_t nargs)
+{
+    PyObject *data;
+    Py_ssize_t values[2];
+    if (unpack_args(args, nargs, "decode_remaining_length", 2,
+                    &data, values) < 0) {
+        return NULL;
+    }
+    return decode_remaining_length(data, values[0], values[1]);
+}
+#else
+static PyObject *
+speedups_decode_remaining_length(PyObject *self, PyObject *args)
+{
+    PyObject *data;
+    Py_ssize_t begin, end;
+    if (!PyArg_ParseTuple(args, "Onn:decode_remaining_length",
+                          &data, &begin, &end)) {
+        return NULL;
+    }
+    return decode_remaining_length(data, begin, end);
+}
+#endif
+
+PyDoc_STRVAR(encode_remaining_length_doc,
+"encode_remaining_length(remaining_length) -> bytes\n\
+\n\
+Encode the remaining length for the packet.");
+
+static PyObject *
+speedups_encode_remaining_length(PyObject *self, PyObject *arg)
+{
+    unsigned char encoded[4];
+    unsigned char *end;
+    Py_ssize_t remaining_length = PyNumber_AsSsize_t(arg, NULL);
+
+    if (remaining_length == -1 && PyErr_Occurred()) {
+        return NULL;
+    }
+    if (check_remaining_length(remaining_length) < 0) {
+        return NULL;
+    }
+    end = write_remaining_length(encoded, remaining_length);
+    return PyBytes_FromStringAndSize((const char *)encoded, end - encoded);
+}
+
+PyDoc_STRVAR(parse_publish_doc,
+"parse_publish(data, offset, remaining_length, variable_begin, handler=PublishPacket)\n\
+\n\
+Parse a PUBLISH packet, passing its fields to handler.");
+
+static PyObject *
+parse_publish(PyObject *data, Py_ssize_t offset, Py_ssize_t remaining_length,
+              Py_ssize_t variable_begin, PyObject *handler)
+{
+    Py_ssize_t len, end_packet;
+    Py_ssize_t topic_len, topic_end;
+    Py_buffer view;
+    const unsigned char *buf;
+    int flags, qos;
+    PyObject *topic = NULL;
+    PyObject *packetid = NULL;
+    PyObject *payload = NULL;
+    PyObject *packet = NULL;
+
+    if (get_data(data, &view, &buf, &len) < 0) {
+        return NULL;
+    }
+
+    end_packet = variable_begin + remaining_length;
+    if (offset < 0 || offset >= len || variable_begin < 0
+            || remaining_length < 0 || end_packet > len) {
+        release_data(&view);
+        PyErr_SetString(PyExc_IndexError, "index out of range");
+        return NULL;
+    }
+
+    flags = buf[offset] & 0x0F;
+    qos = (flags & 0x06) >> 1;
+    if (qos == 3) {
+        release_data(&view);
+        PyErr_SetString(MQTTInvalidPacketError, "Invalid QoS 3 in PUBLISH");
+        return NULL;
+    }
+
+    if (remaining_length < STRING_LENGTH_BYTES) {
+        release_data(&view);
+        PyErr_SetString(MQTTParseError, "Remaining length invalid");
+        return NULL;
+    }
+
+    topic_len = (buf[variable_begin] << 8) | buf[variable_begin + 1];
+    variable_begin += STRING_LENGTH_BYTES;
+    topic_end = variable_begin + topic_len;
+    if (qos) {
+        topic_end += PACKET_ID_LEN;
+    }
+    if (topic_end > end_packet) {
+        release_data(&view);
+        PyErr_SetString(MQTTParseError, "Topic length exceeds packet");
+        return NULL;
+    }
+
+    topic = PyBytes_FromStringAndSize(
+        (const char *)buf + variable_begin,
+        topic_len
+    );
+    variable_begin += topic_len;
+    if (qos) {
+        packetid = PyLong_FromLong(
+            (buf[variable_begin] << 8) | buf[variable_begin + 1]
+        );
+        variable_begin += PACKET_ID_LEN;
+    }
+    else {
+        packetid = Py_None;
+        Py_INCREF(packetid);
+    }
+    release_data(&view);
+
+    if (topic == NULL || packetid == NULL) {
+        goto done;
+    }
+
+    /* Slicing data keeps the payload type the same as the pure Python
+     * parser: a bytearray copy, or a memoryview when parsing zero copy.
+     */
+    payload = PySequence_GetSlice(data, variable_begin, end_packet);
+    if (payload == NULL) {
+        goto done;
+    }
+
+    packet = PyObject_CallFunction(
+        handler,
+        "iiiOOO",
+        (flags & 0x08) >> 3,
+        qos,
+        flags & 0x01,
+        topic,
+        packetid,
+        payload
+    );
+
+done:
+    Py_XDECREF(topic);
+    Py_XDECREF(packetid);
+    Py_XDECREF(payload);
+    return packet;
+}
+
+static PyObject *
+speedups_parse_publish(PyObject *self, PyObject *args, PyObject *kwargs)
+{
+    static char *kwlist[] = {
+        "data", "offset", "remaining_length", "variable_begin", "handler",
+        NULL
+    };
+    PyObject *data;
+    PyObject *handler = PublishPacket;
+    Py_ssize_t offset, remaining_length, variable_begin;
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "Onnn|O:parse_publish",
+                                     kwlist, &data, &offset,
+                                     &remaining_length, &variable_begin,
+                                     &handler)) {
+        return NULL;
+    }
+    return parse_publish(data, offset, remaining_length, variable_begin,
+                         handler);
+}
+
+/* The iterator returned by iter_frames.  data is read through get_data
+ * on every step, so no buffer is held between steps, and the bytearray
+ * can be resized once iteration stops, as with the Python generator.
+ */
+typedef struct {
+    PyObject_HEAD
+    PyObject *data;
+    Py_ssize_t offset;
+    Py_ssize_t end;
+} FrameIterator;
+
+static void
+frame_iterator_dealloc(FrameIterator *self)
+{
+    PyObject_GC_UnTrack(self);
+    Py_XDECREF(self->data);
+    PyObject_GC_Del(self);
+}
+
+static int
+frame_iterator_traverse(FrameIterator *self, visitproc visit, void *arg)
+{
+    Py_VISIT(self->data);
+    return 0;
+}
+
+static PyObject *
+frame_iterator_next(FrameIterator *self)
+{
+    Py_ssize_t len, end, offset, pos, remaining_length, end_packet;
+    Py_buffer view;
+    const unsigned char *buf;
+    int pkt_type, flags, shift;
+
+    offset = self->offset;
+    if (offset >= self->end) {
+        return NULL;
+    }
+    if (get_data(self->data, &view, &buf, &len) < 0) {
+        return NULL;
+    }
+    end = self->end < len ? self->end : len;
+    if (offset < 0 || offset >= end) {
+        release_data(&view);
+        self->offset = self->end;
+        return NULL;
+    }
+
+    remaining_length = 0;
+    pos = offset + 1;
+    for (shift = 0; ; shift += 7) {
+        unsigned char encoded_byte;
+        if (shift >= 28) {
+            release_data(&view);
+            self->offset = self->end;
+            PyErr_SetString(MQTTParseError, "Invalid remaining length");
+            return NULL;
+        }
+        if (pos >= end) {
+            /* The remaining length is incomplete. */
+            release_data(&view);
+            self->offset = self->end;
+            return NULL;
+        }
+        encoded_byte = buf[pos++];
+        remaining_length |= (Py_ssize_t)(encoded_byte & 0x7F) << shift;
+        if (encoded_byte < 0x80) {
+            break;
+        }
+    }
+
+    pkt_type = buf[offset] >> 4;
+    flags = buf[offset] & 0x0F;
+    release_data(&view);
+
+    end_packet = pos + remaining_length;
+    if (end_packet > end) {
+        self->offset = self->end;
+        return NULL;
+    }
+    if (pkt_type < MQTT_PACKET_CONNECT || pkt_type >= MQTT_PACKET_MAX) {
+        self->offset = self->end;
+        PyErr_Format(MQTTInvalidPacketError, "Invalid packet type %d",
+                     pkt_type);
+        return NULL;
+    }
+
+    self->offset = end_packet;
+    return Py_BuildValue("iinnn", pkt_type, flags, offset, pos, end_packet);
+}
+
+static PyTypeObject FrameIteratorType = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "mqttpacket.v311._speedups.FrameIterator",  /* tp_name */
+    sizeof(FrameIterator),                      /* tp_basicsize */
+    0,                                          /* tp_itemsize */
+    (destructor)frame_iterator_dealloc,         /* tp_dealloc */
+    0,                                          /* tp_vectorcall_offset */
+    0,                                          /* tp_getattr */
+    0,                                          /* tp_setattr */
+    0,                                          /* tp_as_async */
+    0,                                          /* tp_repr */
+    0,                                          /* tp_as_number */
+    0,                                          /* tp_as_sequence */
+    0,                                          /* tp_as_mapping */
+    0,                                          /* tp_hash */
+    0,                                          /* tp_call */
+    0,                                          /* tp_str */
+    0,                                          /* tp_getattro */
+    0,                                          /* tp_setattro */
+    0,                                          /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT | Py_TPFLAGS_HAVE_GC,    /* tp_flags */
+    0,                                          /* tp_doc */
+    (traverseproc)frame_iterator_traverse,      /* tp_traverse */
+    0,                                          /* tp_clear */
+    0,                                          /* tp_richcompare */
+    0,                                          /* tp_weaklistoffset */
+    PyObject_SelfIter,                          /* tp_iter */
+    (iternextfunc)frame_iterator_next,          /* tp_iternext */
+};
+
+PyDoc_STRVAR(iter_frames_doc,
+"iter_frames(data, start=0) -> iterator of (pkt_type, flags, start, variable_begin, end)\n\
+\n\
+Find the complete packets in data.");
+
+static PyObject *
+speedups_iter_frames(PyObject *self, PyObject *args, PyObject *kwargs)
+{
+    static char *kwlist[] = {"data", "start", NULL};
+    PyObject *data;
+    Py_ssize_t start = 0;
+    Py_ssize_t len;
+    FrameIterator *it;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|n:iter_frames",
+                                     kwlist, &data, &start)) {
+        return NULL;
+    }
+    len = PyObject_Length(data);
+    if (len < 0) {
+        return NULL;
+    }
+
+    it = PyObject_GC_New(FrameIterator, &FrameIteratorType);
+    if (it == NULL) {
+        return NULL;
+    }
+    Py_INCREF(data);
+    it->data = data;
+    it->offset = start;
+    it->end = len;
+    PyObject_GC_Track(it);
+    return (PyObject *)it;
+}
+
+PyDoc_STRVAR(publish_doc,
+"publish(topic, dup, qos, retain, payload, packet_id=None) -> bytes\n\
+\n\
+Build a PUBLISH packet.");
+
+static PyObject *
+speedups_publish(PyObject *self, PyObject *args, PyObject *kwargs)
+{
+    static char *kwlist[] = {
+        "topic", "dup", "qos", "retain", "payload", "packet_id", NULL
+    };
+    PyObject *topic, *dup, *qos_obj, *retain, *payload;
+    PyObject *packet_id = Py_None;
+    PyObject *packet;
+    const char *encoded_topic;
+    Py_ssize_t topic_len, payload_len, remaining_length;
+    long qos = -1;
+    long packet_id_value = 0;
+    int dup_set, retain_set;
+    unsigned char *p;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "OOOOO|O:publish", kwlist,
+                                     &topic, &dup, &qos_obj, &retain,
+                                     &payload, &packet_id)) {
+        return NULL;
+    }
+
+    if (PyLong_Check(qos_obj)) {
+        qos = PyLong_AsLong(qos_obj);
+        if (qos == -1 && PyErr_Occurred()) {
+            PyErr_Clear();
+        }
+    }
+    if (qos < 0 || qos > 2) {
+        PyErr_SetString(PyExc_ValueError, "QoS must be 0, 1, or 2");
+        return NULL;
+    }
+
+    if (!PyUnicode_Check(topic)) {
+        PyErr_SetString(PyExc_ValueError, "Topic must be unicode");
+        return NULL;
+    }
+
+    if (qos > 0 && packet_id == Py_None) {
+        PyErr_SetString(PyExc_ValueError,
+                        "QoS of 1 or 2 must have a packet id");
+        return NULL;
+    }
+
+    dup_set = PyObject_IsTrue(dup);
+    if (dup_set < 0) {
+        return NULL;
+    }
+    if (qos == 0 && dup_set) {
+        PyErr_SetString(PyExc_ValueError, "Dup must not be set on QoS of 0");
+        return NULL;
+    }
+
+    if (!PyBytes_Check(payload)) {
+        PyErr_SetString(PyExc_TypeError, "Payload must be bytes");
+        return NULL;
+    }
+
+    retain_set = PyObject_IsTrue(retain);
+    if (retain_set < 0) {
+        return NULL;
+    }
+
+    if (qos > 0) {
+        if (!PyLong_Check(packet_id)) {
+            PyErr_SetString(StructError,
+                            "required argument is not an integer");
+            return NULL;
+        }
+        packet_id_value = PyLong_AsLong(packet_id);
+        if ((packet_id_value == -1 && PyErr_Occurred())
+                || packet_id_value < 0 || packet_id_value > 0xFFFF) {
+            PyErr_Clear();
+            PyErr_SetString(StructError,
+                            "'H' format requires 0 <= number <= 65535");
+            return NULL;
+        }
+    }
+
+    encoded_topic = PyUnicode_AsUTF8AndSize(topic, &topic_len);
+    if (encoded_topic == NULL) {
+        return NULL;
+    }
+    if (topic_len > 0xFFFF) {
+        PyErr_SetString(StructError,
+                        "'H' format requires 0 <= number <= 65535");
+        return NULL;
+    }
+
+    payload_len = PyBytes_GET_SIZE(payload);
+    remaining_length = STRING_LENGTH_BYTES + topic_len + payload_len;
+    if (qos > 0) {
+        remaining_length += PACKET_ID_LEN;
+    }
+    if (check_remaining_length(remaining_length) < 0) {
+        return NULL;
+    }
+
+    packet = PyBytes_FromStringAndSize(
+        NULL,
+        1 + remaining_length_size(remaining_length) + remaining_length
+    );
+    if (packet == NULL) {
+        return NULL;
+    }
+
+    p = (unsigned char *)PyBytes_AS_STRING(packet);
+    *p++ = (unsigned char)((MQTT_PACKET_PUBLISH << 4) | (dup_set << 3)
+                           | (qos << 1) | retain_set);
+    p = write_remaining_length(p, remaining_length);
+    *p++ = (unsigned char)(topic_len >> 8);
+    *p++ = (unsigned char)(topic_len & 0xFF);
+    memcpy(p, encoded_topic, topic_len);
+    p += topic_len;
+    if (qos > 0) {
+        *p++ = (unsigned char)(packet_id_value >> 8);
+        *p++ = (unsigned char)(packet_id_value & 0xFF);
+    }
+    memcpy(p, PyBytes_AS_STRING(payload), payload_len);
+    return packet;
+}
+
+static PyMethodDef speedups_methods[] = {
+    {"decode_remaining_length",
+     (PyCFunction)(void(*)(void))speedups_decode_remaining_length,
+     SPEEDUPS_ARGS, decode_remaining_length_doc},
+    {"encode_remaining_length", speedups_encode_remaining_length,
+     METH_O, encode_remaining_length_doc},
+    {"parse_publish", (PyCFunction)(void(*)(void))speedups_parse_publish,
+     METH_VARARGS | METH_KEYWORDS, parse_publish_doc},
+    {"iter_frames", (PyCFunction)(void(*)(void))speedups_iter_frames,
+     METH_VARARGS | METH_KEYWORDS, iter_frames_doc},
+    {"publish", (PyCFunction)(void(*)(void))speedups_publish,
+     METH_VARARGS | METH_KEYWORDS, publish_doc},
+    {NULL, NULL, 0, NULL}
+};
+
+static struct PyModuleDef speedups_module = {
+    PyModuleDef_HEAD_INIT,
+    "mqttpacket.v311._speedups",
+    "Optional C accelerator for the v311 parser and builders.",
+    -1,
+    speedups_methods
+};
+
+static PyObject *
+import_attr(const char *module_name, const char *attr_name)
+{
+    PyObject *attr;
+    PyObject *module = PyImport_ImportModule(module_name);
+    if (module == NULL) {
+        return NULL;
+    }
+    attr = PyObject_GetAttrString(module, attr_name);
+    Py_DECREF(module);
+    return attr;
+}
+
+PyMODINIT_FUNC
+PyInit__speedups(void)
+{
+    MQTTParseError = import_attr("mqttpacket.v311._errors", "MQTTParseError");
+    if (MQTTParseError == NULL) {
+        return NULL;
+    }
+    MQTTInvalidPacketError = import_attr("mqttpacket.v311._errors",
+                                         "MQTTInvalidPacketError");
+    if (MQTTInvalidPacketError == NULL) {
+        return NULL;
+    }
+    PublishPacket = import_attr("mqttpacket.v311._packet", "PublishPacket");
+    if (PublishPacket == NULL) {
+        return NULL;
+    }
+    StructError = import_attr("struct", "error");
+    if (StructError == NULL) {
+        return NULL;
+    }
+    if (PyType_Ready(&FrameIteratorType) < 0) {
+        return NULL;
+    }
+    return PyModule_Create(&speedups_module);
+}
@@ -0,0 +1,131 @@
+"""
+Copyright 2018 Jason Litzinger
+See LICENSE for details.
+
+Encoding and decoding of the variable length remaining length field
+of the fixed header.  Nearly all packets have a remaining length below
+16384, so one and two byte encodings take a fast path.
+"""
+from __future__ import absolute_import
+import struct
+from typing import ByteString, Tuple  # pylint: disable=unused-import
+
+import six
+
+from . import _constants, _errors
+
+_ONE_BYTE_MAX = 127
+_TWO_BYTE_MAX = 16383
+_THREE_BYTE_MAX = 2097151
+
+_ONE_BYTE = tuple(six.int2byte(i) for i in range(_ONE_BYTE_MAX + 1))
+_pack_two_bytes = struct.Struct('!BB').pack
+
+
+def _check_remaining_length(remaining_length):
+    # type: (int) -> None
+    if not 0 <= remaining_length <= _constants.MAX_REMAINING_LENGTH:
+        raise ValueError(
+            'Remaining length must be 0 <= remaining length <= {}'.format(
+                _constants.MAX_REMAINING_LENGTH
+            )
+        )
+
+
+def remaining_length_size(remaining_length):
+    # type: (int) -> int
+    """Get the number of bytes needed to encode a remaining length.
+
+    :raises: ValueError if the remaining length is out of range.
+    """
+    if remaining_length <= _ONE_BYTE_MAX:
+        if remaining_length < 0:
+            _check_remaining_length(remaining_length)
+        return 1
+    if remaining_length <= _TWO_BYTE_MAX:
+        return 2
+    if remaining_length <= _THREE_BYTE_MAX:
+        return 3
+    _check_remaining_length(remaining_length)
+    return 4
+
+
+def encode_remaining_length(remaining_length):
+    # type: (int) -> bytes
+    """Encode the remaining length for the packet.
+
+    :raises: ValueError if the remaining length is out of range.
+
+    :returns: Encoded remaining length
+    :rtype: bytes
+    """
+    if 0 <= remaining_length <= _ONE_BYTE_MAX:
+        return _ONE_BYTE[remaining_length]
+    if _ONE_BYTE_MAX < remaining_length <= _TWO_BYTE_MAX:
+        return _pack_two_bytes(
+            (remaining_length & 0x7F) | 0x80,
+            remaining_length >> 7,
+        )
+
+    _check_remaining_length(remaining_length)
+    encoded_bytes = bytearray()
+    while remaining_length > _ONE_BYTE_MAX:
+        encoded_bytes.append((remaining_length & 0x7F) | 0x80)
+        remaining_length >>= 7
+    encoded_bytes.append(remaining_length)
+    return bytes(encoded_bytes)
+
+
+def encode_remaining_length_into(buf, offset, remaining_length):
+    # type: (bytearray, int, int) -> int
+    """Write an encoded remaining length into buf at offset.
+
+    :raises: ValueError if the remaining length is out of range.
+
+    :returns: The offset one past the encoded remaining length.
+    """
+    # Written as a slice, as item assignment to a memoryview needs a str
+    # on Python 2.
+    encoded = encode_remaining_length(remaining_length)
+    end = offset + len(encoded)
+    buf[offset:end] = encoded
+    return end
+
+
+def decode_remaining_length(data, begin, end):
+    # type: (ByteString, int, int) -> Tuple[int, int]
+    """Decode the remaining length field of a fixed header.
+
+    :param data: Data containing the fixed header.
+
+    :param begin: Offset of the first byte of the remaining length.
+
+    :param end: Offset one past the last valid byte of data.
+
+    :raises: MQTTParseError if the remaining length is malformed.
+
+    :returns: The remaining length and the offset of the variable
+        header, or (-1, begin) if data ends before the remaining length
+        does.
+    """
+    if begin >= end:
+        return -1, begin
+
+    encoded_byte = data[begin]
+    if encoded_byte < 0x80:
+        return encoded_byte, begin + 1
+
+    remaining_length = encoded_byte & 0x7F
+    shift = 7
+    variable_begin = begin + 1
+    while shift < 28:
+        if variable_begin >= end:
+            return -1, begin
+        encoded_byte = data[variable_begin]
+        remaining_length |= (encoded_byte & 0x7F) << shift
+        variable_begin += 1
+        if encoded_byte < 0x80:
+            return remaining_length, variable_begin
+        shift += 7
+
+    raise _errors.MQTTParseError("Invalid remaining length")
@@ -0,0 +1,26 @@
+"""
+Copyright 2018 Jason Litzinger
+See LICENSE for details.
+"""
+import sys
+
+import pytest
+
+from mqttpacket.v311 import _backend
+
+if sys.version_info < (3, 7):
+    collect_ignore = ['test_aio.py']
+
+
+@pytest.fixture(autouse=True, params=[_backend.PYTHON, _backend.C])
+def backend(request):
+    """
+    Run every test against both the pure Python and C implementations.
+    """
+    if request.param not in _backend.available():
+        pytest.skip('C extension is not built')
+
+    previous = _backend.get_backend()
+    _backend.set_backend(request.param)
+    yield request.param
+    _backend.set_backend(previous)
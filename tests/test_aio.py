@@ -0,0 +1,211 @@
+"""
+Copyright 2018 Jason Litzinger
+See LICENSE for details.
+"""
+import asyncio
+
+import pytest
+
+import mqttpacket.v311 as mqttpacket
+
+
+class LoopbackBroker(object):
+    """
+    A minimal in-process broker that forwards messages to subscribers
+    with the QoS they were published with.
+    """
+
+    def __init__(self):
+        self.matcher = mqttpacket.TopicMatcher()
+        self.pingreqs = 0
+        self.answer_pings = True
+        self._server = None
+        self._packet_id = 0
+
+    async def start(self):
+        self._server = await asyncio.start_server(
+            self._handle, '127.0.0.1', 0,
+        )
+        return self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    def forward(self, topic, payload, qos):
+        for writer in self.matcher.match(topic):
+            packet_id = None
+            if qos:
+                self._packet_id += 1
+                packet_id = self._packet_id
+            writer.write(
+                mqttpacket.publish(topic, False, qos, False, payload, packet_id)
+            )
+
+    async def _handle(self, reader, writer):
+        decoder = mqttpacket.Decoder()
+        try:
+            while True:
+                data = await reader.read(4096)
+                if not data:
+                    return
+                decoder.feed(data)
+                for packet in decoder:
+                    if not self._reply(packet, writer):
+                        return
+        finally:
+            for topicfilter in getattr(writer, 'subscriptions', ()):
+                self.matcher.remove(topicfilter, writer)
+            writer.close()
+
+    def _reply(self, packet, writer):
+        pkt_type = packet.pkt_type
+        if pkt_type == mqttpacket.MQTT_PACKET_CONNECT:
+            if packet.client_id == u'refused':
+                writer.write(mqttpacket.connack(
+                    mqttpacket.CONNACK_NOT_AUTHORIZED
+                ))
+                return False
+            writer.subscriptions = set()
+            writer.write(mqttpacket.connack())
+        elif pkt_type == mqttpacket.MQTT_PACKET_SUBSCRIBE:
+            for subscription in packet.subscriptions:
+                self.matcher.add(subscription.topicfilter, writer)
+                writer.subscriptions.add(subscription.topicfilter)
+            writer.write(mqttpacket.suback(
+                packet.packet_id,
+                [s.qos for s in packet.subscriptions],
+            ))
+        elif pkt_type == mqttpacket.MQTT_PACKET_UNSUBSCRIBE:
+            for topicfilter in packet.topicfilters:
+                self.matcher.remove(topicfilter, writer)
+                writer.subscriptions.discard(topicfilter)
+            writer.write(mqttpacket.unsuback(packet.packet_id))
+        elif pkt_type == mqttpacket.MQTT_PACKET_PUBLISH:
+            if packet.qos == 1:
+                writer.write(mqttpacket.puback(packet.packetid))
+            elif packet.qos == 2:
+                writer.write(mqttpacket.pubrec(packet.packetid))
+            self.forward(packet.topic, bytes(packet.payload), packet.qos)
+        elif pkt_type == mqttpacket.MQTT_PACKET_PUBREL:
+            writer.write(mqttpacket.pubcomp(packet.packet_id))
+        elif pkt_type == mqttpacket.MQTT_PACKET_PUBREC:
+            writer.write(mqttpacket.pubrel(packet.packet_id))
+        elif pkt_type == mqttpacket.MQTT_PACKET_PINGREQ:
+            self.pingreqs += 1
+            if self.answer_pings:
+                writer.write(mqttpacket.pingresp())
+        elif pkt_type == mqttpacket.MQTT_PACKET_DISCONNECT:
+            return False
+        return True
+
+
+def _run(test, *args):
+    async def _with_broker():
+        broker = LoopbackBroker()
+        port = await broker.start()
+        try:
+            await asyncio.wait_for(test(broker, port, *args), 10)
+        finally:
+            await broker.stop()
+    asyncio.run(_with_broker())
+
+
+def test_publish_subscribe():
+    """
+    Messages of every QoS are published, acknowledged and received.
+    """
+    async def _test(_broker, port):
+        client = await mqttpacket.open_connection(
+            '127.0.0.1', port, u'client-1',
+        )
+        codes = await client.subscribe([
+            mqttpacket.SubscriptionSpec(u'a/#', 2),
+        ])
+        assert codes == [2]
+
+        for qos in (0, 1, 2):
+            await client.publish(u'a/b', b'qos%d' % qos, qos)
+
+        received = []
+        async for packet in client:
+            received.append(packet)
+            if len(received) == 3:
+                break
+        assert [p.qos for p in received] == [0, 1, 2]
+        assert [bytes(p.payload) for p in received] == [
+            b'qos0', b'qos1', b'qos2',
+        ]
+        assert all(p.topic == u'a/b' for p in received)
+
+        await client.unsubscribe([u'a/#'])
+        await client.publish(u'a/b', b'ignored', 1)
+        await client.disconnect()
+        assert [p async for p in client] == []
+
+    _run(_test)
+
+
+def test_backpressure():
+    """
+    Reading is paused while too many messages are queued, and resumed
+    once they are consumed.
+    """
+    async def _test(broker, port):
+        client = await mqttpacket.open_connection(
+            '127.0.0.1', port, u'client-1', max_queued=4,
+        )
+        await client.subscribe([mqttpacket.SubscriptionSpec(u'a', 0)])
+        for i in range(20):
+            broker.forward(u'a', b'%d' % i, 0)
+
+        # pylint: disable=protected-access
+        while len(client._messages) < 4:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        assert not client._transport.is_reading()
+        assert len(client._messages) == 4
+
+        received = []
+        async for packet in client:
+            received.append(bytes(packet.payload))
+            if len(received) == 20:
+                break
+        assert received == [b'%d' % i for i in range(20)]
+        assert client._transport.is_reading()
+        await client.disconnect()
+
+    _run(_test)
+
+
+def test_keepalive():
+    """
+    PINGREQ is sent when idle, and the connection is closed when it is
+    not answered.
+    """
+    async def _test(broker, port):
+        client = await mqttpacket.open_connection(
+            '127.0.0.1', port, u'client-1', keepalive=1,
+        )
+        await asyncio.sleep(1.2)
+        assert broker.pingreqs == 1
+
+        broker.answer_pings = False
+        with pytest.raises(TimeoutError):
+            async for _ in client:
+                pass
+        assert broker.pingreqs == 2
+
+    _run(_test)
+
+
+def test_connection_refused():
+    """
+    A refused connection raises an error with the return code.
+    """
+    async def _test(_broker, port):
+        with pytest.raises(mqttpacket.MQTTConnectionRefusedError) as e:
+            await mqttpacket.open_connection('127.0.0.1', port, u'refused')
+        assert e.value.return_code == mqttpacket.CONNACK_NOT_AUTHORIZED
+
+    _run(_test)
@@ -0,0 +1,93 @@
+"""
+Copyright 2018 Jason Litzinger
+See LICENSE for details.
+"""
+import binascii
+
+import pytest
+
+import mqttpacket.v311 as mqttpacket
+
+
+def test_parse_batch():
+    """
+    Packets are parsed into columns locating their topics and payloads.
+    """
+    qos0 = mqttpacket.publish(u'a/b', False, 0, True, b'hello')
+    qos1 = mqttpacket.publish(u'c', True, 1, False, b'', 300)
+    data = bytearray(
+        qos0
+        + qos1
+        + mqttpacket.puback(7)
+        + mqttpacket.pingresp()
+        + mqttpacket.subscribe(9, [mqttpacket.SubscriptionSpec(u'x', 1)])
+    )
+    batch, consumed = mqttpacket.parse_batch(data)
+    assert consumed == len(data)
+    assert len(batch) == 5
+    assert list(batch.pkt_type) == [
+        mqttpacket.MQTT_PACKET_PUBLISH,
+        mqttpacket.MQTT_PACKET_PUBLISH,
+        mqttpacket.MQTT_PACKET_PUBACK,
+        mqttpacket.MQTT_PACKET_PINGRESP,
+        mqttpacket.MQTT_PACKET_SUBSCRIBE,
+    ]
+    assert list(batch.flags) == [0x01, 0x0a, 0, 0, 0x02]
+    assert list(batch.packet_id) == [0, 300, 7, 0, 9]
+    assert list(batch.topic_len) == [3, 1, 0, 0, 0]
+
+    assert batch.topic(data, 0) == b'a/b'
+    assert batch.payload(data, 0) == b'hello'
+    assert batch.topic(data, 1) == b'c'
+    assert batch.payload(data, 1) == b''
+    base = len(qos0) + len(qos1)
+    assert list(batch.offset)[2:] == [base + 2, base + 6, base + 8]
+    assert list(batch.length)[2:] == [2, 0, 6]
+
+
+def test_parse_batch_partial():
+    """
+    Parsing stops at an incomplete packet, and can be resumed into the
+    same batch once the rest of the packet is appended to the data and
+    payload views are released.
+    """
+    first = mqttpacket.publish(u'a', False, 1, False, b'x' * 200, 1)
+    second = mqttpacket.publish(u'bc', False, 1, False, b'y' * 100, 2)
+    data = bytearray(first + second[:2])
+    batch, offset = mqttpacket.parse_batch(data)
+    assert (len(batch), offset) == (1, len(first))
+
+    # The data cannot be extended while a payload view is held.
+    payload = batch.payload(data, 0)
+    with pytest.raises(BufferError):
+        data.extend(second[2:])
+    del payload
+
+    data.extend(second[2:])
+    batch, offset = mqttpacket.parse_batch(data, batch, offset)
+    assert (len(batch), offset) == (2, len(data))
+    assert list(batch.packet_id) == [1, 2]
+    assert batch.topic(data, 0) == b'a'
+    assert batch.payload(data, 0) == b'x' * 200
+    assert batch.topic(data, 1) == b'bc'
+    assert batch.payload(data, 1) == b'y' * 100
+
+    batch.clear()
+    assert len(batch) == 0
+    assert len(batch.topic_offset) == 0
+
+
+def test_parse_batch_invalid():
+    """
+    Invalid packets raise the same errors as parse.
+    """
+    for packet in (b'3001ff', b'3203000161'):
+        with pytest.raises(mqttpacket.MQTTParseError):
+            mqttpacket.parse_batch(bytearray(binascii.unhexlify(packet)))
+
+    for packet in (b'0000', b'f000', b'400100', b'360700016100016869'):
+        with pytest.raises(mqttpacket.MQTTInvalidPacketError):
+            mqttpacket.parse_batch(bytearray(binascii.unhexlify(packet)))
+
+    with pytest.raises(TypeError):
+        mqttpacket.parse_batch(b'\xd0\x00')
@@ -5,7 +5,9 @@ See LICENSE for details.
 """
 import binascii
 import json
+import struct
 
+import attr
 import six
 import pytest
 
@@ -393,3 +395,337 @@ def test_unsubscribe_requires_one():
     """
     with pytest.raises(ValueError):
         mqttpacket.unsubscribe(123, [])
+
+
+def test_subscribe_unsubscribe_packet_ids():
+    """
+    SUBSCRIBE and UNSUBSCRIBE accept the same packet ids as every other
+    builder.
+    """
+    spec = mqttpacket.SubscriptionSpec(u'a', 0)
+    assert mqttpacket.subscribe(65535, [spec])[2:4] == b'\xff\xff'
+    assert mqttpacket.unsubscribe(65535, [u'a'])[2:4] == b'\xff\xff'
+
+    for packet_id in (0, 65536):
+        with pytest.raises(ValueError):
+            mqttpacket.subscribe(packet_id, [spec])
+        with pytest.raises(ValueError):
+            mqttpacket.unsubscribe(packet_id, [u'a'])
+
+
+def test_publish_into():
+    """
+    A PUBLISH written into a buffer matches the built packet and
+    returns the offset past the packet.
+    """
+    expect = mqttpacket.publish(
+        u'test',
+        True,
+        1,
+        False,
+        u'foo'.encode('utf-8'),
+        packet_id=256
+    )
+    buf = bytearray(100)
+    end = mqttpacket.publish_into(
+        buf,
+        3,
+        u'test',
+        True,
+        1,
+        False,
+        u'foo'.encode('utf-8'),
+        packet_id=256
+    )
+    assert end == 3 + len(expect)
+    assert buf[3:end] == expect
+    assert buf[:3] == b'\x00\x00\x00'
+
+
+def test_publish_into_batch():
+    """
+    Several PUBLISH packets can be written back to back into
+    a memoryview.
+    """
+    payload = b'x' * 200
+    expect = mqttpacket.publish(u'a/b', False, 0, True, payload)
+    buf = bytearray(len(expect) * 3)
+    view = memoryview(buf)
+    offset = 0
+    for _ in range(3):
+        offset = mqttpacket.publish_into(
+            view, offset, u'a/b', False, 0, True, payload
+        )
+    assert offset == len(buf)
+    assert bytes(buf) == expect * 3
+
+    # Packet ids and multi-byte remaining lengths are written too.
+    payload = b'y' * 300
+    expect = mqttpacket.publish(u'a/b', False, 1, False, payload, 7)
+    buf = bytearray(len(expect))
+    assert mqttpacket.publish_into(
+        memoryview(buf), 0, u'a/b', False, 1, False, payload, 7
+    ) == len(buf)
+    assert bytes(buf) == expect
+
+
+def test_publish_into_too_small():
+    """
+    Writing a PUBLISH into a buffer that is too small raises an error.
+    """
+    buf = bytearray(10)
+    with pytest.raises(ValueError):
+        mqttpacket.publish_into(buf, 0, u'test', False, 0, False, b'foobar')
+    assert buf == bytearray(10)
+
+
+def test_into_builders_match():
+    """
+    The SUBSCRIBE, UNSUBSCRIBE and CONNECT buffer writers match
+    their builders.
+    """
+    specs = [
+        mqttpacket.SubscriptionSpec(u'a/b', 0x01),
+        mqttpacket.SubscriptionSpec(u'c/d', 0x02),
+    ]
+    cs = mqttpacket.ConnectSpec(
+        will_topic=u'my_will_topic',
+        will_message=u'my_will_message',
+        will_qos=1,
+    )
+    expect = b''.join([
+        mqttpacket.subscribe(10, specs),
+        mqttpacket.unsubscribe(257, [u'a/b', u'c/d']),
+        mqttpacket.connect(u'test', connect_spec=cs),
+    ])
+    buf = bytearray(len(expect))
+    offset = mqttpacket.subscribe_into(buf, 0, 10, specs)
+    offset = mqttpacket.unsubscribe_into(buf, offset, 257, [u'a/b', u'c/d'])
+    offset = mqttpacket.connect_into(buf, offset, u'test', connect_spec=cs)
+    assert offset == len(expect)
+    assert bytes(buf) == expect
+
+    with pytest.raises(ValueError):
+        mqttpacket.subscribe_into(buf, len(buf) - 5, 10, specs)
+
+
+def test_publish_header():
+    """
+    A PUBLISH header followed by the payload is the complete packet.
+    """
+    payload = b'x' * 1000
+    expect = mqttpacket.publish(u'fw/1', False, 1, False, payload, 4)
+    header = mqttpacket.publish_header(u'fw/1', False, 1, False, 1000, 4)
+    assert isinstance(header, bytes)
+    assert len(header) == 11
+    assert header + payload == expect
+
+
+def test_publish_parts():
+    """
+    PUBLISH parts are the header and the payload object itself.
+    """
+    payload = memoryview(b'x' * 200)
+    header, body = mqttpacket.publish_parts(u'fw/1', False, 0, True, payload)
+    assert body is payload
+    expect = mqttpacket.publish(u'fw/1', False, 0, True, payload.tobytes())
+    assert header + body.tobytes() == expect
+
+    with pytest.raises(TypeError):
+        mqttpacket.publish_parts(u'fw/1', False, 0, True, u'text')
+
+    with pytest.raises(ValueError):
+        mqttpacket.publish_header(u'fw/1', False, 1, True, 10)
+
+
+def test_publish_template():
+    """
+    A PUBLISH built from a template matches the built packet.
+    """
+    template = mqttpacket.PublishTemplate(u'test', qos=1, retain=True)
+    payload = u'foo'.encode('utf-8')
+    assert template.build(payload, 255) == mqttpacket.publish(
+        u'test', False, 1, True, payload, packet_id=255
+    )
+    assert template.build(payload, 256, dup=True) == mqttpacket.publish(
+        u'test', True, 1, True, payload, packet_id=256
+    )
+    assert template.header(3, 255) == mqttpacket.publish_header(
+        u'test', False, 1, True, 3, packet_id=255
+    )
+
+    buf = bytearray(30)
+    end = template.build_into(buf, 2, payload, 255)
+    assert buf[2:end] == template.build(payload, 255)
+
+
+def test_publish_template_validation():
+    """
+    A template validates its topic and QoS when created and the
+    packet id and dup flag for each message.
+    """
+    with pytest.raises(TypeError):
+        mqttpacket.PublishTemplate(b'test')
+
+    with pytest.raises(ValueError):
+        mqttpacket.PublishTemplate(u'test', qos=3)
+
+    with pytest.raises(ValueError):
+        mqttpacket.PublishTemplate(u'test', qos=1).build(b'foo')
+
+    with pytest.raises(ValueError):
+        mqttpacket.PublishTemplate(u'test').build(b'foo', dup=True)
+
+    with pytest.raises(TypeError):
+        mqttpacket.PublishTemplate(u'test').build(u'foo')
+
+
+def test_publish_template_frozen():
+    """
+    A template cannot be changed after its topic and flags are encoded.
+    """
+    template = mqttpacket.PublishTemplate(u'a/b')
+    for name, value in (('topic', u'zz'), ('qos', 1), ('retain', True)):
+        with pytest.raises(attr.exceptions.FrozenInstanceError):
+            setattr(template, name, value)
+    assert template.build(b'x') == mqttpacket.publish(
+        u'a/b', False, 0, False, b'x',
+    )
+
+    evolved = attr.evolve(template, topic=u'zz', qos=1)
+    assert evolved.build(b'x', 5) == mqttpacket.publish(
+        u'zz', False, 1, False, b'x', 5,
+    )
+
+
+def test_publish_many():
+    """
+    Many payloads to one topic are built back to back in one buffer.
+    """
+    payloads = [b'', b'a', b'b' * 200, b'c' * 20000]
+    packets = mqttpacket.publish_many(u'sensors/1', 1, payloads, [1, 2, 3, 4])
+    expect = b''.join(
+        mqttpacket.publish(u'sensors/1', False, 1, False, p, packet_id=i)
+        for i, p in enumerate(payloads, 1)
+    )
+    assert packets == expect
+
+    packets = mqttpacket.publish_many(u's', 0, payloads, retain=True)
+    expect = b''.join(
+        mqttpacket.publish(u's', False, 0, True, p) for p in payloads
+    )
+    assert packets == expect
+
+
+def test_publish_many_requires_packet_ids():
+    """
+    A packet id is required for every payload with nonzero QoS.
+    """
+    with pytest.raises(ValueError):
+        mqttpacket.publish_many(u'test', 1, [b'a', b'b'])
+
+    with pytest.raises(ValueError):
+        mqttpacket.publish_many(u'test', 1, [b'a', b'b'], [1])
+
+    with pytest.raises(ValueError):
+        mqttpacket.publish_many(u'test', 2, [b'a', b'b'], [1, None])
+
+
+def test_publish_invalid_arguments():
+    """
+    Invalid PUBLISH arguments raise errors.
+    """
+    with pytest.raises(ValueError):
+        mqttpacket.publish(u'test', False, 3, False, b'foo')
+
+    with pytest.raises(ValueError):
+        mqttpacket.publish(b'test', False, 0, False, b'foo')
+
+    with pytest.raises(struct.error):
+        mqttpacket.publish(u'test', False, 1, False, b'foo', packet_id=65536)
+
+    with pytest.raises(struct.error):
+        mqttpacket.publish(u't' * 65536, False, 0, False, b'foo')
+
+
+def test_acks():
+    """
+    Acknowledgements are built and parse back to the same packet id.
+    """
+    assert mqttpacket.puback(12345) == b'\x40\x02\x30\x39'
+    assert mqttpacket.pubrec(12345) == b'\x50\x02\x30\x39'
+    assert mqttpacket.pubrel(12345) == b'\x62\x02\x30\x39'
+    assert mqttpacket.pubcomp(12345) == b'\x70\x02\x30\x39'
+    assert mqttpacket.unsuback(65535) == b'\xb0\x02\xff\xff'
+
+    for packet_id in (0, 65536):
+        with pytest.raises(ValueError):
+            mqttpacket.puback(packet_id)
+
+
+def test_acks_into():
+    """
+    Many acknowledgements are written back to back into a buffer and
+    parse back to the same packet ids.
+    """
+    packet_ids = list(range(1, 301))
+    buf = bytearray(4 * len(packet_ids) + 2)
+    end = mqttpacket.acks_into(
+        buf, 2, mqttpacket.MQTT_PACKET_PUBREL, packet_ids
+    )
+    assert end == len(buf)
+    msgs = []
+    assert mqttpacket.parse(buf[2:], msgs) == len(buf) - 2
+    assert [m.packet_id for m in msgs] == packet_ids
+    assert all(m.pkt_type == mqttpacket.MQTT_PACKET_PUBREL for m in msgs)
+
+    with pytest.raises(ValueError):
+        mqttpacket.acks_into(buf, 3, mqttpacket.MQTT_PACKET_PUBACK, packet_ids)
+
+    with pytest.raises(ValueError):
+        mqttpacket.acks_into(buf, 0, mqttpacket.MQTT_PACKET_PUBLISH, [1])
+
+    # Nothing is written when any packet id is invalid.
+    buf = bytearray(12)
+    with pytest.raises(ValueError):
+        mqttpacket.acks_into(buf, 0, mqttpacket.MQTT_PACKET_PUBACK, [1, 0, 2])
+    assert buf == bytearray(12)
+
+
+def test_connack():
+    """
+    CONNACK packets are built for valid return codes.
+    """
+    assert mqttpacket.connack() == b'\x20\x02\x00\x00'
+    assert mqttpacket.connack(0, True) == b'\x20\x02\x01\x00'
+    assert mqttpacket.connack(
+        mqttpacket.CONNACK_NOT_AUTHORIZED
+    ) == b'\x20\x02\x00\x05'
+
+    with pytest.raises(ValueError):
+        mqttpacket.connack(6)
+
+    with pytest.raises(ValueError):
+        mqttpacket.connack(mqttpacket.CONNACK_SERVER_UNAVAILABLE, True)
+
+
+def test_suback():
+    """
+    A SUBACK is built with a return code per subscription.
+    """
+    packet = mqttpacket.suback(10, [0, 1, 2, mqttpacket.SUBACK_FAILURE])
+    assert packet == b'\x90\x06\x00\x0a\x00\x01\x02\x80'
+    msgs = []
+    mqttpacket.parse(bytearray(packet), msgs)
+    assert msgs[0].return_codes == [0, 1, 2, 0x80]
+
+    with pytest.raises(ValueError):
+        mqttpacket.suback(10, [3])
+
+    with pytest.raises(ValueError):
+        mqttpacket.suback(10, [])
+
+
+def test_pingresp():
+    """A PINGRESP is properly encoded."""
+    assert mqttpacket.pingresp() == b'\xd0\x00'
@@ -0,0 +1,322 @@
+"""
+Copyright 2018 Jason Litzinger
+See LICENSE for details.
+"""
+import binascii
+import socket
+
+import pytest
+
+import mqttpacket.v311 as mqttpacket
+from mqttpacket.v311 import _constants, _decoder
+
+_PUBLISH = binascii.unhexlify(
+    b'321700047465737400037b2274657374223a2274657374227d'
+)
+_PUBACK = binascii.unhexlify(b'40023039')
+
+
+def test_decoder_single_packet():
+    """
+    A complete packet fed to the decoder is returned by iteration.
+    """
+    decoder = mqttpacket.Decoder()
+    decoder.feed(_PUBACK)
+    msgs = list(decoder)
+    assert len(msgs) == 1
+    assert msgs[0].packet_id == 12345
+    assert not decoder
+    assert not list(decoder)
+
+
+def test_decoder_byte_at_a_time():
+    """
+    Packets fed one byte at a time are returned once complete.
+    """
+    decoder = mqttpacket.Decoder(buffer_size=4)
+    msgs = []
+    stream = _PUBLISH + _PUBACK + _PUBLISH
+    for i in range(len(stream)):
+        decoder.feed(stream[i:i+1])
+        msgs.extend(decoder)
+        if i < len(_PUBLISH) - 1:
+            assert not msgs
+
+    assert [m.pkt_type for m in msgs] == [
+        _constants.MQTT_PACKET_PUBLISH,
+        _constants.MQTT_PACKET_PUBACK,
+        _constants.MQTT_PACKET_PUBLISH,
+    ]
+    assert msgs[0].topic == u'test'
+    assert msgs[0].payload == b'{"test":"test"}'
+    assert msgs[2].packetid == 3
+    assert not decoder
+
+
+def test_decoder_coalesced_and_partial():
+    """
+    Packets that span feeds are decoded along with complete packets
+    from the same feed.
+    """
+    decoder = mqttpacket.Decoder(buffer_size=16)
+    stream = (_PUBACK + _PUBLISH) * 20
+    msgs = []
+    for i in range(0, len(stream), 7):
+        decoder.feed(stream[i:i+7])
+        msgs.extend(decoder)
+
+    assert len(msgs) == 40
+    assert all(m.packet_id == 12345 for m in msgs[::2])
+    assert all(m.payload == b'{"test":"test"}' for m in msgs[1::2])
+
+
+def test_decoder_large_publish():
+    """
+    A publish larger than the buffer is decoded.
+    """
+    payload = b'x' * 100000
+    packet = mqttpacket.publish(u'big', False, 1, False, payload, 7)
+    decoder = mqttpacket.Decoder(buffer_size=64)
+    for i in range(0, len(packet), 1000):
+        decoder.feed(packet[i:i+1000])
+        if i + 1000 < len(packet):
+            assert not list(decoder)
+
+    msgs = list(decoder)
+    assert len(msgs) == 1
+    assert msgs[0].payload == payload
+    assert msgs[0].packetid == 7
+
+
+def test_decoder_invalid_remaining_length():
+    """
+    A remaining length longer than four bytes raises an error.
+    """
+    decoder = mqttpacket.Decoder()
+    decoder.feed(b'\x30\xff\xff\xff\xff\x7f')
+    with pytest.raises(mqttpacket.MQTTParseError):
+        next(decoder)
+
+
+def test_decoder_recv_into():
+    """
+    Data received directly into the decoder buffer is decoded.
+    """
+    decoder = mqttpacket.Decoder(buffer_size=8)
+    stream = _PUBLISH + _PUBACK
+    msgs = []
+    for i in range(0, len(stream), 5):
+        chunk = stream[i:i+5]
+        buf = decoder.get_buffer(len(chunk))
+        assert len(buf) >= len(chunk)
+        buf[:len(chunk)] = chunk
+        decoder.buffer_updated(len(chunk))
+        msgs.extend(decoder)
+
+    assert len(msgs) == 2
+    assert msgs[0].payload == b'{"test":"test"}'
+    assert msgs[1].packet_id == 12345
+
+
+def test_decoder_socket_recv_into():
+    """
+    The decoder buffer can be passed to socket.recv_into.
+    """
+    a, b = socket.socketpair()
+    try:
+        a.sendall(_PUBACK + _PUBLISH[:10])
+        decoder = mqttpacket.Decoder()
+        nbytes = b.recv_into(decoder.get_buffer())
+        decoder.buffer_updated(nbytes)
+        msgs = list(decoder)
+        a.sendall(_PUBLISH[10:])
+        nbytes = b.recv_into(decoder.get_buffer())
+        decoder.buffer_updated(nbytes)
+        msgs.extend(decoder)
+    finally:
+        a.close()
+        b.close()
+
+    assert msgs[0].packet_id == 12345
+    assert msgs[1].packetid == 3
+
+
+def test_decoder_buffer_updated_too_large():
+    """
+    Committing more data than fits in the buffer raises an error.
+    """
+    decoder = mqttpacket.Decoder()
+    buf = decoder.get_buffer()
+    with pytest.raises(ValueError):
+        decoder.buffer_updated(len(buf) + 1)
+
+
+def test_decoder_max_packet_size():
+    """
+    A packet larger than max_packet_size is rejected as soon as its
+    fixed header is received, and one that fits is decoded.
+    """
+    decoder = mqttpacket.Decoder(max_packet_size=len(_PUBLISH))
+    decoder.feed(_PUBLISH)
+    assert len(list(decoder)) == 1
+
+    decoder = mqttpacket.Decoder(max_packet_size=len(_PUBLISH) - 1)
+    decoder.feed(_PUBLISH[:2])
+    with pytest.raises(mqttpacket.MQTTPacketTooLargeError):
+        list(decoder)
+
+    # A header announcing a huge body is rejected before any of it.
+    decoder = mqttpacket.Decoder(max_packet_size=1024)
+    decoder.feed(b'\x30\xff\xff\xff\x7f')
+    with pytest.raises(mqttpacket.MQTTPacketTooLargeError):
+        list(decoder)
+
+
+def test_decoder_packet_size_limits():
+    """
+    Size limits can be set per packet type.
+    """
+    decoder = mqttpacket.Decoder(packet_size_limits={
+        _constants.MQTT_PACKET_PUBLISH: len(_PUBLISH) - 1,
+    })
+    decoder.feed(_PUBACK)
+    assert len(list(decoder)) == 1
+    decoder.feed(_PUBLISH)
+    with pytest.raises(mqttpacket.MQTTPacketTooLargeError):
+        list(decoder)
+
+    # The smaller of the limits applies.
+    decoder = mqttpacket.Decoder(
+        max_packet_size=len(_PUBLISH) - 1,
+        packet_size_limits={_constants.MQTT_PACKET_PUBLISH: 1024},
+    )
+    decoder.feed(_PUBLISH)
+    with pytest.raises(mqttpacket.MQTTPacketTooLargeError):
+        list(decoder)
+
+
+@pytest.mark.parametrize('data', [
+    b'\x20\x03\x00\x00\x00',
+    b'\x40\x01\x30',
+    b'\xd0\x01\x00',
+    b'\xe0\x7f',
+])
+def test_decoder_fixed_remaining_length(data):
+    """
+    A packet without a payload must have the remaining length of its
+    type, and is rejected before its body is received.
+    """
+    decoder = mqttpacket.Decoder()
+    decoder.feed(data[:2])
+    with pytest.raises(mqttpacket.MQTTInvalidPacketError) as e:
+        list(decoder)
+    assert not isinstance(e.value, mqttpacket.MQTTPacketTooLargeError)
+
+
+@pytest.mark.parametrize('max_packet_size,expected', [
+    (1, -1),
+    (2, 0),
+    (129, 127),
+    (130, 127),
+    (131, 128),
+    (16386, 16383),
+    (16387, 16383),
+    (16388, 16384),
+    (2 ** 32, _constants.MAX_REMAINING_LENGTH),
+])
+def test_max_remaining_length(max_packet_size, expected):
+    """
+    The largest remaining length that fits a packet size accounts for
+    the size of its encoding.
+    """
+    # pylint: disable=protected-access
+    assert _decoder._max_remaining_length(max_packet_size) == expected
+
+
+def _stream(decoder, data, size):
+    """Feed data in pieces of size, collecting the decoded events."""
+    events = []
+    for i in range(0, len(data), size):
+        decoder.feed(data[i:i + size])
+        events.extend(decoder)
+    return events
+
+
+@pytest.mark.parametrize('qos', [0, 1, 2])
+def test_decoder_stream_publish(qos):
+    """
+    The payload of a large PUBLISH is returned in chunks following its
+    header, without buffering the whole packet.
+    """
+    payload = bytes(bytearray(range(256))) * 400
+    packetid = 7 if qos else None
+    data = (
+        mqttpacket.publish(u'fw/image', False, qos, True, payload, packetid)
+        + _PUBACK
+    )
+    decoder = mqttpacket.Decoder(buffer_size=1024, stream_over=1024)
+    events = _stream(decoder, data, 1000)
+
+    header = events[0]
+    assert isinstance(header, mqttpacket.PublishHeader)
+    assert header.topic == u'fw/image'
+    assert header.qos == qos
+    assert header.retain == 1
+    assert header.packetid == packetid
+    assert header.payload_length == len(payload)
+
+    chunks = events[1:-1]
+    assert all(isinstance(c, mqttpacket.PayloadChunk) for c in chunks)
+    assert all(c.pkt_type is None for c in chunks)
+    assert [c.last for c in chunks] == [False] * (len(chunks) - 1) + [True]
+    assert max(len(c.data) for c in chunks) <= 1000
+    assert b''.join(c.data for c in chunks) == payload
+    assert events[-1].packet_id == 12345
+
+    # pylint: disable=protected-access
+    assert len(decoder._buf) == 1024
+
+
+def test_decoder_stream_threshold():
+    """
+    Only a PUBLISH with a remaining length over the threshold is
+    streamed, and an empty payload is ended by an empty chunk.
+    """
+    decoder = mqttpacket.Decoder(stream_over=len(_PUBLISH) - 2)
+    decoder.feed(_PUBLISH)
+    msgs = list(decoder)
+    assert len(msgs) == 1
+    assert isinstance(msgs[0], mqttpacket.PublishPacket)
+
+    decoder = mqttpacket.Decoder(stream_over=0)
+    decoder.feed(mqttpacket.publish(u'a', False, 0, False, b''))
+    header, chunk = list(decoder)
+    assert header.payload_length == 0
+    assert chunk == mqttpacket.PayloadChunk(b'', True)
+
+
+def test_decoder_stream_header_incomplete():
+    """
+    The header of a streamed PUBLISH is returned only once its topic is
+    received, and a topic exceeding the packet is rejected.
+    """
+    decoder = mqttpacket.Decoder(stream_over=0)
+    decoder.feed(_PUBLISH[:6])
+    assert not list(decoder)
+    decoder.feed(_PUBLISH[6:10])
+    header, = list(decoder)
+    assert header.topic_bytes == b'test'
+    assert header.packetid == 3
+    decoder.feed(_PUBLISH[10:12])
+    assert list(decoder) == [mqttpacket.PayloadChunk(b'{"', False)]
+
+    decoder = mqttpacket.Decoder(stream_over=0)
+    decoder.feed(b'\x30\x04\x00\x05ab')
+    with pytest.raises(mqttpacket.MQTTParseError):
+        list(decoder)
+
+    # Both QoS bits set.
+    decoder = mqttpacket.Decoder(stream_over=0)
+    decoder.feed(b'\x36\x07\x00\x01a\x00\x01hi')
+    with pytest.raises(mqttpacket.MQTTInvalidPacketError):
+        list(decoder)
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Copyright 2018 Jason Litzinger
+See LICENSE for details.
+"""
+import pytest
+
+from mqttpacket.v311 import TopicMatcher, CachingTopicMatcher
+
+
+def _matcher(*topicfilters):
+    matcher = TopicMatcher()
+    for topicfilter in topicfilters:
+        matcher.add(topicfilter, topicfilter)
+    return matcher
+
+
+def test_match_wildcards():
+    """
+    Topic filters match as described in the specification.
+    """
+    matcher = _matcher(
+        u'sport/tennis/player1',
+        u'sport/tennis/player1/#',
+        u'sport/#',
+        u'#',
+        u'sport/tennis/+',
+        u'+/+',
+        u'/+',
+        u'+',
+        u'sport/+/player1',
+    )
+    assert matcher.match(u'sport/tennis/player1') == {
+        u'sport/tennis/player1',
+        u'sport/tennis/player1/#',
+        u'sport/#',
+        u'#',
+        u'sport/tennis/+',
+        u'sport/+/player1',
+    }
+    assert matcher.match(u'sport/tennis/player1/ranking') == {
+        u'sport/tennis/player1/#',
+        u'sport/#',
+        u'#',
+    }
+    assert matcher.match(u'sport') == {u'sport/#', u'#', u'+'}
+    assert matcher.match(u'/finance') == {u'#', u'+/+', u'/+'}
+    assert matcher.match(u'sport/tennis') == {u'sport/#', u'#', u'+/+'}
+
+
+def test_match_dollar_topics():
+    """
+    Topics starting with '$' are not matched by a leading wildcard.
+    """
+    matcher = _matcher(u'#', u'+/monitor/Clients', u'$SYS/#', u'$SYS/+/Clients')
+    assert matcher.match(u'$SYS/monitor/Clients') == {
+        u'$SYS/#', u'$SYS/+/Clients',
+    }
+    assert matcher.match(u'SYS/monitor/Clients') == {
+        u'#', u'+/monitor/Clients',
+    }
+
+
+def test_match_bytes():
+    """
+    Topic names and filters may be given as bytes, and topic names as
+    any bytes-like object.
+    """
+    matcher = _matcher(u'café/+', b'a/#')
+    assert matcher.match(u'café/1'.encode('utf-8')) == {u'café/+'}
+    assert matcher.match(u'a/b') == {b'a/#'}
+    assert matcher.match(memoryview(b'a/b')) == {b'a/#'}
+    assert matcher.match(bytearray(b'a/b')) == {b'a/#'}
+
+
+def test_add_remove():
+    """
+    Subscriptions can be removed, and empty levels are pruned.
+    """
+    matcher = TopicMatcher()
+    assert matcher.add(u'a/+/c', 1)
+    assert matcher.add(u'a/+/c', 2)
+    assert not matcher.add(u'a/+/c', 2)
+    assert matcher.add(u'a/b/#', 3)
+    assert len(matcher) == 3
+    assert matcher.match(u'a/b/c') == {1, 2, 3}
+
+    matcher.remove(u'a/+/c', 1)
+    assert matcher.match(u'a/b/c') == {2, 3}
+    matcher.remove(u'a/+/c', 2)
+    matcher.remove(u'a/b/#', 3)
+    assert len(matcher) == 0
+    assert not matcher.match(u'a/b/c')
+    # pylint: disable=protected-access
+    assert not matcher._root.children
+
+    with pytest.raises(KeyError):
+        matcher.remove(u'a/b/#', 3)
+
+    matcher.add(u'a/b', 1)
+    with pytest.raises(KeyError):
+        matcher.remove(u'a/b', 2)
+
+
+def test_invalid_filters():
+    """
+    Invalid topic filters are rejected.
+    """
+    matcher = TopicMatcher()
+    for topicfilter in (u'', u'a/#/b', u'a#', u'a/b+', u'+a/b'):
+        with pytest.raises(ValueError):
+            matcher.add(topicfilter, 1)
+
+
+def test_cache_hits_and_eviction():
+    """
+    Repeated topics are answered from the cache, which is bounded
+    by evicting the least recently used topic.
+    """
+    matcher = CachingTopicMatcher(maxsize=2)
+    matcher.add(u'a/+', 1)
+    assert matcher.match(u'a/1') == {1}
+    assert matcher.match(u'a/1') == {1}
+    assert (matcher.hits, matcher.misses) == (1, 1)
+
+    matcher.match(u'a/2')
+    matcher.match(u'a/1')
+    matcher.match(u'a/3')
+    assert matcher.cache_len() == 2
+    assert (matcher.hits, matcher.misses) == (2, 3)
+    # a/2 was least recently used.
+    matcher.match(u'a/2')
+    assert matcher.misses == 4
+
+    matcher.clear_cache()
+    assert matcher.cache_len() == 0
+    assert (matcher.hits, matcher.misses) == (0, 0)
+
+
+def test_cache_invalidation():
+    """
+    Changing subscriptions outdates the cached matches.
+    """
+    matcher = CachingTopicMatcher()
+    matcher.add(u'a/#', 1)
+    for topic in (u'a', u'a/b', b'a/c', u'b/c', u'$SYS/a'):
+        matcher.match(topic)
+
+    matcher.add(u'+/c', 2)
+    assert matcher.match(b'a/c') == {1, 2}
+    assert matcher.match(u'b/c') == {2}
+    assert matcher.match(u'a/b') == {1}
+    assert matcher.match(u'$SYS/a') == frozenset()
+    assert matcher.hits == 0
+    assert matcher.match(u'a/b') == {1}
+    assert matcher.hits == 1
+
+    matcher.remove(u'a/#', 1)
+    assert matcher.match(u'a') == frozenset()
+    assert matcher.match(u'a/b') == frozenset()
+    assert matcher.match(b'a/c') == {2}
+    assert matcher.match(u'b/c') == {2}
+    assert matcher.hits == 1
+    assert matcher.cache_len() == 5
+
+    # Adding an existing subscription changes nothing.
+    assert not matcher.add(u'+/c', 2)
+    assert matcher.match(u'b/c') == {2}
+    assert matcher.hits == 2
+
+
+def test_cache_buffer_topics():
+    """
+    Topics given as a bytearray or memoryview are cached as bytes.
+    """
+    matcher = CachingTopicMatcher()
+    matcher.add(u'a/+', 1)
+    assert matcher.match(bytearray(b'a/b')) == {1}
+    assert matcher.match(memoryview(b'a/b')) == {1}
+    assert matcher.match(b'a/b') == {1}
+    assert (matcher.hits, matcher.misses) == (2, 1)
@@ -11,6 +11,19 @@ from mqttpacket.v311 import (
     MQTTParseError,
     disconnect,
     MQTTInvalidPacketError,
+    PublishPacket,
+    SubackPacket,
+    ConnectPacket,
+    ConnectSpec,
+    PingreqPacket,
+    SubscribePacket,
+    SubscriptionSpec,
+    UnsubscribePacket,
+    connect,
+    pingreq,
+    publish,
+    subscribe,
+    unsubscribe,
 )
 
 def test_parse_publish_simple():
@@ -116,19 +129,14 @@ def capture_len():
     """
     rem_len = []
 
-    def _capture(data, remaining_length, _variable_begin):
+    def _capture(data, _offset, remaining_length, _variable_begin):
         rem_len.append(remaining_length)
         return len(data)
 
     old = _parsing.PARSERS[_constants.MQTT_PACKET_PUBLISH]
-    old_check = _parsing.check_total_len
     _parsing.PARSERS[_constants.MQTT_PACKET_PUBLISH] = _capture
-    def _fake_check(_w, _x, _y, _z):
-        return True
-    _parsing.check_total_len = _fake_check
     yield rem_len
     _parsing.PARSERS[_constants.MQTT_PACKET_PUBLISH] = old
-    _parsing.check_total_len = old_check
 
 
 def test_parse_single_byte_remaining_length(capture_len):
@@ -162,7 +170,7 @@ def test_parse_two_byte(capture_len):
     """
     data = bytearray()
     data.extend(
-        binascii.unhexlify(b'30ff7f1a')
+        binascii.unhexlify(b'30ff7f') + b'\x1a' * 16383
     )
     msgs = []
     _parsing.parse(data, msgs)
@@ -170,7 +178,7 @@ def test_parse_two_byte(capture_len):
 
     data = bytearray()
     data.extend(
-        binascii.unhexlify(b'3080011a')
+        binascii.unhexlify(b'308001') + b'\x1a' * 128
     )
     msgs = []
     _parsing.parse(data, msgs)
@@ -182,7 +190,7 @@ def test_parse_three_byte(capture_len):
     """
     data = bytearray()
     data.extend(
-        binascii.unhexlify(b'30ffff7f1a')
+        binascii.unhexlify(b'30ffff7f') + b'\x1a' * 2097151
     )
     msgs = []
     _parsing.parse(data, msgs)
@@ -194,11 +202,15 @@ def test_parse_four_byte(capture_len):
     """
     data = bytearray()
     data.extend(
-        binascii.unhexlify(b'30ffffff7f1a')
+        binascii.unhexlify(b'3080808001') + b'\x1a' * 2097152
     )
     msgs = []
     _parsing.parse(data, msgs)
-    assert capture_len[0] == 268435455
+    assert capture_len[0] == 2097152
+
+    # The largest remaining length waits for the rest of the packet.
+    data = bytearray(binascii.unhexlify(b'30ffffff7f1a'))
+    assert _parsing.parse(data, msgs) == 0
 
 
 def test_parse_five_byte(capture_len):
@@ -256,3 +268,482 @@ def test_parse_puback_invalid():
     msgs = []
     with pytest.raises(MQTTInvalidPacketError):
         _parsing.parse(data, msgs)
+
+
+def test_parse_multiple_packets():
+    """
+    Multiple packets received in a single read are all parsed.
+    """
+    data = bytearray()
+    data.extend(
+        binascii.unhexlify(
+            b'31150004746573747b2274657374223a2274657374227d'
+            b'40023039'
+            b'321700047465737400037b2274657374223a2274657374227d'
+        )
+    )
+    msgs = []
+    c = _parsing.parse(data, msgs)
+    assert c == len(data)
+    assert [m.pkt_type for m in msgs] == [
+        _constants.MQTT_PACKET_PUBLISH,
+        _constants.MQTT_PACKET_PUBACK,
+        _constants.MQTT_PACKET_PUBLISH,
+    ]
+    assert msgs[0].retain
+    assert msgs[0].packetid is None
+    assert msgs[1].packet_id == 12345
+    assert msgs[2].qos == 1
+    assert msgs[2].packetid == 3
+    assert not msgs[2].retain
+
+
+def test_parse_stops_at_partial_packet():
+    """
+    A complete packet followed by a partial packet consumes only the
+    complete packet.
+    """
+    first = binascii.unhexlify(b'40023039')
+    second = binascii.unhexlify(
+        b'31150004746573747b2274657374223a2274657374227d'
+    )
+    for partial_len in range(len(second)):
+        data = bytearray(first + second[:partial_len])
+        msgs = []
+        assert _parsing.parse(data, msgs) == len(first)
+        assert len(msgs) == 1
+        assert msgs[0].packet_id == 12345
+
+
+def test_parse_reserved_packet_type():
+    """
+    A packet with a reserved type raises an error.
+    """
+    with pytest.raises(MQTTInvalidPacketError):
+        _parsing.parse(bytearray(b'\xf0\x00'), [])
+
+
+def test_parse_publish_zero_copy():
+    """
+    A zero copy parse returns the payload as a view into the
+    parsed buffer.
+    """
+    data = bytearray(
+        binascii.unhexlify(
+            b'40023039'
+            b'321700047465737400037b2274657374223a2274657374227d'
+        )
+    )
+    msgs = []
+    c = _parsing.parse(data, msgs, zero_copy=True)
+    assert c == len(data)
+    payload = msgs[1].payload
+    assert isinstance(payload, memoryview)
+    assert json.loads(payload.tobytes().decode('utf-8')) == {"test": "test"}
+    assert msgs[1].topic == u'test'
+    assert msgs[1].packetid == 3
+
+    data[-2:-1] = b'!'
+    assert payload.tobytes()[-2:] == b'!}'
+
+    with pytest.raises(BufferError):
+        del data[:c]
+
+    del payload, msgs[:]
+    del data[:c]
+    assert not data
+
+
+def test_parse_publish_keyword_arguments():
+    """
+    Every backend's PUBLISH parser accepts its arguments by keyword.
+    """
+    data = bytearray(binascii.unhexlify(b'30050001616263'))
+    fields = _parsing.parse_publish(
+        data=data,
+        offset=0,
+        remaining_length=5,
+        variable_begin=2,
+        handler=lambda *args: args,
+    )
+    assert fields[:5] == (0, 0, 0, b'a', None)
+    assert bytes(fields[5]) == b'bc'
+
+
+def test_parse_publish_invalid_qos():
+    """
+    A PUBLISH with both QoS bits set is rejected.
+    """
+    data = bytearray(b'\x36\x07\x00\x01a\x00\x01hi')
+    for zero_copy in (False, True):
+        with pytest.raises(MQTTInvalidPacketError):
+            _parsing.parse(data, [], zero_copy=zero_copy)
+
+
+def test_parse_publish_topic_too_long():
+    """
+    A PUBLISH whose topic length exceeds the packet raises an error.
+    """
+    with pytest.raises(MQTTParseError):
+        _parsing.parse(bytearray(binascii.unhexlify(b'3004000574657374')), [])
+
+    with pytest.raises(MQTTParseError):
+        _parsing.parse(bytearray(binascii.unhexlify(b'320600047465737400')), [])
+
+    with pytest.raises(MQTTParseError):
+        _parsing.parse(bytearray(binascii.unhexlify(b'300100')), [])
+
+
+def test_parsed_packets_are_slotted():
+    """
+    Parsed packets have no instance dictionary and share their
+    packet type with their class.
+    """
+    data = bytearray(binascii.unhexlify(
+        b'20020000'
+        b'9003000100'
+        b'321700047465737400037b2274657374223a2274657374227d'
+        b'40023039'
+    ))
+    msgs = []
+    _parsing.parse(data, msgs)
+    assert len(msgs) == 4
+    for msg in msgs:
+        assert not hasattr(msg, '__dict__')
+        assert msg.pkt_type == type(msg).pkt_type
+
+
+def test_publish_packet_create():
+    """
+    A user built publish packet is validated.
+    """
+    packet = PublishPacket.create(False, 1, True, u'test', 3, b'foo')
+    assert packet == PublishPacket(0, 1, 1, b'test', 3, b'foo')
+    assert packet.topic == u'test'
+
+    with pytest.raises(ValueError):
+        PublishPacket.create(False, 3, False, u'test', 3, b'foo')
+
+    with pytest.raises(ValueError):
+        PublishPacket.create(False, 1, False, u'test', None, b'foo')
+
+    with pytest.raises(ValueError):
+        PublishPacket.create(True, 0, False, u'test', None, b'foo')
+
+    with pytest.raises(TypeError):
+        PublishPacket.create(False, 0, False, b'test', None, b'foo')
+
+    with pytest.raises(TypeError):
+        PublishPacket.create(False, 0, False, u'test', None, u'foo')
+
+
+def test_parse_qos2_and_unsuback():
+    """
+    PUBREC, PUBREL, PUBCOMP and UNSUBACK packets are parsed.
+    """
+    data = bytearray(binascii.unhexlify(
+        b'50023039'
+        b'62023039'
+        b'70023039'
+        b'b0020101'
+    ))
+    msgs = []
+    assert _parsing.parse(data, msgs) == len(data)
+    assert [m.pkt_type for m in msgs] == [
+        _constants.MQTT_PACKET_PUBREC,
+        _constants.MQTT_PACKET_PUBREL,
+        _constants.MQTT_PACKET_PUBCOMP,
+        _constants.MQTT_PACKET_UNSUBACK,
+    ]
+    assert [m.packet_id for m in msgs] == [12345, 12345, 12345, 257]
+
+
+def test_parse_packet_id_only_invalid():
+    """
+    Packets that only contain a packet id must have a remaining
+    length of 2, and PUBREL must have flags of 0010.
+    """
+    for packet in (b'500130', b'62013039', b'7003303900', b'b000'):
+        with pytest.raises(MQTTInvalidPacketError):
+            _parsing.parse(bytearray(binascii.unhexlify(packet)), [])
+
+    with pytest.raises(MQTTInvalidPacketError):
+        _parsing.parse(bytearray(binascii.unhexlify(b'60023039')), [])
+
+
+def test_parse_connect():
+    """
+    A CONNECT packet built by the client round trips.
+    """
+    cs = ConnectSpec(
+        username=u'user',
+        password=u'secret',
+        will_topic=u'will/topic',
+        will_message=u'gone',
+        will_qos=1,
+    )
+    data = bytearray(connect(u'client-1', 30, cs) + connect(u'client-2'))
+    msgs = []
+    assert _parsing.parse(data, msgs) == len(data)
+    assert msgs == [
+        ConnectPacket(
+            4, True, 30, u'client-1',
+            will_topic=u'will/topic',
+            will_message=b'gone',
+            will_qos=1,
+            username=u'user',
+            password=b'secret',
+        ),
+        ConnectPacket(4, True, 60, u'client-2'),
+    ]
+
+
+def test_parse_connect_invalid():
+    """
+    CONNECT packets with an invalid protocol name or flags are rejected.
+    """
+    packet = bytearray(connect(u'c'))
+    for index, value in ((5, ord('X')), (9, 0x03), (9, 0x0a), (9, 0x40)):
+        data = bytearray(packet)
+        data[index] = value
+        with pytest.raises(MQTTInvalidPacketError):
+            _parsing.parse(data, [])
+
+    # The client id runs past the end of the packet.
+    data = bytearray(packet)
+    data[1] -= 1
+    with pytest.raises(MQTTParseError):
+        _parsing.parse(data[:-1], [])
+
+    # The client id is not valid UTF-8.
+    data = bytearray(packet)
+    data[-1] = 0xff
+    with pytest.raises(MQTTInvalidPacketError):
+        _parsing.parse(data, [])
+
+
+def test_parse_subscribe():
+    """
+    A SUBSCRIBE packet round trips without decoding its topic filters.
+    """
+    data = bytearray(subscribe(10, [
+        SubscriptionSpec(u'a/b', 1),
+        SubscriptionSpec(u'c/\u00e9/#', 2),
+    ]))
+    msgs = []
+    assert _parsing.parse(data, msgs) == len(data)
+    packet = msgs[0]
+    assert isinstance(packet, SubscribePacket)
+    assert packet.packet_id == 10
+    assert [s.topicfilter_bytes for s in packet.subscriptions] == [
+        b'a/b', u'c/\u00e9/#'.encode('utf-8'),
+    ]
+    assert [s.qos for s in packet.subscriptions] == [1, 2]
+    assert [s.topicfilter for s in packet.subscriptions] == [
+        u'a/b', u'c/\u00e9/#',
+    ]
+
+
+def test_parse_subscribe_zero_copy():
+    """
+    Topic filters are copied even by a zero copy parse, so the parsed
+    buffer can be trimmed while the packets are kept.
+    """
+    data = bytearray(
+        subscribe(10, [SubscriptionSpec(u'a/b', 1)])
+        + unsubscribe(11, [u'c/+'])
+    )
+    msgs = []
+    c = _parsing.parse(data, msgs, zero_copy=True)
+    assert c == len(data)
+    del data[:c]
+
+    topicfilter = msgs[0].subscriptions[0].topicfilter_bytes
+    assert isinstance(topicfilter, bytes)
+    assert {topicfilter: 1}[b'a/b'] == 1
+    assert msgs[1].topicfilters_bytes == [b'c/+']
+    assert isinstance(msgs[1].topicfilters_bytes[0], bytes)
+
+
+def test_parse_subscribe_invalid():
+    """
+    SUBSCRIBE packets need flags of 0010, at least one subscription
+    and valid requested QoS.
+    """
+    for packet in (b'8008000a0003612f6201', b'8202000a', b'8208000a0003612f6203'):
+        with pytest.raises(MQTTInvalidPacketError):
+            _parsing.parse(bytearray(binascii.unhexlify(packet)), [])
+
+    for packet in (b'8207000a0003612f62', b'8207000a0009612f6201'):
+        with pytest.raises(MQTTParseError):
+            _parsing.parse(bytearray(binascii.unhexlify(packet)), [])
+
+
+def test_parse_unsubscribe():
+    """
+    An UNSUBSCRIBE packet round trips without decoding its topic filters.
+    """
+    data = bytearray(unsubscribe(7, [u'a/b', u'c/+']))
+    msgs = []
+    assert _parsing.parse(data, msgs) == len(data)
+    packet = msgs[0]
+    assert isinstance(packet, UnsubscribePacket)
+    assert packet.packet_id == 7
+    assert packet.topicfilters_bytes == [b'a/b', b'c/+']
+    assert packet.topicfilters == [u'a/b', u'c/+']
+
+    with pytest.raises(MQTTInvalidPacketError):
+        _parsing.parse(bytearray(binascii.unhexlify(b'a2020007')), [])
+
+
+def test_parse_pingreq():
+    """
+    A PINGREQ packet is parsed.
+    """
+    data = bytearray(pingreq())
+    msgs = []
+    assert _parsing.parse(data, msgs) == len(data)
+    assert msgs == [PingreqPacket()]
+
+
+def test_parse_publish_lazy_topic():
+    """
+    The topic of a parsed PUBLISH is kept as bytes and decoded
+    on first access.
+    """
+    topic = u'caf\u00e9/1'
+    data = bytearray(publish(topic, False, 0, False, b'x'))
+    msgs = []
+    _parsing.parse(data, msgs)
+    packet = msgs[0]
+    assert isinstance(packet.topic_bytes, bytes)
+    assert packet.topic_bytes == topic.encode('utf-8')
+    assert packet.topic == topic
+    assert packet.topic is packet.topic
+
+    data = bytearray(binascii.unhexlify(b'300400017878'))
+    data[4] = 0xff
+    msgs = []
+    _parsing.parse(data, msgs)
+    with pytest.raises(UnicodeDecodeError):
+        msgs[0].topic
+
+
+def test_scan_frames():
+    """
+    Frames are located without being parsed, stopping at an incomplete
+    frame.
+    """
+    publish_packet = publish(u'a/b', False, 1, True, b'x' * 200, 5)
+    data = bytearray(
+        publish_packet + disconnect() + pingreq() + publish_packet[:10]
+    )
+    end = len(publish_packet)
+    assert list(_parsing.scan_frames(data)) == [
+        (_constants.MQTT_PACKET_PUBLISH, 0x03, 0, end),
+        (_constants.MQTT_PACKET_DISCONNECT, 0, end, end + 2),
+        (_constants.MQTT_PACKET_PINGREQ, 0, end + 2, end + 4),
+    ]
+
+    # The body is not validated.
+    assert list(_parsing.scan_frames(bytearray(b'\x30\x01\xff'))) == [
+        (_constants.MQTT_PACKET_PUBLISH, 0, 0, 3),
+    ]
+
+    with pytest.raises(MQTTInvalidPacketError):
+        list(_parsing.scan_frames(bytearray(b'\xf0\x00')))
+
+    with pytest.raises(MQTTParseError):
+        list(_parsing.scan_frames(bytearray(b'\x30\xff\xff\xff\xff\x01')))
+
+
+def test_iter_frames():
+    """
+    Frames are found from a start offset, with the offset of the
+    variable header following a multi byte remaining length.
+    """
+    publish_packet = publish(u'a', False, 0, False, b'x' * 200)
+    data = bytearray(pingreq() + publish_packet + b'\x30\x80')
+    end = 2 + len(publish_packet)
+    assert list(_parsing.iter_frames(data, 2)) == [
+        (_constants.MQTT_PACKET_PUBLISH, 0, 2, 5, end),
+    ]
+
+    # Iteration stopped at the incomplete remaining length, and holds no
+    # buffer, so the rest of the packet can be appended.
+    frames = _parsing.iter_frames(data, end)
+    assert list(frames) == []
+    data.extend(b'\x01' + b'y' * 128)
+    assert list(_parsing.iter_frames(data, end)) == [
+        (_constants.MQTT_PACKET_PUBLISH, 0, end, end + 3, len(data)),
+    ]
+
+
+def test_callback_parser():
+    """
+    Registered handlers are called with the fields of each packet, and
+    packets without a handler are skipped.
+    """
+    data = bytearray(
+        publish(u'a/b', False, 1, True, b'payload', 5)
+        + binascii.unhexlify(b'40020005')
+        + binascii.unhexlify(b'20020000')
+        + pingreq()
+        + binascii.unhexlify(b'9003000a01')
+    )
+    calls = []
+    parser = _parsing.CallbackParser()
+    parser.register(
+        _constants.MQTT_PACKET_PUBLISH,
+        lambda *fields: calls.append(fields),
+    )
+    parser.register(
+        _constants.MQTT_PACKET_PUBACK,
+        lambda packet_id: calls.append(('puback', packet_id)),
+    )
+    parser.register(
+        _constants.MQTT_PACKET_PINGREQ,
+        lambda: calls.append('pingreq'),
+    )
+    parser.register(
+        _constants.MQTT_PACKET_SUBACK,
+        lambda *fields: calls.append(SubackPacket(*fields)),
+    )
+    assert parser.parse(data + b'\x30') == len(data)
+    assert calls == [
+        (0, 1, 1, b'a/b', 5, bytearray(b'payload')),
+        ('puback', 5),
+        'pingreq',
+        SubackPacket(10, [1]),
+    ]
+
+    del calls[:]
+    parser.unregister(_constants.MQTT_PACKET_PUBLISH)
+    assert parser.parse(data) == len(data)
+    assert len(calls) == 3
+
+    with pytest.raises(MQTTInvalidPacketError):
+        parser.parse(bytearray(b'\xf0\x00'))
+
+    with pytest.raises(ValueError):
+        parser.register(15, lambda: None)
+
+
+def test_callback_parser_custom_parser():
+    """
+    A parser can be replaced for a single instance.
+    """
+    def _raw(data, offset, remaining_length, variable_begin, handler):
+        handler(data[offset:variable_begin + remaining_length])
+
+    calls = []
+    parser = _parsing.CallbackParser()
+    parser.register(_constants.MQTT_PACKET_PUBLISH, calls.append, _raw)
+    packet = publish(u'a', False, 0, False, b'x')
+    data = bytearray(packet)
+    assert parser.parse(data, zero_copy=True) == len(packet)
+    assert isinstance(calls[0], memoryview)
+    assert calls[0].tobytes() == packet
+    assert _parsing.PARSERS[_constants.MQTT_PACKET_PUBLISH] is (
+        _parsing.parse_publish
+    )
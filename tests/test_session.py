@@ -0,0 +1,166 @@
+"""
+Copyright 2018 Jason Litzinger
+See LICENSE for details.
+"""
+import pytest
+
+import mqttpacket.v311 as mqttpacket
+
+
+def _parse(data):
+    msgs = []
+    mqttpacket.parse(bytearray(b''.join(data)), msgs)
+    return msgs
+
+
+def test_publish_qos0():
+    """
+    A QoS 0 message is sent without a packet id or tracking.
+    """
+    session = mqttpacket.Session()
+    assert session.publish(u'a', b'x') is None
+    assert session.data_to_send() == [
+        mqttpacket.publish(u'a', False, 0, False, b'x'),
+    ]
+    assert session.data_to_send() == []
+    assert len(session) == 0
+
+
+def test_publish_qos1():
+    """
+    A QoS 1 message is in flight until its PUBACK is received.
+    """
+    session = mqttpacket.Session()
+    packet_id = session.publish(u'a', b'x', qos=1)
+    assert session.data_to_send() == [
+        mqttpacket.publish(u'a', False, 1, False, b'x', packet_id),
+    ]
+    assert packet_id in session
+
+    puback, = _parse([mqttpacket.puback(packet_id)])
+    assert session.receive(puback) is puback
+    assert packet_id not in session
+    assert session.data_to_send() == []
+    # A duplicate acknowledgement is ignored.
+    assert session.receive(puback) is None
+
+
+def test_publish_qos2():
+    """
+    A QoS 2 message is released on PUBREC and completed on PUBCOMP.
+    """
+    session = mqttpacket.Session()
+    packet_id = session.publish(u'a', b'x', qos=2)
+    session.data_to_send()
+
+    pubcomp, = _parse([mqttpacket.pubcomp(packet_id)])
+    assert session.receive(pubcomp) is None
+
+    pubrec, = _parse([mqttpacket.pubrec(packet_id)])
+    assert session.receive(pubrec) is None
+    assert session.data_to_send() == [mqttpacket.pubrel(packet_id)]
+
+    assert session.receive(pubcomp) is pubcomp
+    assert len(session) == 0
+
+
+def test_receive_publish():
+    """
+    Received messages are acknowledged, and a QoS 2 message is
+    delivered once.
+    """
+    session = mqttpacket.Session()
+    qos0, qos1, qos2, dup, pubrel = _parse([
+        mqttpacket.publish(u'a', False, 0, False, b'0'),
+        mqttpacket.publish(u'a', False, 1, False, b'1', 7),
+        mqttpacket.publish(u'a', False, 2, False, b'2', 8),
+        mqttpacket.publish(u'a', True, 2, False, b'2', 8),
+        mqttpacket.pubrel(8),
+    ])
+    assert session.receive(qos0) is qos0
+    assert session.receive(qos1) is qos1
+    assert session.receive(qos2) is qos2
+    assert session.receive(dup) is None
+    assert session.receive(pubrel) is None
+    assert session.data_to_send() == [
+        mqttpacket.puback(7),
+        mqttpacket.pubrec(8),
+        mqttpacket.pubrec(8),
+        mqttpacket.pubcomp(8),
+    ]
+    # Once released the packet id may be used for a new message.
+    assert session.receive(qos2) is qos2
+
+
+def test_subscribe_unsubscribe():
+    """
+    SUBSCRIBE and UNSUBSCRIBE are in flight until acknowledged.
+    """
+    session = mqttpacket.Session()
+    sub_id = session.subscribe([mqttpacket.SubscriptionSpec(u'a/#', 1)])
+    unsub_id = session.unsubscribe([u'b'])
+    assert sub_id != unsub_id
+    assert len(session.data_to_send()) == 2
+
+    suback, unsuback = _parse([
+        mqttpacket.suback(sub_id, [1]),
+        mqttpacket.unsuback(unsub_id),
+    ])
+    assert session.receive(suback).return_codes == [1]
+    assert session.receive(unsuback) is unsuback
+    assert len(session) == 0
+
+
+def test_retransmit():
+    """
+    Unacknowledged PUBLISH packets are resent with DUP set, and PUBREL
+    packets are resent, in their original order.
+    """
+    session = mqttpacket.Session()
+    first = session.publish(u'a', b'1', qos=1)
+    second = session.publish(u'a', b'2', qos=2)
+    third = session.publish(u'a', b'3', qos=2)
+    session.subscribe([mqttpacket.SubscriptionSpec(u'a', 0)])
+    pubrec, = _parse([mqttpacket.pubrec(second)])
+    session.receive(pubrec)
+    session.data_to_send()
+
+    session.retransmit()
+    data = session.data_to_send()
+    assert b''.join(bytes(bytearray(d)) for d in data) == b''.join([
+        mqttpacket.publish(u'a', True, 1, False, b'1', first),
+        mqttpacket.pubrel(second),
+        mqttpacket.publish(u'a', True, 2, False, b'3', third),
+    ])
+    assert len(data) == 5
+
+
+def test_packet_ids_exhausted():
+    """
+    Every packet id can be in flight, and released ids are reused.
+    """
+    session = mqttpacket.Session()
+    packet_ids = [
+        session.publish(u'a', b'', qos=1)
+        for _ in range(65535)
+    ]
+    assert sorted(packet_ids) == list(range(1, 65536))
+    with pytest.raises(ValueError):
+        session.publish(u'a', b'', qos=1)
+    with pytest.raises(ValueError):
+        session.subscribe([mqttpacket.SubscriptionSpec(u'a', 0)])
+
+    puback, = _parse([mqttpacket.puback(30000)])
+    session.receive(puback)
+    assert session.subscribe([mqttpacket.SubscriptionSpec(u'a', 0)]) == 30000
+
+
+def test_failed_build_releases_packet_id():
+    """
+    A packet id is not leaked when the packet cannot be built.
+    """
+    session = mqttpacket.Session()
+    with pytest.raises(ValueError):
+        session.unsubscribe([])
+    assert len(session) == 0
+    assert session.publish(u'a', b'', qos=1) == 1
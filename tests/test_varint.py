@@ -0,0 +1,69 @@
+"""
+Copyright 2018 Jason Litzinger
+See LICENSE for details.
+"""
+import pytest
+
+from mqttpacket.v311 import _varint, MQTTParseError
+
+_BOUNDARIES = [
+    0, 1, 127, 128, 129, 16383, 16384, 2097151, 2097152, 268435455,
+]
+
+
+def test_encode_decode_roundtrip():
+    """
+    Every encoded length decodes to itself and has the expected size.
+    """
+    for length in _BOUNDARIES:
+        encoded = _varint.encode_remaining_length(length)
+        assert len(encoded) == _varint.remaining_length_size(length)
+        data = bytearray(b'\x30' + encoded + b'\x00')
+        decoded, variable_begin = _varint.decode_remaining_length(
+            data, 1, len(data)
+        )
+        assert decoded == length
+        assert variable_begin == 1 + len(encoded)
+
+
+def test_encode_into():
+    """
+    A length written into a buffer matches the encoded length.
+    """
+    for length in _BOUNDARIES:
+        buf = bytearray(6)
+        end = _varint.encode_remaining_length_into(buf, 1, length)
+        encoded = _varint.encode_remaining_length(length)
+        assert end == 1 + len(encoded)
+        assert buf[1:end] == encoded
+
+
+def test_encode_out_of_range():
+    """
+    Lengths that cannot be encoded raise an error.
+    """
+    for length in (-1, 268435456):
+        with pytest.raises(ValueError):
+            _varint.encode_remaining_length(length)
+        with pytest.raises(ValueError):
+            _varint.encode_remaining_length_into(bytearray(6), 0, length)
+        with pytest.raises(ValueError):
+            _varint.remaining_length_size(length)
+
+
+def test_decode_incomplete():
+    """
+    A length cut short by the end of the data is incomplete.
+    """
+    data = bytearray(b'\xff\xff\x7f')
+    for end in range(3):
+        assert _varint.decode_remaining_length(data, 0, end) == (-1, 0)
+
+
+def test_decode_too_long():
+    """
+    A length with more than four bytes raises an error.
+    """
+    data = bytearray(b'\xff\xff\xff\xff\x7f')
+    with pytest.raises(MQTTParseError):
+        _varint.decode_remaining_length(data, 0, len(data))